@@ -0,0 +1,90 @@
+"""
+业务中台 HTTP 客户端：MCP 工具调用 Spring Boot REST API 的共享连接池
+- 单个 httpx.AsyncClient 复用 keep-alive 连接，连接数/超时可配置
+- 幂等请求（GET，或显式标记为只读的 POST）遇到网络错误、429/5xx 时按指数退避 + 随机抖动重试
+- 幂等请求按 (method, path, params, body) 合并：相同请求在途时后来者直接等待同一结果
+注意：httpx.AsyncClient 与 event loop 绑定，每个 loop 需各自持有一个实例
+"""
+import json
+import random
+import asyncio
+
+import httpx
+
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class BackendClient:
+
+    def __init__(self, base_url: str, max_connections: int = 20, max_keepalive: int = 10,
+                 timeout: float = 30.0, connect_timeout: float = 5.0, retries: int = 2, backoff: float = 0.2):
+        self.base_url = base_url.rstrip("/")
+        self.retries = retries
+        self.backoff = backoff
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+        )
+        self._inflight = {}
+        self.counters = {"requests": 0, "backend_calls": 0, "coalesced": 0, "retries": 0, "errors": 0}
+
+    @staticmethod
+    def _key(method, path, params, json_data):
+        return method, path, json.dumps(params or {}, sort_keys=True, ensure_ascii=False), \
+            json.dumps(json_data, sort_keys=True, ensure_ascii=False)
+
+    async def request(self, path: str, method: str = "POST", params: dict = None, json_data: dict = None,
+                      idempotent: bool = None) -> dict:
+        """
+        返回响应 JSON（dict）；失败时返回 {"error": ..., "code": ...}，与原先的调用约定一致。
+        idempotent 为 None 时仅 GET 视为幂等；合并请求的调用方共享同一个返回对象，不应修改它。
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method == "GET"
+        self.counters["requests"] += 1
+        if not idempotent:
+            return await self._send(path, method, params, json_data, retry=False)
+        key = self._key(method, path, params, json_data)
+        task = self._inflight.get(key)
+        if task is not None:
+            self.counters["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(self._send(path, method, params, json_data, retry=True))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield：单个调用方被取消（如工具超时）不影响共享同一请求的其他调用方
+        return await asyncio.shield(task)
+
+    async def _send(self, path, method, params, json_data, retry: bool) -> dict:
+        url = f"{self.base_url}{path}"
+        attempts = self.retries + 1 if retry else 1
+        for attempt in range(attempts):
+            self.counters["backend_calls"] += 1
+            try:
+                if method == "POST":
+                    resp = await self.client.post(url, params=params or {}, json=json_data)
+                else:
+                    resp = await self.client.get(url, params=params or {})
+                if resp.status_code in _RETRY_STATUS and attempt < attempts - 1:
+                    raise httpx.HTTPStatusError(f"retryable status {resp.status_code}",
+                                                request=resp.request, response=resp)
+                resp.raise_for_status()
+                return resp.json() if resp.content else {}
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                retryable = isinstance(e, httpx.TransportError) or e.response.status_code in _RETRY_STATUS
+                if not retryable or attempt == attempts - 1:
+                    self.counters["errors"] += 1
+                    return {"error": str(e), "code": getattr(e, "response", None) and getattr(e.response, "status_code", 500)}
+                self.counters["retries"] += 1
+                # full jitter：[0, backoff * 2^attempt)
+                await asyncio.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+            except httpx.HTTPError as e:
+                self.counters["errors"] += 1
+                return {"error": str(e), "code": getattr(e, "response", None) and getattr(e.response, "status_code", 500)}
+
+    def stats(self) -> dict:
+        return dict(self.counters, inflight=len(self._inflight))
+
+    async def aclose(self):
+        await self.client.aclose()
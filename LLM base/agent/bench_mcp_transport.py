@@ -0,0 +1,97 @@
+"""
+MCP 传输微基准：对比 stdio 与 inprocess 两种传输下单次工具调用的开销
+默认调用 get_rag_patent_info_batch(patent_nos=[])，该调用不访问后端/RAG 立即返回，耗时即协议与传输开销
+
+用法：
+    python agent/bench_mcp_transport.py --calls 500
+    python agent/bench_mcp_transport.py --tool get_identification --args '{"user_id": "111000"}'
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+
+# 确保项目根在 path 中
+_root = Path(__file__).resolve().parents[1]
+if str(_root) not in sys.path:
+    sys.path.insert(0, str(_root))
+
+# 基准期间不做 RAG 预热，避免后台加载模型干扰计时（须在导入 config 之前设置）
+os.environ.setdefault("RAG_WARMUP", "false")
+
+from agent.ib_agent import IBAgent
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def bench_transport(transport, script, tool, tool_args, calls, warmup):
+    agent = IBAgent(user_id="bench")
+    try:
+        start = time.perf_counter()
+        await agent.connect_to_server(script, transport=transport)
+        connect_ms = (time.perf_counter() - start) * 1000
+
+        for _ in range(warmup):
+            await agent.session.call_tool(tool, tool_args)
+
+        latencies = []
+        for _ in range(calls):
+            t0 = time.perf_counter()
+            await agent.session.call_tool(tool, tool_args)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+        list_tools = []
+        for _ in range(min(calls, 100)):
+            t0 = time.perf_counter()
+            await agent.session.list_tools()
+            list_tools.append((time.perf_counter() - t0) * 1000)
+
+        # 并发吞吐：calls 个调用同时在途
+        t0 = time.perf_counter()
+        await asyncio.gather(*(agent.session.call_tool(tool, tool_args) for _ in range(calls)))
+        batch_s = time.perf_counter() - t0
+        return {
+            "transport": transport,
+            "connect_ms": round(connect_ms, 1),
+            "call_mean_ms": round(statistics.mean(latencies), 3),
+            "call_p50_ms": round(_percentile(latencies, 0.5), 3),
+            "call_p95_ms": round(_percentile(latencies, 0.95), 3),
+            "list_tools_mean_ms": round(statistics.mean(list_tools), 3),
+            "concurrent_calls_per_s": round(calls / batch_s, 1),
+        }
+    finally:
+        await agent.cleanup()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="对比 stdio / inprocess MCP 传输的单次调用开销")
+    parser.add_argument("--script", default=str(_root / "agent" / "mcp_server.py"))
+    parser.add_argument("--tool", default="get_rag_patent_info_batch")
+    parser.add_argument("--args", default='{"patent_nos": []}', help="工具参数（JSON）")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--transports", default="stdio,inprocess")
+    args = parser.parse_args()
+
+    tool_args = json.loads(args.args)
+    results = []
+    for transport in args.transports.split(","):
+        results.append(await bench_transport(transport.strip(), args.script, args.tool, tool_args,
+                                             args.calls, args.warmup))
+
+    print(f"\n工具: {args.tool}  参数: {args.args}  调用次数: {args.calls}")
+    keys = [k for k in results[0] if k != "transport"]
+    print("指标".ljust(24) + "".join(r["transport"].rjust(14) for r in results))
+    for k in keys:
+        print(k.ljust(24) + "".join(str(r[k]).rjust(14) for r in results))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,24 +1,91 @@
 import asyncio
+import importlib.util
+import json
+import logging
+import os
 import sys
-from typing import Optional
+import threading
+import time
+from typing import Awaitable, Callable, Optional
 from contextlib import AsyncExitStack
 
+import httpx
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
+from mcp.shared.memory import create_connected_server_and_client_session
 
 ## OpenAI 的包
-from openai import OpenAI
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 from agent.memory import memory_store
+from agent.tool_catalog import ToolCatalog, is_tool_list_changed
+from agent.router import get_intent_router, CHITCHAT, SINGLE_TOOL
+from agent.prompt_builder import PromptBuilder, COT_INSTRUCTION, REACT_INSTRUCTION
+from agent.llm_limiter import InflightLimiter
 
 load_dotenv()  # load environment variables from .env
 
+# 每次请求的耗时/路由等明细走 debug 日志，不占用标准输出
+logger = logging.getLogger(__name__)
+
 try:
-    from config import QWEN_API_KEY, QWEN_API_BASE
+    from config import QWEN_API_KEY, QWEN_API_BASE, LLM_MAX_CONNECTIONS, LLM_TIMEOUT, LLM_MAX_INFLIGHT, MCP_TRANSPORT, \
+        TOOL_CALL_TIMEOUT, TOOL_TIMEOUTS, AGENT_ROUTER, AGENT_ROUTER_THRESHOLD, AGENT_ROUTER_MARGIN, \
+        PROMPT_TOKEN_BUDGET
 except ImportError:
-    import os
     QWEN_API_KEY = os.getenv("QWEN_API_KEY", "sk-b9dc7ac8811d4a10b9ee1f084005053c")
     QWEN_API_BASE = os.getenv("QWEN_API_BASE", "https://dashscope.aliyuncs.com/compatible-mode/v1")
+    LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+    LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "8"))
+    MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "auto").lower()
+    TOOL_CALL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", "20"))
+    TOOL_TIMEOUTS = json.loads(os.getenv("TOOL_TIMEOUTS", "{}"))
+    AGENT_ROUTER = os.getenv("AGENT_ROUTER", "true").lower() == "true"
+    AGENT_ROUTER_THRESHOLD = float(os.getenv("AGENT_ROUTER_THRESHOLD", "0.6"))
+    AGENT_ROUTER_MARGIN = float(os.getenv("AGENT_ROUTER_MARGIN", "0.05"))
+    PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+
+
+def create_llm_client() -> AsyncOpenAI:
+    """Qwen (OpenAI-compatible) 异步客户端，底层 httpx 连接池复用 keep-alive 连接"""
+    return AsyncOpenAI(
+        api_key=QWEN_API_KEY or "put-your-qwen-api-key-here",
+        base_url=QWEN_API_BASE,
+        timeout=LLM_TIMEOUT,
+        http_client=httpx.AsyncClient(
+            timeout=LLM_TIMEOUT,
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                                max_keepalive_connections=LLM_MAX_CONNECTIONS),
+        ),
+    )
+
+
+# 所有 IBAgent 共享：LLM_MAX_INFLIGHT 是整个进程的在途 completion 上限，与 Agent 池大小无关
+llm_slots = InflightLimiter(LLM_MAX_INFLIGHT)
+
+_inprocess_servers = {}
+_inprocess_lock = threading.Lock()
+
+
+def load_inprocess_server(server_script_path: str):
+    """
+    在当前进程加载 MCP Server 脚本，返回其 FastMCP 实例（模块级变量 mcp）。
+    同一脚本只加载一次：池中所有 Agent 共享同一份工具定义与 RAG 引擎。
+    """
+    path = os.path.abspath(server_script_path)
+    with _inprocess_lock:
+        server = _inprocess_servers.get(path)
+        if server is None:
+            name = f"_mcp_inprocess_{os.path.splitext(os.path.basename(path))[0]}"
+            spec = importlib.util.spec_from_file_location(name, path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[name] = module
+            spec.loader.exec_module(module)
+            if hasattr(module, "warm_up"):
+                module.warm_up()
+            server = _inprocess_servers[path] = module.mcp
+    return server
 
 
 class IBAgent:
@@ -29,177 +96,372 @@ class IBAgent:
         self.user_id = user_id
         self.session_id = f"session_{user_id}"
         self.mcp_session = None
+        # 工具目录缓存：连接时拉取，收到 tools/list_changed 通知或重连时刷新
+        self.tool_catalog = ToolCatalog()
+        # 意图路由（进程内共享，复用记忆模块的 embedding 模型）
+        self.router = get_intent_router(memory_store.embed, threshold=AGENT_ROUTER_THRESHOLD,
+                                        margin=AGENT_ROUTER_MARGIN) if AGENT_ROUTER else None
+        # Prompt 组装：CoT/ReAct 共用稳定前缀，按预算裁剪并统计前缀复用
+        self.prompt_builder = PromptBuilder(budget=PROMPT_TOKEN_BUDGET)
 
-        # 替换为 Qwen (OpenAI-compatible) client，从 .env/config 读取
-        self.llm = OpenAI(
-            api_key=QWEN_API_KEY or "put-your-qwen-api-key-here",
-            base_url=QWEN_API_BASE
-        )
+        # Qwen (OpenAI-compatible) 异步客户端，从 .env/config 读取；
+        # completion 不再阻塞 event loop，同时在途数量由进程级的 llm_slots 限制
+        self.llm = create_llm_client()
+        self._llm_slots = llm_slots
 
-    async def connect_to_server(self, server_script_path: str):
-        """Connect to an MCP server"""
+    async def _chat_completion(self, **kwargs):
+        """受并发上限约束的异步 chat completion"""
+        async with self._llm_slots:
+            return await self.llm.chat.completions.create(**kwargs)
+
+    async def _complete_text(self, emit: Optional[Callable[[dict], Awaitable[None]]], stage: str, **kwargs) -> str:
+        """
+        返回 completion 文本。传入 emit 时以 stream 方式请求，每个 token 作为
+        {"type": "token", "stage": stage} 事件推送；emit 阻塞时（消费者慢）读取流也随之暂停。
+        """
+        content, _ = await self._complete_message(emit, stage, **kwargs)
+        return content
+
+    async def _complete_message(self, emit: Optional[Callable[[dict], Awaitable[None]]], stage: str, **kwargs):
+        """
+        返回 (文本, tool_calls)。tool_calls 为 OpenAI 格式的 dict 列表：
+        {"id", "type": "function", "function": {"name", "arguments"}}；
+        stream 模式下按 index 累积各 tool_call 的增量片段（id/name 首包给出，arguments 分片拼接）。
+        """
+        if emit is None:
+            response = await self._chat_completion(**kwargs)
+            message = response.choices[0].message
+            tool_calls = [
+                {"id": tc.id, "type": "function",
+                 "function": {"name": tc.function.name, "arguments": tc.function.arguments or ""}}
+                for tc in (message.tool_calls or [])
+            ]
+            return message.content or "", tool_calls
+        parts = []
+        calls = {}
+        async with self._llm_slots:
+            stream = await self.llm.chat.completions.create(stream=True, **kwargs)
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    parts.append(delta.content)
+                    await emit({"type": "token", "stage": stage, "content": delta.content})
+                for tc in delta.tool_calls or []:
+                    call = calls.setdefault(tc.index, {"id": "", "type": "function",
+                                                       "function": {"name": "", "arguments": ""}})
+                    if tc.id:
+                        call["id"] = tc.id
+                    if tc.function is not None:
+                        if tc.function.name:
+                            call["function"]["name"] += tc.function.name
+                        if tc.function.arguments:
+                            call["function"]["arguments"] += tc.function.arguments
+        return "".join(parts), [calls[i] for i in sorted(calls)]
+
+    async def connect_to_server(self, server_script_path: str, transport: str = None):
+        """
+        Connect to an MCP server
+        transport: stdio（子进程 + JSON-RPC over stdio）| inprocess（内存流直连同进程内的 FastMCP，
+        工具 schema 与 stdio 完全一致）；默认取 MCP_TRANSPORT，auto 时单个 Agent 用 stdio（池化见 AgentRuntime）
+        """
         is_python = server_script_path.endswith('.py')
         is_js = server_script_path.endswith('.js')
         if not (is_python or is_js):
             raise ValueError("Server script must be a .py or .js file")
 
-        command = "python" if is_python else "node"
-        server_params = StdioServerParameters(
-            command=command,
-            args=[server_script_path],
-            env=None
-        )
+        transport = (transport or MCP_TRANSPORT).lower()
+        if transport == "auto":
+            transport = "stdio"
+        if transport == "inprocess":
+            if not is_python:
+                raise ValueError("inprocess transport requires a Python server script")
+            # 加载会导入 RAG 依赖，放到线程里避免阻塞 event loop
+            server = await asyncio.to_thread(load_inprocess_server, server_script_path)
+            # mcp.shared.memory 与 FastMCP._mcp_server 不属于稳定公开 API：
+            # env/requirements.txt 将 mcp 锁定在 1.x、fastmcp 锁定在 2.x，升级大版本前需重新验证
+            self.session = await self.exit_stack.enter_async_context(
+                create_connected_server_and_client_session(server._mcp_server,
+                                                           message_handler=self._handle_server_message)
+            )
+        else:
+            command = "python" if is_python else "node"
+            # 子进程继承当前环境变量：MCP Server 的配置（后端地址、缓存 TTL 等）均从环境变量读取
+            server_params = StdioServerParameters(
+                command=command,
+                args=[server_script_path],
+                env=dict(os.environ)
+            )
 
-        stdio_transport = await self.exit_stack.enter_async_context(
-            stdio_client(server_params)
-        )
-        self.stdio, self.write = stdio_transport
-        self.session = await self.exit_stack.enter_async_context(
-            ClientSession(self.stdio, self.write)
-        )
+            stdio_transport = await self.exit_stack.enter_async_context(
+                stdio_client(server_params)
+            )
+            self.stdio, self.write = stdio_transport
+            self.session = await self.exit_stack.enter_async_context(
+                ClientSession(self.stdio, self.write, message_handler=self._handle_server_message)
+            )
+
+            await self.session.initialize()
 
-        await self.session.initialize()
+        # 拉取工具目录并预生成 tools 载荷（重连时同样走这里刷新）
+        await self.tool_catalog.refresh(self.session)
+        print("\nConnected to server with tools:", [tool.name for tool in self.tool_catalog.tools],
+              f"(catalog v{self.tool_catalog.version})")
 
-        # List available tools
-        response = await self.session.list_tools()
-        tools = response.tools
-        print("\nConnected to server with tools:", [tool.name for tool in tools])
+    async def _handle_server_message(self, message):
+        """MCP 服务端推送：工具列表变更时标记目录过期，下一轮对话前刷新"""
+        if is_tool_list_changed(message):
+            print("MCP tool list changed, catalog marked stale", file=sys.stderr)
+            self.tool_catalog.mark_stale()
 
-    async def cot_plan_and_reason(self, query: str, history, profile, available_tools):
+    async def get_rag_status(self) -> dict:
+        """读取 MCP Server 暴露的 RAG 引擎就绪状态（status://rag 资源）"""
+        result = await self.session.read_resource("status://rag")
+        return json.loads(result.contents[0].text)
+
+    async def get_tool_cache_status(self) -> dict:
+        """读取 MCP Server 的工具读穿缓存统计（status://tool_cache 资源）"""
+        result = await self.session.read_resource("status://tool_cache")
+        return json.loads(result.contents[0].text)
+
+    async def invalidate_tool_cache(self, patent_no: str = "", tool: str = "") -> int:
+        """失效 MCP Server 的工具缓存（内部管理工具，不经过 LLM）；返回删除的条目数"""
+        result = await self.session.call_tool("admin_invalidate_tool_cache", {"patent_no": patent_no, "tool": tool})
+        return int(result.content[0].text) if result.content and not result.isError else 0
+
+    def _fit_prompt(self, prompt, user_id: str, stage: str, available_tools) -> dict:
+        """调用 LLM 前按预算裁剪 prompt，并打印本次调用的体积与前缀复用情况"""
+        catalog = self.tool_catalog if available_tools else None
+        report = self.prompt_builder.fit(
+            prompt, f"session_{user_id or self.user_id}", stage,
+            tools_fingerprint=catalog.fingerprint if catalog else "",
+            tools_tokens=catalog.payload_tokens if catalog else 0,
+        )
+        logger.debug("Prompt: %s", report)
+        return report
+
+    async def cot_plan_and_reason(self, query: str, history, profile, available_tools, emit=None,
+                                  notes=(), user_context: str = "", user_id: str = None):
         """
         Chain-of-Thought（CoT）推理与规划：
         1. 先让LLM输出思考链和行动计划（如任务分解、工具选择、推理步骤）。
         2. 再按计划逐步执行，每步可调用工具或继续LLM。
+        与 ReAct 共用同一前缀（tools + 共享 system + 历史），tools 仅供规划参考（tool_choice=none）
         """
         # 1. 让LLM输出思考链和行动计划
-        cot_prompt = (
-            "你是一个智能Agent，请根据用户问题，结合历史对话和用户画像，"
-            "先输出详细的思考链（Chain-of-Thought），再给出行动计划（如需要哪些工具/步骤/推理）。"
-            "最后用JSON格式输出：{\"thoughts\":..., \"plan\":...}"
-        )
-        cot_messages = [
-            {"role": "system", "content": cot_prompt},
-        ]
-        for _, role, text in history:
-            r = "assistant" if role == "agent" else role  # API 仅接受 assistant 而非 agent
-            if r in ("system", "assistant", "user"):
-                cot_messages.append({"role": r, "content": text})
-        cot_messages.append({"role": "user", "content": query})
-        cot_response = self.llm.chat.completions.create(
+        prompt = self.prompt_builder.build(query, history, COT_INSTRUCTION, profile=profile,
+                                           user_context=user_context, notes=notes)
+        self._fit_prompt(prompt, user_id, "cot", available_tools)
+        tool_kwargs = {"tools": available_tools, "tool_choice": "none"} if available_tools else {}
+        cot_content = await self._complete_text(
+            emit, "cot",
             model="qwen-plus",
-            messages=cot_messages,
-            max_tokens=800
+            messages=prompt.messages,
+            max_tokens=800,
+            **tool_kwargs
         )
-        import json
         try:
-            cot_json = json.loads(cot_response.choices[0].message.content)
+            cot_json = json.loads(cot_content)
             thoughts = cot_json.get("thoughts", "")
             plan = cot_json.get("plan", "")
         except Exception:
-            thoughts = cot_response.choices[0].message.content
+            thoughts = cot_content
             plan = ""
+        if emit is not None:
+            await emit({"type": "thought", "stage": "cot", "content": str(thoughts)})
+            await emit({"type": "plan", "stage": "cot", "content": str(plan)})
         # 2. 可选：根据plan自动执行工具/多轮推理（这里只做演示，实际可按plan分步执行）
         return thoughts, plan
 
-    async def react_reasoning(self, query: str, history, profile, available_tools):
+    async def _run_tool_call(self, call: dict, emit=None) -> dict:
+        """执行单个 tool_call（带按工具配置的超时），返回对应的 tool 消息"""
+        name = call["function"]["name"]
+        try:
+            args = json.loads(call["function"]["arguments"] or "{}")
+        except json.JSONDecodeError as e:
+            args, error = None, f"工具参数不是合法 JSON: {e}"
+        else:
+            error = None if name in self.tool_catalog.names else f"未知工具: {name}"
+        if emit is not None:
+            await emit({"type": "tool_call", "stage": "react",
+                        "content": json.dumps({"name": name, "arguments": args}, ensure_ascii=False)})
+        start = time.perf_counter()
+        if error is None:
+            timeout = TOOL_TIMEOUTS.get(name, TOOL_CALL_TIMEOUT)
+            try:
+                result = await asyncio.wait_for(self.session.call_tool(name, args), timeout=timeout)
+                text = "\n".join(getattr(c, "text", str(c)) for c in result.content)
+                obs = f"工具 {name} 返回错误: {text}" if result.isError else text
+            except asyncio.TimeoutError:
+                obs = f"工具 {name} 调用超时（{timeout}s）"
+            except Exception as e:
+                obs = f"工具 {name} 调用异常: {e}"
+        else:
+            obs = error
+        logger.debug("Tool call: %s %.1fms", name, (time.perf_counter() - start) * 1000)
+        if emit is not None:
+            await emit({"type": "observation", "stage": "react", "content": f"Observation: {obs}"})
+        return {"role": "tool", "tool_call_id": call["id"], "content": obs}
+
+    async def react_reasoning(self, query: str, history, profile, available_tools, emit=None,
+                              notes=(), user_context: str = "", plan: str = "", user_id: str = None):
         """
-        ReAct（Reason+Act）推理：
-        1. 让LLM以“思考-行动-观察”格式输出推理和行动。
-        2. 自动解析并执行行动（如工具调用），再将观察结果反馈给LLM，循环多轮。
+        ReAct（Reason+Act）推理，基于原生 function calling：
+        1. LLM 思考后直接返回结构化 tool_calls（同一轮可包含多个相互独立的调用）。
+        2. 同一轮的工具调用用 asyncio.gather 并发执行，结果以 tool 消息反馈给 LLM，循环多轮；
+           最后一轮禁止再调用工具，保证得到最终回答。
+        返回 (推理链, 最终回答)：最终回答为最后一轮 LLM 输出的文本
+        每一步调用前按预算裁剪（先删最早的历史，再省略较早步骤的工具结果）
         """
-        react_prompt = (
-            "你是一个智能Agent，请用如下格式进行推理和行动：\n"
-            "Thought: ...\nAction: <工具名>(参数)\nObservation: ...\n"
-            "每轮先思考(Thought)，再决定是否调用工具(Action)，然后根据Observation继续推理，直到完成任务。"
-        )
-        messages = [
-            {"role": "system", "content": react_prompt},
-        ]
-        for _, role, text in history:
-            r = "assistant" if role == "agent" else role  # API 仅接受 assistant 而非 agent
-            if r in ("system", "assistant", "user"):
-                messages.append({"role": r, "content": text})
-        messages.append({"role": "user", "content": query})
+        instruction = REACT_INSTRUCTION + (f"\n请根据以下行动计划逐步完成任务：{plan}" if plan else "")
+        prompt = self.prompt_builder.build(query, history, instruction, profile=profile,
+                                           user_context=user_context, notes=notes)
+        messages = prompt.messages
+        trace = []
+        final = ""
         max_steps = 3
         for step in range(max_steps):
-            llm_response = self.llm.chat.completions.create(
+            last_step = step == max_steps - 1
+            # 无可用工具（如寒暄快路径）时不携带 tools 参数
+            tool_kwargs = {
+                "tools": available_tools,
+                "tool_choice": "none" if last_step else "auto",
+                "parallel_tool_calls": True,
+            } if available_tools else {}
+            self._fit_prompt(prompt, user_id, f"react_{step + 1}", available_tools)
+            content, tool_calls = await self._complete_message(
+                emit, "react",
                 model="qwen-plus",
                 messages=messages,
-                tools=available_tools,
-                tool_choice="auto",
-                max_tokens=800
+                max_tokens=800,
+                **tool_kwargs
             )
-            content = llm_response.choices[0].message.content
-            messages.append({"role": "assistant", "content": content})
-            # 简单解析Action
-            import re
-            action_match = re.search(r"Action: (\w+)\\((.*?)\\)", content)
-            if action_match:
-                tool_name = action_match.group(1)
-                tool_args = action_match.group(2)
-                try:
-                    import ast
-                    tool_args_dict = ast.literal_eval(tool_args) if tool_args else {}
-                except Exception:
-                    tool_args_dict = {}
-                result = await self.session.call_tool(tool_name, tool_args_dict)
-                obs = f"Observation: {result.content}"
-                messages.append({"role": "user", "content": obs})
-            else:
-                break  # 没有Action则结束
-        # 返回最终推理链
-        return '\n'.join([m['content'] for m in messages if m['role'] == 'assistant'])
+            if content:
+                trace.append(content)
+            final = content
+            assistant_msg = {"role": "assistant", "content": content}
+            if tool_calls and not last_step:
+                assistant_msg["tool_calls"] = tool_calls
+            messages.append(assistant_msg)
+            if not tool_calls or last_step:
+                break  # 没有工具调用则结束
+            trace.extend(f"Action: {c['function']['name']}({c['function']['arguments']})" for c in tool_calls)
+            start = time.perf_counter()
+            results = await asyncio.gather(*(self._run_tool_call(c, emit=emit) for c in tool_calls))
+            logger.debug("ReAct step %d: %d tool calls in %.1fms", step + 1, len(tool_calls),
+                         (time.perf_counter() - start) * 1000)
+            messages.extend(results)
+        # 返回最终推理链与最终回答
+        return '\n'.join(trace), final
 
-    async def process_query(self, query: str, mode: str = "cot+react", user_id: str = None) -> str:
+    async def process_query(self, query: str, mode: str = "cot+react", user_id: str = None, emit=None) -> str:
+        """
+        处理一轮对话，返回完整回答。
+        emit: 可选的异步回调，按产生顺序接收 token / thought / plan / tool_call / observation / final 事件
+        """
         uid = user_id or self.user_id
         session_id = f"session_{uid}"
         # 1. 记录用户输入到短期记忆
-        memory_store.add_short_term(session_id, 'user', query)
-        # 2. 通过标准化 API 获取分层记忆上下文
-        ctx = memory_store.get_context_for_agent(uid, session_id, query, short_term_limit=10, long_term_top_k=3)
+        await asyncio.to_thread(memory_store.add_short_term, session_id, 'user', query)
+        # 2. 通过标准化 API 获取分层记忆上下文（阻塞的存储访问放到线程中，不占用 event loop）
+        ctx = await asyncio.to_thread(
+            memory_store.get_context_for_agent, uid, session_id, query, short_term_limit=10, long_term_top_k=3
+        )
+        logger.debug("Memory context: %s", ctx["timings"])
         history = ctx["history"]
         profile = ctx["profile"]
         relevant_memories = ctx["relevant_long_term"]
-        # 3. 将长期记忆拼接到 prompt
-        if relevant_memories:
-            history = list(history)  # 副本，避免污染
-            history.append((None, "system", f"长期记忆召回：{relevant_memories}"))
-        # 注入当前 user_id，供 LLM 调用工具时使用（如 get_identification(user_id)）
-        history = list(history)
-        history.append((None, "system", f"【会话上下文】当前用户 user_id={uid}，调用需要 user_id 的工具时请使用此值。"))
-        # 4. 获取可用工具
-        response = await self.session.list_tools()
-        available_tools = [
-            {
-                "type": "function",
-                "function": {
-                    "name": tool.name,
-                    "description": tool.description,
-                    "parameters": tool.inputSchema
-                }
-            }
-            for tool in response.tools
-        ]
+        # 3. 长期记忆召回每轮不同，放在历史之后；user_id 每个用户固定，放入共享前缀，供 LLM 调用工具时使用
+        notes = [f"长期记忆召回：{relevant_memories}"] if relevant_memories else []
+        user_context = f"【会话上下文】当前用户 user_id={uid}，调用需要 user_id 的工具时请使用此值。"
+        prompt_kwargs = {"notes": notes, "user_context": user_context, "user_id": uid}
+        # 4. 获取可用工具（缓存的预生成载荷，目录过期时才重新拉取）
+        available_tools = await self.tool_catalog.get(self.session)
         # 5. 串联CoT+ReAct（URL 中 + 会变为空格，需兼容）
         mode = (mode or "").replace(" ", "+").lower()
         if mode == "cot+react":
-            thoughts, plan = await self.cot_plan_and_reason(query, history, profile, available_tools)
-            # 将plan作为目标，传递给ReAct
-            react_intro = f"请根据以下行动计划逐步完成任务：{plan}"
-            react_history = history + [(None, "system", react_intro)]
-            react_trace = await self.react_reasoning(query, react_history, profile, available_tools)
-            memory_store.add_short_term(session_id, 'agent', f"[推理链]\n{thoughts}\n[计划]\n{plan}\n[ReAct]\n{react_trace}")
-            return f"[推理链]\n{thoughts}\n[计划]\n{plan}\n[ReAct]\n{react_trace}"
+            # 本地意图路由：寒暄直接回答，单工具查询用计划模板，均跳过 CoT 规划调用
+            decision = await asyncio.to_thread(self.router.classify, query) if self.router else None
+            plan_ms = None
+            if decision is not None and decision.route == CHITCHAT:
+                react_trace, final = await self.react_reasoning(query, history, profile, [], emit=emit,
+                                                                **prompt_kwargs)
+                answer = f"[ReAct]\n{react_trace}"
+            elif decision is not None and decision.route == SINGLE_TOOL:
+                plan = decision.plan
+                if emit is not None:
+                    await emit({"type": "plan", "stage": "router", "content": plan})
+                react_trace, final = await self.react_reasoning(query, history, profile, available_tools,
+                                                                emit=emit, plan=plan, **prompt_kwargs)
+                answer = f"[计划]\n{plan}\n[ReAct]\n{react_trace}"
+            else:
+                plan_start = time.perf_counter()
+                thoughts, plan = await self.cot_plan_and_reason(query, history, profile, available_tools, emit=emit,
+                                                                **prompt_kwargs)
+                plan_ms = (time.perf_counter() - plan_start) * 1000
+                # 将plan作为目标，传递给ReAct
+                react_trace, final = await self.react_reasoning(query, history, profile, available_tools,
+                                                                emit=emit, plan=plan, **prompt_kwargs)
+                answer = f"[推理链]\n{thoughts}\n[计划]\n{plan}\n[ReAct]\n{react_trace}"
+            if decision is not None:
+                saved_ms = self.router.record(decision, plan_ms)
+                logger.debug("Router: route=%s tool=%s score=%s route_ms=%s saved_ms=%.1f", decision.route,
+                             decision.tool, decision.score, decision.route_ms, saved_ms)
         elif mode == "cot":
-            thoughts, plan = await self.cot_plan_and_reason(query, history, profile, available_tools)
-            memory_store.add_short_term(session_id, 'agent', f"[推理链]\n{thoughts}\n[计划]\n{plan}")
-            return f"[推理链]\n{thoughts}\n[计划]\n{plan}"
+            thoughts, plan = await self.cot_plan_and_reason(query, history, profile, available_tools, emit=emit,
+                                                            **prompt_kwargs)
+            answer = f"[推理链]\n{thoughts}\n[计划]\n{plan}"
+            final = str(plan or thoughts)
         elif mode == "react":
-            react_trace = await self.react_reasoning(query, history, profile, available_tools)
-            memory_store.add_short_term(session_id, 'agent', f"[ReAct]\n{react_trace}")
-            return f"[ReAct]\n{react_trace}"
+            react_trace, final = await self.react_reasoning(query, history, profile, available_tools, emit=emit,
+                                                            **prompt_kwargs)
+            answer = f"[ReAct]\n{react_trace}"
         else:
-            return "未知推理模式"
+            answer = "未知推理模式"
+            if emit is not None:
+                await emit({"type": "final", "stage": "", "content": answer})
+            return answer
+        # 短期历史只保存最终回答，推理链不进入后续轮次的 prompt；超出 token 预算时后台压缩
+        turn_tokens = await asyncio.to_thread(memory_store.add_agent_turn, uid, session_id, final or answer, answer)
+        logger.debug("Memory tokens: %s", turn_tokens)
+        if emit is not None:
+            await emit({"type": "final", "stage": "", "content": answer})
+        return answer
+
+    async def process_query_stream(self, query: str, mode: str = "cot+react", user_id: str = None,
+                                   max_buffer: int = 64):
+        """
+        流式处理：异步生成器，按顺序产出事件 dict（type/stage/content）。
+        事件经有界队列传递，消费者处理慢时 Agent 在 emit 处等待（背压）。
+        final 事件附带 ttft_ms（首 token 延迟）。
+        """
+        events = asyncio.Queue(maxsize=max_buffer)
+        done = object()
+        start = time.perf_counter()
+        first_token = None
+
+        async def run():
+            try:
+                await self.process_query(query, mode=mode, user_id=user_id, emit=events.put)
+            finally:
+                await events.put(done)
+
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event = await events.get()
+                if event is done:
+                    break
+                if event["type"] == "token" and first_token is None:
+                    first_token = time.perf_counter() - start
+                if event["type"] == "final":
+                    event["ttft_ms"] = round(first_token * 1000, 1) if first_token is not None else None
+                yield event
+            await task  # 传播处理过程中的异常
+        finally:
+            if not task.done():
+                task.cancel()
 
     def update_profile(self, key, value):
         memory_store.add_long_term(self.user_id, key, value)
@@ -229,6 +491,7 @@ class IBAgent:
     async def cleanup(self):
         """Clean up resources"""
         await self.exit_stack.aclose()
+        await self.llm.close()
 
 
 async def main():
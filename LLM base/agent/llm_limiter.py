@@ -0,0 +1,64 @@
+"""
+跨 event loop 的异步并发上限：Agent 池分布在多个 event loop 线程上，asyncio.Semaphore 只能在创建它的 loop 内使用。
+InflightLimiter 用线程锁计数，名额不足时在调用方自己的 loop 上挂起，释放时按 FIFO 把名额直接转交给下一个等待者。
+"""
+import asyncio
+import threading
+from collections import deque
+
+
+class InflightLimiter:
+    """limit: 整个进程同时持有名额的协程数上限；用法 async with limiter: ..."""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters = deque()  # (loop, future)
+
+    async def __aenter__(self):
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                return self
+            loop = asyncio.get_running_loop()
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove(waiter)
+                    granted = False
+                except ValueError:
+                    granted = True  # 已被分配名额，转交给下一个等待者
+            if granted:
+                self._release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc):
+        self._release()
+
+    def _release(self):
+        with self._lock:
+            while self._waiters:
+                loop, fut = self._waiters.popleft()
+                try:
+                    # 名额直接转交，_active 不变
+                    loop.call_soon_threadsafe(_grant_slot, fut)
+                    return
+                except RuntimeError:  # 等待者的 loop 已关闭
+                    continue
+            self._active -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"limit": self.limit, "active": self._active, "waiting": len(self._waiters)}
+
+
+def _grant_slot(fut):
+    # 已取消的等待者由其自身的 CancelledError 分支归还名额
+    if not fut.done():
+        fut.set_result(None)
@@ -2,8 +2,11 @@
 专利转化 Agent 的 MCP Server：对接 RAG、专利检索、企业兴趣等能力
 工具通过 HTTP 调用 Spring Boot 业务中台 REST API
 """
+import os
+import asyncio
+import json
+import weakref
 from typing import Any
-import httpx
 from fastmcp import FastMCP
 
 import sys
@@ -14,26 +17,73 @@ _root = Path(__file__).resolve().parents[1]
 if str(_root) not in sys.path:
     sys.path.insert(0, str(_root))
 
-from config import BACKEND_BASE_URL, QWEN_API_BASE, QWEN_API_KEY, COHERE_API_KEY, USE_COHERE_RERANK, RAG_PERSIST_ROOT
-from rag.rag_chain import adaptive_rag_answer
+from config import BACKEND_BASE_URL, QWEN_API_BASE, QWEN_API_KEY, COHERE_API_KEY, USE_COHERE_RERANK, RAG_PERSIST_ROOT, RAG_WARMUP, \
+    RAG_PARALLEL_RETRIEVAL, RAG_LEG_TIMEOUT, RAG_ANSWER_CACHE, RAG_ANSWER_CACHE_SIZE, RAG_ANSWER_CACHE_TTL, \
+    RAG_ANSWER_CACHE_THRESHOLD, BACKEND_MAX_CONNECTIONS, BACKEND_MAX_KEEPALIVE, BACKEND_TIMEOUT, \
+    BACKEND_CONNECT_TIMEOUT, BACKEND_RETRIES, BACKEND_RETRY_BACKOFF, TOOL_CACHE, TOOL_CACHE_SIZE, PATENT_CACHE_TTL, \
+    ENTERPRISE_CACHE_TTL, TOOL_CACHE_STALE_TTL, TOOL_BATCH_MAX, TOOL_BATCH_CONCURRENCY
+from rag.rag_chain import get_retrieval_engine
+from rag.answer_cache import SemanticAnswerCache
+from agent.backend_client import BackendClient
+from agent.tool_cache import ReadThroughCache
 
 # Initialize FastMCP server
 mcp = FastMCP("patent")
 
+# 进程常驻的 RAG 检索引擎：模型/向量库/语料/LLM 客户端只加载一次，供所有工具调用共享
+rag_engine = get_retrieval_engine(
+    QWEN_API_BASE, QWEN_API_KEY, COHERE_API_KEY,
+    persist_root=RAG_PERSIST_ROOT, use_cohere=USE_COHERE_RERANK,
+    parallel=RAG_PARALLEL_RETRIEVAL, leg_timeout=RAG_LEG_TIMEOUT,
+    answer_cache=SemanticAnswerCache(
+        max_entries=RAG_ANSWER_CACHE_SIZE,
+        ttl=RAG_ANSWER_CACHE_TTL,
+        similarity_threshold=RAG_ANSWER_CACHE_THRESHOLD,
+    ) if RAG_ANSWER_CACHE else None,
+)
 
-async def _call_backend(path: str, method: str = "POST", params: dict = None, json_data: dict = None) -> dict:
-    """调用 Spring Boot 业务中台 REST API"""
-    url = f"{BACKEND_BASE_URL.rstrip('/')}{path}"
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            if method.upper() == "POST":
-                resp = await client.post(url, params=params or {}, json=json_data)
-            else:
-                resp = await client.get(url, params=params or {})
-            resp.raise_for_status()
-            return resp.json() if resp.content else {}
-        except httpx.HTTPError as e:
-            return {"error": str(e), "code": getattr(e, "response", None) and getattr(e.response, "status_code", 500)}
+
+# 每个 event loop 一个共享客户端（inprocess 传输下多个 loop 线程共用本模块）
+_backend_clients = weakref.WeakKeyDictionary()
+
+
+def _backend() -> BackendClient:
+    loop = asyncio.get_running_loop()
+    client = _backend_clients.get(loop)
+    if client is None:
+        client = _backend_clients[loop] = BackendClient(
+            BACKEND_BASE_URL, max_connections=BACKEND_MAX_CONNECTIONS, max_keepalive=BACKEND_MAX_KEEPALIVE,
+            timeout=BACKEND_TIMEOUT, connect_timeout=BACKEND_CONNECT_TIMEOUT,
+            retries=BACKEND_RETRIES, backoff=BACKEND_RETRY_BACKOFF,
+        )
+    return client
+
+
+async def _call_backend(path: str, method: str = "POST", params: dict = None, json_data: dict = None,
+                        idempotent: bool = None) -> dict:
+    """调用 Spring Boot 业务中台 REST API（共享连接池；幂等请求可重试，相同的在途请求合并为一次）"""
+    return await _backend().request(path, method=method, params=params, json_data=json_data, idempotent=idempotent)
+
+
+# 按 patent_no 的读穿缓存：专利详情很少变化，企业兴趣变化较慢，各自独立 TTL
+_tool_caches = {
+    "get_patent_analysis": ReadThroughCache("get_patent_analysis", ttl=PATENT_CACHE_TTL,
+                                            stale_ttl=TOOL_CACHE_STALE_TTL, max_entries=TOOL_CACHE_SIZE),
+    "get_enterprise_interest": ReadThroughCache("get_enterprise_interest", ttl=ENTERPRISE_CACHE_TTL,
+                                                stale_ttl=TOOL_CACHE_STALE_TTL, max_entries=TOOL_CACHE_SIZE),
+}
+
+
+async def _cached_lookup(tool: str, path: str, patent_no: str) -> dict:
+    """经读穿缓存查询业务中台；只缓存成功响应（code == 1）"""
+    async def load():
+        # 只读查询：后端为 POST 但无副作用，允许重试与合并
+        data = await _call_backend(path, params={"patent_no": patent_no}, idempotent=True)
+        return data, "error" not in data and data.get("code") == 1
+
+    if not TOOL_CACHE:
+        return (await load())[0]
+    return await _tool_caches[tool].get(patent_no.strip(), load)
 
 
 @mcp.tool()
@@ -54,7 +104,7 @@ async def get_enterprise_interest(patent_no: str) -> str:
     Args:
         patent_no: 专利号
     """
-    data = await _call_backend("/agent/tools/patent/enterprise", params={"patent_no": patent_no})
+    data = await _cached_lookup("get_enterprise_interest", "/agent/tools/patent/enterprise", patent_no)
     if "error" in data:
         return f"查询失败: {data['error']}"
     if data.get("code") == 1 and "data" in data:
@@ -69,7 +119,7 @@ async def get_patent_analysis(patent_no: str) -> str:
     Args:
         patent_no: 专利号
     """
-    data = await _call_backend("/agent/tools/patent/search", params={"patent_no": patent_no})
+    data = await _cached_lookup("get_patent_analysis", "/agent/tools/patent/search", patent_no)
     if "error" in data:
         return f"查询失败: {data['error']}"
     if data.get("code") == 1 and "data" in data:
@@ -85,6 +135,90 @@ async def get_patent_analysis(patent_no: str) -> str:
     return str(data)
 
 
+def _dedupe_patent_nos(patent_nos) -> tuple:
+    """去空白、去重（保持顺序），返回 (前 TOOL_BATCH_MAX 个专利号, 超出上限未查询的专利号)"""
+    unique = list(dict.fromkeys(no.strip() for no in patent_nos or [] if no and no.strip()))
+    return unique[:TOOL_BATCH_MAX], unique[TOOL_BATCH_MAX:]
+
+
+def _omitted_note(omitted: list) -> str:
+    """超出批量上限时附在工具输出末尾，让模型知道哪些专利号未查询、需分批再查"""
+    if not omitted:
+        return ""
+    return f"\n\n（单次最多查询 {TOOL_BATCH_MAX} 个专利，以下 {len(omitted)} 个未查询，请分批再查：{', '.join(omitted)}）"
+
+
+async def _batch_lookup(lookups: list, patent_nos: list) -> list:
+    """并发查询多个专利（受 TOOL_BATCH_CONCURRENCY 限制），每个请求仍经过读穿缓存与请求合并.
+
+    lookups: [(tool, path), ...]；同一专利的多项查询共用一个并发名额，返回每个专利对应的结果列表
+    """
+    slots = asyncio.Semaphore(TOOL_BATCH_CONCURRENCY)
+
+    async def one(no):
+        async with slots:
+            return await asyncio.gather(*(_cached_lookup(tool, path, no) for tool, path in lookups))
+
+    return await asyncio.gather(*(one(no) for no in patent_nos))
+
+
+def _cell(value, limit: int = 60) -> str:
+    """表格单元格：去换行与竖线，超长截断"""
+    text = str(value or "-").replace("\n", " ").replace("|", "/").strip()
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+def _lookup_ok(data: dict) -> bool:
+    return "error" not in data and data.get("code") == 1 and "data" in data
+
+
+@mcp.tool()
+async def get_patent_analysis_batch(patent_nos: list[str], include_interest: bool = False) -> str:
+    """批量查询多个专利的详情（名称、摘要、链接），以紧凑表格返回，适合对比/排序多个专利.
+
+    Args:
+        patent_nos: 专利号列表
+        include_interest: 是否同时查询企业兴趣度（多一列）
+    """
+    patent_nos, omitted = _dedupe_patent_nos(patent_nos)
+    if not patent_nos:
+        return "未提供专利号"
+    lookups = [("get_patent_analysis", "/agent/tools/patent/search")]
+    if include_interest:
+        lookups.append(("get_enterprise_interest", "/agent/tools/patent/enterprise"))
+    results = await _batch_lookup(lookups, patent_nos)
+    header = "| 专利号 | 名称 | 摘要 | 链接 |" + (" 企业兴趣度 |" if include_interest else "")
+    lines = [header, "|" + "---|" * (header.count("|") - 1)]
+    for no, (data, *extra) in zip(patent_nos, results):
+        if _lookup_ok(data):
+            p = data["data"]
+            row = [no, _cell(p.get("name"), 40), _cell(p.get("summary")), _cell(p.get("link"), 80)]
+        else:
+            row = [no, _cell(f"查询失败: {data.get('error') or data.get('msg') or data}"), "-", "-"]
+        if include_interest:
+            interest = extra[0]
+            row.append(_cell(interest["data"] if _lookup_ok(interest) else "查询失败", 20))
+        lines.append("| " + " | ".join(row) + " |")
+    return "\n".join(lines) + _omitted_note(omitted)
+
+
+@mcp.tool()
+async def get_enterprise_interest_batch(patent_nos: list[str]) -> str:
+    """批量查询多个专利的企业兴趣度，以紧凑表格返回.
+
+    Args:
+        patent_nos: 专利号列表
+    """
+    patent_nos, omitted = _dedupe_patent_nos(patent_nos)
+    if not patent_nos:
+        return "未提供专利号"
+    results = await _batch_lookup([("get_enterprise_interest", "/agent/tools/patent/enterprise")], patent_nos)
+    lines = ["| 专利号 | 企业兴趣度 |", "|---|---|"]
+    for no, (data,) in zip(patent_nos, results):
+        lines.append(f"| {no} | {_cell(data['data'] if _lookup_ok(data) else '查询失败', 40)} |")
+    return "\n".join(lines) + _omitted_note(omitted)
+
+
 @mcp.tool()
 async def get_rag_patent_info(patent_no: str, query: str = "") -> str:
     """基于 RAG（向量+BM25 多路召回、RRF 融合、可选重排）获取专利相关知识增强回答.
@@ -97,22 +231,87 @@ async def get_rag_patent_info(patent_no: str, query: str = "") -> str:
     if not QWEN_API_KEY:
         return "RAG 未配置 QWEN_API_KEY，请在 .env 或环境变量中设置"
     try:
-        insights = adaptive_rag_answer(
-            q,
-            qwen_api_base=QWEN_API_BASE,
-            qwen_api_key=QWEN_API_KEY,
-            cohere_api_key=COHERE_API_KEY,
-            top_k=5,
-            rerank_top_n=5,
-            use_cohere=USE_COHERE_RERANK,
-            persist_root=RAG_PERSIST_ROOT,
-        )
+        # 检索与生成是阻塞调用，放到线程池避免卡住 MCP 事件循环
+        insights = await asyncio.to_thread(rag_engine.answer_text, q, 5, 5, patent_no.strip().upper())
         return f"专利 {patent_no} RAG 知识增强回答:\n{insights}"
     except Exception as e:
         return f"RAG 调用异常: {str(e)}"
 
 
+@mcp.tool()
+async def get_rag_patent_info_batch(patent_nos: list[str], query: str = "") -> str:
+    """批量获取多个专利的 RAG 知识增强回答（一次批量检索，适合对比/汇总多个专利）.
+
+    Args:
+        patent_nos: 专利号列表
+        query: 针对每个专利的问题（如不传则检索专利的相关信息）
+    """
+    patent_nos, omitted = _dedupe_patent_nos(patent_nos)
+    if not patent_nos:
+        return "未提供专利号"
+    if not QWEN_API_KEY:
+        return "RAG 未配置 QWEN_API_KEY，请在 .env 或环境变量中设置"
+    q = query.strip()
+    questions = [
+        f"专利 {no}：{q}" if q else f"专利 {no} 的相关信息、技术要点、应用场景"
+        for no in patent_nos
+    ]
+    try:
+        results = await asyncio.to_thread(rag_engine.answer_batch, questions, 5, 5)
+    except Exception as e:
+        return f"RAG 调用异常: {str(e)}"
+    parts = []
+    for no, (ans, _) in zip(patent_nos, results):
+        insights = ans.content if hasattr(ans, "content") else str(ans)
+        parts.append(f"专利 {no} RAG 知识增强回答:\n{insights}")
+    return "\n\n".join(parts) + _omitted_note(omitted)
+
+
+@mcp.resource("status://rag")
+def rag_status() -> str:
+    """RAG 检索引擎就绪状态与答案缓存命中统计（JSON），供 /health 上报；资源不会出现在工具列表中"""
+    return json.dumps(rag_engine.status(), ensure_ascii=False)
+
+
+@mcp.tool()
+async def admin_invalidate_tool_cache(patent_no: str = "", tool: str = "") -> str:
+    """内部管理工具（admin_ 前缀，不暴露给 LLM）：业务中台数据变更后失效工具缓存，返回删除的条目数.
+
+    Args:
+        patent_no: 专利号（为空则清空）
+        tool: 工具名 get_patent_analysis / get_enterprise_interest（为空则所有工具）
+    """
+    if tool and tool not in _tool_caches:
+        return "0"
+    caches = [_tool_caches[tool]] if tool else list(_tool_caches.values())
+    return str(sum(cache.invalidate(patent_no.strip() or None) for cache in caches))
+
+
+@mcp.resource("status://tool_cache")
+def tool_cache_status() -> str:
+    """工具读穿缓存命中统计（JSON）；pid 用于区分多个 stdio 子进程各自的缓存"""
+    return json.dumps({"pid": os.getpid(), "caches": {name: c.stats() for name, c in _tool_caches.items()}},
+                      ensure_ascii=False)
+
+
+@mcp.resource("status://backend")
+def backend_status() -> str:
+    """业务中台客户端统计（请求数、实际后端调用、合并、重试、失败），按 event loop 汇总"""
+    totals = {}
+    for client in list(_backend_clients.values()):
+        for k, v in client.stats().items():
+            totals[k] = totals.get(k, 0) + v
+    return json.dumps(totals, ensure_ascii=False)
+
+
+def warm_up():
+    """按配置后台预热 RAG 引擎；stdio 启动与进程内（inprocess 传输）加载时都会调用"""
+    if RAG_WARMUP:
+        rag_engine.warm_up_async()
+
+
 def main():
+    warm_up()
     mcp.run(transport="stdio")
 
 
@@ -1,19 +1,74 @@
 """
 分层记忆架构：短期缓存 + 长期向量化
-- 短期记忆：最近 N 轮对话，内存缓存，快速访问
+- 短期记忆：最近 N 轮对话，存于可插拔会话后端（见 agent/session_store.py）：进程内分片环形缓冲，或多副本共享的 Redis
 - 工作记忆：当前任务上下文（可选），可压缩入长期
 - 长期记忆：ChromaDB 向量化
   - episodic：对话/事件摘要、业务数据（专利/问卷）摘要
   - semantic：用户画像、知识、偏好
+  - 写入走后台 write-behind 队列：微批合并、一次前向编码、Chroma upsert，前台只做入队
+- get_context_for_agent：短期/画像读取与长期召回并行，召回受延迟预算约束，返回各部分耗时
+- 对话压缩：短期历史只保存 Agent 的最终回答（不含推理链/工具轨迹）；超过 token 预算时，
+  后台把较早的轮次摘要写入 episodic 记忆并移出短期历史
 对外提供标准化 API，Agent 在多轮对话中利用历史上下文。
 """
+import sys
+import json
 import time
+import atexit
+import logging
 import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 import chromadb
 from sentence_transformers import SentenceTransformer
 import os
 from typing import Optional, List, Tuple, Any
 
+from rag.embedding_cache import embedding_cache
+from agent.session_store import SessionStore, create_session_store
+from agent.token_count import count_tokens
+
+try:
+    from config import (
+        SESSION_TTL, SESSION_MEMORY_BUDGET_MB, SESSION_SHARDS,
+        SESSION_BACKEND, SESSION_REDIS_URL, SESSION_PROFILE_TTL, SESSION_REDIS_TIMEOUT, SESSION_REDIS_CONNECT_TIMEOUT,
+    )
+except ImportError:
+    SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))
+    SESSION_MEMORY_BUDGET_MB = int(os.getenv("SESSION_MEMORY_BUDGET_MB", "64"))
+    SESSION_SHARDS = int(os.getenv("SESSION_SHARDS", "16"))
+    SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+    SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+    SESSION_PROFILE_TTL = float(os.getenv("SESSION_PROFILE_TTL", "300"))
+    SESSION_REDIS_TIMEOUT = float(os.getenv("SESSION_REDIS_TIMEOUT", "0.5"))
+    SESSION_REDIS_CONNECT_TIMEOUT = float(os.getenv("SESSION_REDIS_CONNECT_TIMEOUT", "0.5"))
+
+try:
+    from config import MEMORY_CONTEXT_BUDGET_MS, MEMORY_CONTEXT_WORKERS
+except ImportError:
+    MEMORY_CONTEXT_BUDGET_MS = float(os.getenv("MEMORY_CONTEXT_BUDGET_MS", "800"))
+    MEMORY_CONTEXT_WORKERS = int(os.getenv("MEMORY_CONTEXT_WORKERS", "8"))
+
+try:
+    from config import MEMORY_COMPACTION, MEMORY_HISTORY_TOKEN_BUDGET, MEMORY_COMPACT_KEEP_TURNS
+except ImportError:
+    MEMORY_COMPACTION = os.getenv("MEMORY_COMPACTION", "true").lower() == "true"
+    MEMORY_HISTORY_TOKEN_BUDGET = int(os.getenv("MEMORY_HISTORY_TOKEN_BUDGET", "1500"))
+    MEMORY_COMPACT_KEEP_TURNS = int(os.getenv("MEMORY_COMPACT_KEEP_TURNS", "4"))
+
+logger = logging.getLogger(__name__)
+
+
+def summarize_turns(turns, max_chars: int = 120) -> str:
+    """默认摘要器（抽取式）：每轮截取前 max_chars 个字符，不额外调用 LLM"""
+    lines = []
+    for _, role, text in turns:
+        text = " ".join((text or "").split())
+        if len(text) > max_chars:
+            text = text[:max_chars] + "…"
+        lines.append(f"{'用户' if role == 'user' else '助手'}：{text}")
+    return "早先对话摘要：\n" + "\n".join(lines)
+
 
 class MemoryStore:
     """
@@ -25,10 +80,16 @@ class MemoryStore:
     LT_EPISODIC = "episodic"  # 对话/事件/业务数据摘要
     LT_SEMANTIC = "semantic"  # 用户画像、知识、偏好
 
-    def __init__(self, persist_dir=None, embedding_model_name=None, short_term_size=20):
-        self.short_term = {}  # {session_id: [(timestamp, role, text)]}
-        self.working = {}    # {session_id: [(timestamp, key, value)]} 工作记忆
-        self.lock = threading.Lock()
+    def __init__(self, persist_dir=None, embedding_model_name=None, short_term_size=20,
+                 write_batch_size=32, write_batch_window=0.05, session_store: Optional[SessionStore] = None,
+                 summarizer=None, write_max_retries=3, write_retry_backoff=0.5):
+        # 短期/工作记忆与画像快照：session_store 未指定时按 SESSION_BACKEND 创建
+        self.sessions = session_store or create_session_store(
+            SESSION_BACKEND, redis_url=SESSION_REDIS_URL, redis_timeout=SESSION_REDIS_TIMEOUT,
+            redis_connect_timeout=SESSION_REDIS_CONNECT_TIMEOUT,
+            max_turns=short_term_size, max_working=10, ttl=SESSION_TTL, profile_ttl=SESSION_PROFILE_TTL,
+            memory_budget_bytes=SESSION_MEMORY_BUDGET_MB << 20, shards=SESSION_SHARDS,
+        )
         self.short_term_size = short_term_size
 
         persist_dir = persist_dir or os.path.abspath(
@@ -40,42 +101,72 @@ class MemoryStore:
             "long_term_memory",
             metadata={"description": "episodic + semantic 长期记忆"}
         )
-        self.embedding_model = SentenceTransformer(
-            embedding_model_name or "paraphrase-multilingual-MiniLM-L12-v2"
+        self.embedding_model_name = embedding_model_name or "paraphrase-multilingual-MiniLM-L12-v2"
+        self.embedding_model = SentenceTransformer(self.embedding_model_name)
+
+        # 长期记忆 write-behind 队列：{doc_id: (text, metadata)}，同一 doc_id 未落盘前重复写入只保留最新值
+        # 写入失败的批次按指数退避重新入队，单条重试超过 write_max_retries 次后追加到 dead_letter.jsonl
+        self.write_batch_size = write_batch_size
+        self.write_batch_window = write_batch_window
+        self.write_max_retries = write_max_retries
+        self.write_retry_backoff = write_retry_backoff
+        self.dead_letter_path = os.path.join(persist_dir, "dead_letter.jsonl")
+        self._pending = OrderedDict()
+        self._write_cond = threading.Condition()
+        self._in_flight = {}  # 已出队、正在编码/写入的条目，upsert 返回前仍对读取可见
+        self._attempts = {}  # doc_id -> 已失败次数
+        self._closed = False
+        self._write_stats = {"queued": 0, "written": 0, "batches": 0, "failed": 0, "retried": 0, "dead_letter": 0}
+        self._writer = threading.Thread(target=self._write_loop, name="memory-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+        # 上下文组装线程池：超出延迟预算的长期召回仍在池中跑完（结果丢弃），线程数留出余量
+        self._context_executor = ThreadPoolExecutor(
+            max_workers=MEMORY_CONTEXT_WORKERS, thread_name_prefix="memory-context"
         )
 
+        # 对话压缩：summarizer(turns) -> 摘要文本，可替换为 LLM 摘要；同一会话同时只有一个压缩任务
+        self.summarizer = summarizer or summarize_turns
+        self._compact_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-compact")
+        self._compacting = set()
+        self._compact_lock = threading.Lock()
+        self._compact_stats = {
+            "compactions": 0, "turns_folded": 0, "tokens_folded": 0, "summary_tokens": 0, "trace_tokens_saved": 0,
+        }
+
+    def embed(self, texts: List[str]) -> list:
+        """经向量缓存编码（与意图路由、RAG 检索共享），返回与 texts 对应的向量列表"""
+        return embedding_cache.get_many(self.embedding_model_name, texts, self.embedding_model.encode)
+
     # ========== 短期记忆（缓存最近对话） ==========
 
     def add_short_term(self, session_id: str, role: str, text: str) -> None:
         """写入短期记忆（对话轮次）"""
-        with self.lock:
-            self.short_term.setdefault(session_id, []).append((time.time(), role, text))
-            self.short_term[session_id] = self.short_term[session_id][-self.short_term_size:]
+        self.sessions.append_turn(session_id, role, text)
 
-    def get_short_term(self, session_id: str) -> List[Tuple[float, str, str]]:
-        """获取短期记忆（对话历史）"""
-        with self.lock:
-            return self.short_term.get(session_id, []).copy()
+    def get_short_term(self, session_id: str, limit: Optional[int] = None) -> List[Tuple[float, str, str]]:
+        """获取短期记忆（对话历史），limit 为最近条数"""
+        return self.sessions.get_turns(session_id, limit)
 
     def clear_short_term(self, session_id: str) -> None:
-        with self.lock:
-            self.short_term.pop(session_id, None)
+        self.sessions.clear_turns(session_id)
 
     # ========== 工作记忆（当前任务上下文） ==========
 
     def add_working(self, session_id: str, key: str, value: Any) -> None:
-        """写入工作记忆（如当前任务计划、工具调用结果）"""
-        with self.lock:
-            self.working.setdefault(session_id, []).append((time.time(), key, str(value)))
-            self.working[session_id] = self.working[session_id][-10:]  # 最多保留 10 条
+        """写入工作记忆（如当前任务计划、工具调用结果），最多保留 10 条"""
+        self.sessions.append_working(session_id, key, str(value))
 
     def get_working(self, session_id: str) -> List[Tuple[float, str, str]]:
-        with self.lock:
-            return self.working.get(session_id, []).copy()
+        return self.sessions.get_working(session_id)
 
     def clear_working(self, session_id: str) -> None:
-        with self.lock:
-            self.working.pop(session_id, None)
+        self.sessions.clear_working(session_id)
+
+    def session_stats(self) -> dict:
+        """短期会话后端指标（memory：会话数、常驻字节、淘汰计数；redis：往返次数、错误数）"""
+        return self.sessions.stats()
 
     # ========== 长期记忆（向量化） ==========
 
@@ -84,23 +175,127 @@ class MemoryStore:
         memory_type: str = LT_SEMANTIC
     ) -> None:
         """
-        将长期记忆向量化存入 ChromaDB。
+        将长期记忆向量化存入 ChromaDB（异步：入队后立即返回，由后台线程批量编码并 upsert）。
         memory_type: episodic（事件/业务数据）或 semantic（画像/知识）
         """
         doc_id = f"{user_id}:{memory_type}:{key}"
-        text = str(value)
-        embedding = self.embedding_model.encode([text])[0].tolist()
-        with self.lock:
+        metadata = {"user_id": user_id, "key": key, "type": memory_type}
+        with self._write_cond:
+            self._pending[doc_id] = (str(value), metadata)
+            self._pending.move_to_end(doc_id)
+            self._write_stats["queued"] += 1
+            self._write_cond.notify_all()
+        if memory_type == self.LT_SEMANTIC:
+            self.sessions.invalidate_profile(user_id)
+
+    def _write_loop(self):
+        """后台写线程：等待首条写入后再收集 write_batch_window 内到达的写入，一次编码、一次 upsert"""
+        while True:
+            with self._write_cond:
+                while not self._pending and not self._closed:
+                    self._write_cond.wait()
+                if not self._pending:
+                    return
+            time.sleep(self.write_batch_window)
+            with self._write_cond:
+                batch = []
+                while self._pending and len(batch) < self.write_batch_size:
+                    batch.append(self._pending.popitem(last=False))
+                self._in_flight = dict(batch)
             try:
-                self.collection.delete(ids=[doc_id])
-            except Exception:
-                pass
-            self.collection.add(
-                ids=[doc_id],
-                documents=[text],
-                metadatas=[{"user_id": user_id, "key": key, "type": memory_type}],
-                embeddings=[embedding]
-            )
+                texts = [text for _, (text, _) in batch]
+                embeddings = self.embed(texts)
+                self.collection.upsert(
+                    ids=[doc_id for doc_id, _ in batch],
+                    documents=texts,
+                    metadatas=[meta for _, (_, meta) in batch],
+                    embeddings=[e.tolist() for e in embeddings]
+                )
+                error = None
+                # 画像快照在落盘后再失效一次：入队到落盘之间读取 Chroma 回填的旧快照不会存活到 TTL 结束
+                for user_id in {meta["user_id"] for _, (_, meta) in batch if meta["type"] == self.LT_SEMANTIC}:
+                    self.sessions.invalidate_profile(user_id)
+            except Exception as e:
+                error = e
+                print(f"长期记忆批量写入失败（{len(batch)} 条）: {e}", file=sys.stderr)
+            backoff = 0.0
+            with self._write_cond:
+                self._in_flight = {}
+                self._write_stats["batches"] += 1
+                if error is None:
+                    self._write_stats["written"] += len(batch)
+                    for doc_id, _ in batch:
+                        self._attempts.pop(doc_id, None)
+                else:
+                    self._write_stats["failed"] += len(batch)
+                    retry, dead = [], []
+                    for doc_id, entry in batch:
+                        if doc_id in self._pending:  # 失败期间又有新值入队，以新值为准
+                            self._attempts.pop(doc_id, None)
+                            continue
+                        attempts = self._attempts.get(doc_id, 0) + 1
+                        if attempts > self.write_max_retries:
+                            self._attempts.pop(doc_id, None)
+                            dead.append((doc_id, entry))
+                        else:
+                            self._attempts[doc_id] = attempts
+                            retry.append((doc_id, entry))
+                            backoff = max(backoff, self.write_retry_backoff * 2 ** (attempts - 1))
+                    # 重试条目放回队首，保持原有写入顺序
+                    for doc_id, entry in reversed(retry):
+                        self._pending[doc_id] = entry
+                        self._pending.move_to_end(doc_id, last=False)
+                    self._write_stats["retried"] += len(retry)
+                    self._write_stats["dead_letter"] += len(dead)
+                    # 在锁内落到 dead letter 文件：flush() 返回时重试耗尽的条目已可在文件中查到（仅失败路径，开销可忽略）
+                    if dead:
+                        self._dead_letter(dead, error)
+                self._write_cond.notify_all()
+            if backoff:
+                time.sleep(backoff)
+
+    def _dead_letter(self, entries, error) -> None:
+        """重试耗尽的写入追加到 dead_letter.jsonl（每行一条，可据此人工补写）"""
+        print(f"长期记忆写入重试耗尽，{len(entries)} 条转入 {self.dead_letter_path}", file=sys.stderr)
+        try:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                for doc_id, (text, meta) in entries:
+                    f.write(json.dumps({"id": doc_id, "document": text, "metadata": meta, "error": str(error),
+                                        "ts": time.time()}, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"写入 dead letter 失败: {e}", file=sys.stderr)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待写队列清空并全部落盘；超时返回 False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._write_cond:
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._write_cond.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = 30.0) -> None:
+        """停机：写完队列中剩余的记忆后停止后台写线程"""
+        self._compact_executor.shutdown(wait=True)  # 进行中的压缩会写入摘要，需在写线程停止前完成
+        with self._write_cond:
+            self._closed = True
+            self._write_cond.notify_all()
+        self._writer.join(timeout)
+
+    def write_stats(self) -> dict:
+        with self._write_cond:
+            return dict(self._write_stats, pending=len(self._pending) + len(self._in_flight))
+
+    def _pending_docs(self, user_id: str, memory_type: Optional[str] = None) -> dict:
+        """尚未落盘的写入 {doc_id: text}，含队列中与正在写入的条目（读己之写：精确查找与全量读取会合并这部分）"""
+        with self._write_cond:
+            # 队列中的值比正在写入的新，后合并以覆盖
+            return {
+                doc_id: text for doc_id, (text, meta) in [*self._in_flight.items(), *self._pending.items()]
+                if meta["user_id"] == user_id and (memory_type is None or meta["type"] == memory_type)
+            }
 
     def add_business_data(
         self, user_id: str, data_type: str, data: Any
@@ -132,6 +327,7 @@ class MemoryStore:
         where = _where()
 
         if key:
+            pending = self._pending_docs(user_id)
             # 尝试新格式 user_id:type:key 与旧格式 user_id:key
             for doc_id in [
                 f"{user_id}:{memory_type or self.LT_SEMANTIC}:{key}",
@@ -139,6 +335,8 @@ class MemoryStore:
                 f"{user_id}:{self.LT_EPISODIC}:{key}",
                 f"{user_id}:{key}",
             ]:
+                if doc_id in pending:
+                    return pending[doc_id]
                 try:
                     results = self.collection.get(ids=[doc_id])
                     if results and results.get("documents"):
@@ -148,24 +346,101 @@ class MemoryStore:
             return None
 
         if query_text:
-            embedding = self.embedding_model.encode([query_text])[0].tolist()
-            results = self.collection.query(
-                query_embeddings=[embedding],
-                n_results=top_k,
-                where=where if where else None
-            )
-            docs = results.get("documents", [[]])
-            return docs[0] if docs else []
-
-        # 返回该用户全部
+            # 语义检索只覆盖已落盘的记忆（写入延迟为一个批处理窗口）
+            return self._query_long_term(self.embed([query_text])[0].tolist(), where, top_k)
+
+        # 返回该用户全部（合并未落盘的写入，同 id 以待写入的新值为准）
+        pending = self._pending_docs(user_id, memory_type)
         results = self.collection.get(where=where)
-        return results.get("documents", []) if results else []
+        if not pending:
+            return results.get("documents", []) if results else []
+        docs = dict(zip(results.get("ids", []), results.get("documents", []))) if results else {}
+        docs.update(pending)
+        return list(docs.values())
+
+    def _query_long_term(self, embedding: list, where: dict, top_k: int) -> list:
+        results = self.collection.query(
+            query_embeddings=[embedding],
+            n_results=top_k,
+            where=where if where else None
+        )
+        docs = results.get("documents", [[]])
+        return docs[0] if docs else []
 
     def clear_long_term(self, user_id: str) -> None:
+        self.flush()
         results = self.collection.get(where={"user_id": {"$eq": user_id}})
         ids = results.get("ids", []) if results else []
         if ids:
             self.collection.delete(ids=ids)
+        self.sessions.invalidate_profile(user_id)
+
+    # ========== 对话压缩 ==========
+
+    def add_agent_turn(self, user_id: str, session_id: str, answer: str, trace: str = "") -> dict:
+        """
+        写入 Agent 一轮回答：短期历史只保存最终回答 answer，完整推理链 trace 不进入后续 prompt；
+        短期历史超过 token 预算时提交后台压缩。返回本轮 token 统计
+        """
+        self.add_short_term(session_id, "agent", answer)
+        answer_tokens = count_tokens(answer)
+        trace_tokens = count_tokens(trace) if trace else answer_tokens
+        saved = max(0, trace_tokens - answer_tokens)
+        with self._compact_lock:
+            self._compact_stats["trace_tokens_saved"] += saved
+        history_tokens, scheduled = self.schedule_compaction(user_id, session_id)
+        return {
+            "answer_tokens": answer_tokens,
+            "trace_tokens": trace_tokens,
+            "saved_tokens": saved,
+            "history_tokens": history_tokens,
+            "compaction_scheduled": scheduled,
+        }
+
+    def schedule_compaction(self, user_id: str, session_id: str) -> Tuple[int, bool]:
+        """返回 (短期历史 token 数, 是否提交了压缩任务)"""
+        history_tokens = sum(count_tokens(text) for _, _, text in self.get_short_term(session_id))
+        if not MEMORY_COMPACTION or history_tokens <= MEMORY_HISTORY_TOKEN_BUDGET:
+            return history_tokens, False
+        with self._compact_lock:
+            if session_id in self._compacting:
+                return history_tokens, False
+            self._compacting.add(session_id)
+        self._compact_executor.submit(self._compact, user_id, session_id)
+        return history_tokens, True
+
+    def _compact(self, user_id: str, session_id: str) -> None:
+        """从最早的轮次开始折叠，直到剩余历史不超过预算（至少保留 MEMORY_COMPACT_KEEP_TURNS 条）"""
+        try:
+            turns = self.get_short_term(session_id)
+            costs = [count_tokens(text) for _, _, text in turns]
+            remaining, fold = sum(costs), 0
+            while remaining > MEMORY_HISTORY_TOKEN_BUDGET and len(turns) - fold > MEMORY_COMPACT_KEEP_TURNS:
+                remaining -= costs[fold]
+                fold += 1
+            if not fold:
+                return
+            folded = turns[:fold]
+            summary = self.summarizer(folded)
+            # 先写摘要再移出历史，避免中间状态丢失上下文
+            self.add_long_term(user_id, f"conversation_{int(folded[0][0] * 1000)}", summary,
+                               memory_type=self.LT_EPISODIC)
+            removed = self.sessions.drop_turns_until(session_id, folded[-1][0])
+            with self._compact_lock:
+                self._compact_stats["compactions"] += 1
+                self._compact_stats["turns_folded"] += removed
+                self._compact_stats["tokens_folded"] += sum(costs[:fold])
+                self._compact_stats["summary_tokens"] += count_tokens(summary)
+            logger.debug("对话压缩: session=%s 折叠 %d 条（%d tokens）", session_id, removed, sum(costs[:fold]))
+        except Exception as e:
+            print(f"对话压缩失败: {e}", file=sys.stderr)
+        finally:
+            with self._compact_lock:
+                self._compacting.discard(session_id)
+
+    def compaction_stats(self) -> dict:
+        with self._compact_lock:
+            return dict(self._compact_stats, in_progress=len(self._compacting))
 
     # ========== 标准化 API：供 Agent 获取上下文 ==========
 
@@ -176,26 +451,83 @@ class MemoryStore:
         query: str,
         short_term_limit: int = 10,
         long_term_top_k: int = 3,
+        latency_budget_ms: Optional[float] = None,
     ) -> dict:
         """
         获取 Agent 可用的记忆上下文，返回结构化数据。
         用于拼接到 prompt 中，提升多轮对话一致性和上下文利用。
+        短期/画像读取与长期召回并行；召回只编码一次 query，episodic 检索与无类型兜底检索共用该向量。
+        latency_budget_ms: 长期召回的延迟预算（默认 MEMORY_CONTEXT_BUDGET_MS，0 不限），超时则本轮不带召回结果。
+        timings: 各部分耗时（毫秒）及召回是否被跳过，供诊断
         """
-        history = self.get_short_term(session_id)[-short_term_limit:]
-        profile = self.get_long_term(user_id, memory_type=self.LT_SEMANTIC)
-        relevant_memories = self.get_long_term(
-            user_id, query_text=query, top_k=long_term_top_k, memory_type=self.LT_EPISODIC
-        )
-        if not relevant_memories and query:
-            # 未指定 type 时也做一次检索
-            relevant_memories = self.get_long_term(user_id, query_text=query, top_k=long_term_top_k)
-        working = self.get_working(session_id)
+        start = time.perf_counter()
+        budget_ms = MEMORY_CONTEXT_BUDGET_MS if latency_budget_ms is None else latency_budget_ms
+        timings = {}
+
+        def _elapsed_ms(since):
+            return round((time.perf_counter() - since) * 1000, 2)
+
+        def _recall():
+            t0 = time.perf_counter()
+            embedding = self.embed([query])[0].tolist()
+            timings["embed_ms"] = _elapsed_ms(t0)
+            t1 = time.perf_counter()
+            memories = self._query_long_term(embedding, {
+                "$and": [{"user_id": {"$eq": user_id}}, {"type": {"$eq": self.LT_EPISODIC}}]
+            }, long_term_top_k)
+            if not memories:
+                # 未指定 type 时也做一次检索
+                memories = self._query_long_term(embedding, {"user_id": {"$eq": user_id}}, long_term_top_k)
+            timings["recall_ms"] = _elapsed_ms(t1)
+            return memories
+
+        def _profile_fallback():
+            t0 = time.perf_counter()
+            profile = self.get_long_term(user_id, memory_type=self.LT_SEMANTIC)
+            # 该用户仍有未落盘的画像写入时不回填快照（读到的是合并后的临时结果，落盘后重新回源）
+            if not self._pending_docs(user_id, self.LT_SEMANTIC):
+                self.sessions.set_profile(user_id, profile)
+            timings["profile_ms"] = _elapsed_ms(t0)
+            return profile
+
+        recall_future = self._context_executor.submit(_recall) if query else None
+
+        # 历史、工作记忆与画像快照一次取回（redis 后端为一次流水线往返）；
+        # 画像未缓存时回源 ChromaDB 并回填，与长期召回同在线程池中并行
+        t0 = time.perf_counter()
+        history, working, profile = self.sessions.get_bundle(session_id, user_id, short_term_limit)
+        timings["short_term_ms"] = _elapsed_ms(t0)
+        profile_future = None
+        if profile is None:
+            profile_future = self._context_executor.submit(_profile_fallback)
+        else:
+            timings["profile_ms"] = 0.0
+
+        relevant_memories = []
+        timings["recall_skipped"] = False
+        if recall_future is not None:
+            remaining = None
+            if budget_ms > 0:
+                remaining = max(0.0, budget_ms / 1000 - (time.perf_counter() - start))
+            try:
+                relevant_memories = recall_future.result(timeout=remaining)
+            except FuturesTimeout:
+                # 尚在排队的召回直接取消，避免慢 ChromaDB 下跳过的召回在线程池中越积越多、拖慢后续请求
+                recall_future.cancel()
+                timings["recall_skipped"] = True
+            except Exception as e:
+                print(f"长期记忆召回失败: {e}", file=sys.stderr)
+        if profile_future is not None:
+            # 画像不受召回预算约束，必须等到
+            profile = profile_future.result()
+        timings["total_ms"] = _elapsed_ms(start)
 
         return {
             "history": history,
             "profile": profile,
             "relevant_long_term": relevant_memories or [],
             "working": working,
+            "timings": dict(timings),
         }
 
     def format_context_for_prompt(self, context: dict) -> str:
@@ -0,0 +1,172 @@
+"""
+Prompt 组装：CoT 与 ReAct 共用同一稳定前缀，按 token 预算裁剪，并统计每次调用的体积与前缀复用情况
+消息顺序（越靠前越稳定，供应商的 prompt 缓存按前缀命中）：
+1. tools（ToolCatalog 预生成载荷，CoT 也携带，tool_choice=none）
+2. 共享 system：Agent 角色 + 会话上下文（user_id）+ 用户画像
+3. 短期历史（只含最终回答，见 memory 对话压缩）
+4. 本轮变化的部分：长期记忆召回、阶段指令（CoT 输出格式 / ReAct 规则 + 行动计划）、用户问题
+5. ReAct 各步追加的 assistant / tool 消息
+超出预算时先从最早的历史开始删除，仍超出则把较早步骤的工具结果替换为省略说明（保持 tool_calls 配对）
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+from agent.token_count import count_tokens, tokenizer_name
+
+AGENT_SYSTEM_PROMPT = "你是一个智能Agent，请结合历史对话、用户画像和可用工具完成用户的任务。"
+
+COT_INSTRUCTION = (
+    "请根据用户问题，先输出详细的思考链（Chain-of-Thought），再给出行动计划（如需要哪些工具/步骤/推理）。"
+    "此阶段不要调用工具。最后用JSON格式输出：{\"thoughts\":..., \"plan\":...}"
+)
+
+REACT_INSTRUCTION = (
+    "请按“思考-行动-观察”的方式完成任务：\n"
+    "先思考(Thought)；需要外部信息时直接发起工具调用，相互独立的查询（如同时查询专利详情和企业兴趣）"
+    "请在同一轮一次性发起多个工具调用；根据工具返回的结果继续推理，信息充分后直接给出最终回答。"
+)
+
+# 每条消息的格式开销（role、分隔符等）估算
+_MESSAGE_OVERHEAD = 4
+
+_ELIDED_PREFIX = "（较早的工具结果已省略"
+
+
+def _message_tokens(message: dict) -> int:
+    tokens = _MESSAGE_OVERHEAD + count_tokens(message.get("content") or "")
+    for call in message.get("tool_calls") or []:
+        tokens += count_tokens(call["function"]["name"]) + count_tokens(call["function"]["arguments"])
+    return tokens
+
+
+def _message_digest(message: dict) -> str:
+    raw = json.dumps([message.get("role"), message.get("content"), message.get("tool_calls"),
+                      message.get("tool_call_id")], ensure_ascii=False)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def format_profile(profile) -> str:
+    if isinstance(profile, list) and profile:
+        return "【用户画像/知识】\n" + "\n".join(f"- {p}" for p in profile)
+    if isinstance(profile, str) and profile:
+        return "【用户画像】\n" + profile
+    return ""
+
+
+class Prompt:
+    """messages 可直接传给 chat.completions；history_len 条历史位于共享 system 之后，是首先裁剪的部分"""
+    __slots__ = ("messages", "history_len")
+
+    def __init__(self, messages: List[dict], history_len: int):
+        self.messages = messages
+        self.history_len = history_len
+
+
+class PromptBuilder:
+    """
+    budget: 单次调用的输入 token 预算（含 tools）；max_sessions: 记录上一次调用前缀的会话数上限（LRU）
+    """
+
+    def __init__(self, budget: int = 6000, max_sessions: int = 1024):
+        self.budget = budget
+        self.max_sessions = max_sessions
+        self._last = OrderedDict()  # session_key -> (tools 指纹, [消息摘要], [消息 token 数])
+        self._lock = threading.Lock()
+        self._totals = {"calls": 0, "prompt_tokens": 0, "reused_tokens": 0, "trimmed_messages": 0,
+                        "elided_tool_results": 0}
+
+    def build(self, query: str, history, instruction: str, profile=None, user_context: str = "",
+              notes=()) -> Prompt:
+        """history: [(ts, role, text)]；notes: 本轮附加的 system 说明（如长期记忆召回）"""
+        system = "\n\n".join(part for part in (AGENT_SYSTEM_PROMPT, user_context, format_profile(profile)) if part)
+        messages = [{"role": "system", "content": system}]
+        turns = list(history)
+        # 当前问题已写入短期历史，作为末尾的 user 消息单独给出，避免重复
+        if turns and turns[-1][1] == "user" and turns[-1][2] == query:
+            turns.pop()
+        for _, role, text in turns:
+            r = "assistant" if role == "agent" else role  # API 仅接受 assistant 而非 agent
+            if r in ("system", "assistant", "user"):
+                messages.append({"role": r, "content": text})
+        history_len = len(messages) - 1
+        for note in notes:
+            messages.append({"role": "system", "content": note})
+        messages.append({"role": "system", "content": instruction})
+        messages.append({"role": "user", "content": query})
+        return Prompt(messages, history_len)
+
+    def fit(self, prompt: Prompt, session_key: str, stage: str, tools_fingerprint: str = "",
+            tools_tokens: int = 0, budget: Optional[int] = None) -> dict:
+        """
+        调用前执行：按预算原地裁剪 prompt.messages，并与该会话上一次调用比较公共前缀。
+        返回本次调用的统计：prompt_tokens、prefix_tokens（tools + 共享 system）、reused_tokens（与上一次调用相同的前缀）、
+        cache_ratio、trimmed_messages、elided_tool_results
+        """
+        budget = budget or self.budget
+        messages = prompt.messages
+        costs = [_message_tokens(m) for m in messages]
+        total = tools_tokens + sum(costs)
+
+        trimmed = 0
+        while total > budget and prompt.history_len > 0:
+            messages.pop(1)
+            total -= costs.pop(1)
+            prompt.history_len -= 1
+            trimmed += 1
+
+        elided = 0
+        if total > budget:
+            # 最后一个带 tool_calls 的 assistant 之前的工具结果可省略
+            last_call = max((i for i, m in enumerate(messages) if m.get("tool_calls")), default=-1)
+            for i, m in enumerate(messages[:last_call]):
+                if total <= budget:
+                    break
+                if m.get("role") == "tool" and not (m.get("content") or "").startswith(_ELIDED_PREFIX):
+                    m["content"] = f"{_ELIDED_PREFIX}，原文 {len(m.get('content') or '')} 字）"
+                    new_cost = _message_tokens(m)
+                    total -= costs[i] - new_cost
+                    costs[i] = new_cost
+                    elided += 1
+
+        digests = [_message_digest(m) for m in messages]
+        with self._lock:
+            last = self._last.get(session_key)
+            reused = 0
+            if last is not None and last[0] == tools_fingerprint:
+                reused = tools_tokens
+                for digest, prev_digest, cost in zip(digests, last[1], costs):
+                    if digest != prev_digest:
+                        break
+                    reused += cost
+            self._last[session_key] = (tools_fingerprint, digests, costs)
+            self._last.move_to_end(session_key)
+            while len(self._last) > self.max_sessions:
+                self._last.popitem(last=False)
+            self._totals["calls"] += 1
+            self._totals["prompt_tokens"] += total
+            self._totals["reused_tokens"] += reused
+            self._totals["trimmed_messages"] += trimmed
+            self._totals["elided_tool_results"] += elided
+
+        return {
+            "stage": stage,
+            "prompt_tokens": total,
+            "prefix_tokens": tools_tokens + costs[0],
+            "reused_tokens": reused,
+            "cache_ratio": round(reused / total, 4) if total else 0.0,
+            "trimmed_messages": trimmed,
+            "elided_tool_results": elided,
+            "over_budget": total > budget,
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            totals = dict(self._totals)
+        totals["cache_ratio"] = round(totals["reused_tokens"] / totals["prompt_tokens"], 4) \
+            if totals["prompt_tokens"] else 0.0
+        totals["budget"] = self.budget
+        totals["tokenizer"] = tokenizer_name()
+        return totals
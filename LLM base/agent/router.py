@@ -0,0 +1,150 @@
+"""
+轻量意图路由：复用记忆模块已加载的多语种 embedding 模型（经共享向量缓存，与记忆召回共用同一次编码），对每轮输入做本地分类
+- chitchat：寒暄/致谢/能力询问，跳过 CoT 规划，且不携带工具直接回答
+- single_tool：单次查询即可回答，跳过 CoT 规划，使用按工具缓存的计划模板
+- multi_step：多步骤任务（或置信度不足），走完整 CoT+ReAct
+分类方式：与各类示例句的最大余弦相似度；记录路由决策、路由耗时与节省的规划耗时（按完整路径规划耗时的滑动平均估计）
+"""
+import re
+import time
+import threading
+
+import numpy as np
+
+CHITCHAT = "chitchat"
+SINGLE_TOOL = "single_tool"
+MULTI_STEP = "multi_step"
+
+# (路由, 工具名, 示例句)
+EXEMPLARS = [
+    (CHITCHAT, None, "你好"),
+    (CHITCHAT, None, "您好，在吗"),
+    (CHITCHAT, None, "早上好"),
+    (CHITCHAT, None, "谢谢你的帮助"),
+    (CHITCHAT, None, "好的，明白了"),
+    (CHITCHAT, None, "再见"),
+    (CHITCHAT, None, "你是谁"),
+    (CHITCHAT, None, "你能做什么"),
+    (CHITCHAT, None, "hello"),
+    (CHITCHAT, None, "thanks"),
+    (SINGLE_TOOL, "get_identification", "我是什么身份"),
+    (SINGLE_TOOL, "get_identification", "查询我的用户类型"),
+    (SINGLE_TOOL, "get_identification", "What is my user identity?"),
+    (SINGLE_TOOL, "get_patent_analysis", "查询专利CN112345678A的详情"),
+    (SINGLE_TOOL, "get_patent_analysis", "这个专利的申请人和摘要是什么"),
+    (SINGLE_TOOL, "get_patent_analysis", "帮我看一下这个专利的基本信息"),
+    (SINGLE_TOOL, "get_enterprise_interest", "有哪些企业对专利CN112345678A感兴趣"),
+    (SINGLE_TOOL, "get_enterprise_interest", "哪些公司关注这个专利"),
+    (SINGLE_TOOL, "get_rag_patent_info", "介绍一下这个专利的技术要点"),
+    (SINGLE_TOOL, "get_rag_patent_info", "这个专利有什么应用场景"),
+    (MULTI_STEP, None, "分析专利CN112345678A的技术价值并推荐可能感兴趣的企业，给出转化方案"),
+    (MULTI_STEP, None, "对比这两个专利的技术优劣并给出转化建议"),
+    (MULTI_STEP, None, "根据我的身份推荐适合的专利并制定合作计划"),
+    (MULTI_STEP, None, "先查询专利详情，再评估商业价值，最后给出定价建议"),
+]
+
+# 多步骤连接词：命中时不走单工具快路径
+_MULTI_STEP_RE = re.compile(r"然后|再|最后|并且|同时|对比|比较|以及|and then|compare", re.IGNORECASE)
+
+PLAN_TEMPLATES = {
+    "get_identification": "调用 get_identification 查询当前用户身份后直接回答",
+    "get_patent_analysis": "调用 get_patent_analysis 获取专利详情后直接回答",
+    "get_enterprise_interest": "调用 get_enterprise_interest 查询企业兴趣后直接回答",
+    "get_rag_patent_info": "调用 get_rag_patent_info 检索专利知识后直接回答",
+}
+
+
+def _normalize(x):
+    norm = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.where(norm == 0, 1, norm)
+
+
+class RouteDecision:
+    __slots__ = ("route", "tool", "score", "plan", "route_ms")
+
+    def __init__(self, route, tool, score, plan, route_ms):
+        self.route = route
+        self.tool = tool
+        self.score = score
+        self.plan = plan
+        self.route_ms = route_ms
+
+
+class IntentRouter:
+    """
+    embed_fn: texts -> 向量列表（如 MemoryStore.embed）；threshold: 快路径所需最低相似度；
+    margin: 快路径得分须高出 multi_step 的幅度；max_chars: 超过该长度一律按多步骤处理
+    """
+
+    def __init__(self, embed_fn, threshold: float = 0.6, margin: float = 0.05, max_chars: int = 80):
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.margin = margin
+        self.max_chars = max_chars
+        self._matrix = None
+        self._lock = threading.Lock()
+        self._counts = {CHITCHAT: 0, SINGLE_TOOL: 0, MULTI_STEP: 0}
+        self._plan_ms_ema = None
+        self._saved_ms = 0.0
+
+    def _exemplar_matrix(self):
+        if self._matrix is None:
+            with self._lock:
+                if self._matrix is None:
+                    self._matrix = _normalize(np.asarray(
+                        self.embed_fn([text for _, _, text in EXEMPLARS]), dtype=np.float32))
+        return self._matrix
+
+    def classify(self, query: str) -> RouteDecision:
+        start = time.perf_counter()
+        route, tool, score = MULTI_STEP, None, 0.0
+        text = (query or "").strip()
+        if text and len(text) <= self.max_chars:
+            vec = _normalize(np.asarray(self.embed_fn([text])[0], dtype=np.float32))
+            sims = self._exemplar_matrix() @ vec
+            best = int(np.argmax(sims))
+            best_route, best_tool, _ = EXEMPLARS[best]
+            best_multi = max(float(s) for s, (r, _, _) in zip(sims, EXEMPLARS) if r == MULTI_STEP)
+            score = float(sims[best])
+            if best_route != MULTI_STEP and score >= self.threshold and score - best_multi >= self.margin:
+                if not (best_route == SINGLE_TOOL and _MULTI_STEP_RE.search(text)):
+                    route, tool = best_route, best_tool
+        route_ms = (time.perf_counter() - start) * 1000
+        return RouteDecision(route, tool, round(score, 4), PLAN_TEMPLATES.get(tool, ""), round(route_ms, 2))
+
+    def record(self, decision: RouteDecision, plan_ms: float = None) -> float:
+        """
+        记录一次路由；plan_ms 为完整路径实际的 CoT 规划耗时（用于更新滑动平均）。
+        返回本次估计节省的毫秒数（快路径：平均规划耗时 - 路由耗时）
+        """
+        with self._lock:
+            self._counts[decision.route] += 1
+            if plan_ms is not None:
+                self._plan_ms_ema = plan_ms if self._plan_ms_ema is None else 0.8 * self._plan_ms_ema + 0.2 * plan_ms
+                return 0.0
+            if self._plan_ms_ema is None:
+                return 0.0
+            saved = max(0.0, self._plan_ms_ema - decision.route_ms)
+            self._saved_ms += saved
+            return saved
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "routes": dict(self._counts),
+                "plan_ms_avg": round(self._plan_ms_ema, 1) if self._plan_ms_ema is not None else None,
+                "saved_ms_total": round(self._saved_ms, 1),
+            }
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_intent_router(embed_fn, **kwargs) -> IntentRouter:
+    """进程内共享的路由器：示例句向量只计算一次"""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = IntentRouter(embed_fn, **kwargs)
+    return _router
@@ -0,0 +1,496 @@
+"""
+短期会话存储：对话轮次、工作记忆与用户画像快照，SessionStore 为后端接口
+- memory（InMemorySessionStore，默认）：进程内存储，单副本部署
+  - 每个会话两个环形缓冲（deque(maxlen)），追加 O(1)，不再整表切片重建
+  - 按 session_id 哈希分片，每片独立锁（锁分段），不同会话的读写互不阻塞
+  - 空闲超过 TTL 的会话惰性淘汰；常驻内存超过预算时按 LRU 淘汰最久未访问的会话
+- redis（RedisSessionStore）：Redis 协议共享存储，多个 agent_api / agent_server 副本共享会话上下文
+  - 每次写入（RPUSH + LTRIM + EXPIRE）与 get_bundle（历史 + 工作记忆 + 画像）各为一次流水线往返
+- get_bundle 一次取回组装上下文所需的短期数据；画像快照为长期 semantic 记忆的读穿缓存，写入画像时失效
+- stats() 导出后端类型及会话数/常驻字节/淘汰计数（memory）或往返次数/错误数（redis）
+"""
+import sys
+import json
+import time
+import zlib
+import threading
+from collections import OrderedDict, deque
+from typing import List, NamedTuple, Optional, Tuple
+
+
+class Turn(NamedTuple):
+    """一条记录（对话轮次为 role/text，工作记忆为 key/value）；NamedTuple 无实例 __dict__，可按元组解包"""
+    ts: float
+    role: str
+    text: str
+
+
+# 单条记录的固定开销估算：NamedTuple + float；role/key 多为驻留字符串，不重复计入
+_ENTRY_OVERHEAD = sys.getsizeof(Turn(0.0, "", "")) + sys.getsizeof(0.0)
+
+
+def _entry_bytes(text: str) -> int:
+    return _ENTRY_OVERHEAD + sys.getsizeof(text)
+
+
+class _Session:
+    __slots__ = ("turns", "working", "last_access", "bytes")
+
+    def __init__(self, max_turns: int, max_working: int, now: float):
+        self.turns = deque(maxlen=max_turns)
+        self.working = deque(maxlen=max_working)
+        self.last_access = now
+        self.bytes = 0
+
+
+class _Shard:
+    __slots__ = ("lock", "sessions", "bytes", "evicted_idle", "evicted_budget")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions: "OrderedDict[str, _Session]" = OrderedDict()  # 按最近访问排序，队首最久未访问
+        self.bytes = 0
+        self.evicted_idle = 0
+        self.evicted_budget = 0
+
+
+class SessionStore:
+    """
+    短期会话后端接口。Turn 的 role/text 在工作记忆中分别为 key/value。
+    profile 为画像快照（长期 semantic 记忆的列表），None 表示未缓存
+    """
+
+    backend = ""
+
+    def append_turn(self, session_id: str, role: str, text: str) -> None:
+        raise NotImplementedError
+
+    def get_turns(self, session_id: str, limit: Optional[int] = None) -> List[Turn]:
+        raise NotImplementedError
+
+    def clear_turns(self, session_id: str) -> None:
+        raise NotImplementedError
+
+    def drop_turns_until(self, session_id: str, ts: float) -> int:
+        """删除时间戳不晚于 ts 的最早若干条对话（压缩后移出短期历史），返回删除条数"""
+        raise NotImplementedError
+
+    def append_working(self, session_id: str, key: str, value: str) -> None:
+        raise NotImplementedError
+
+    def get_working(self, session_id: str) -> List[Turn]:
+        raise NotImplementedError
+
+    def clear_working(self, session_id: str) -> None:
+        raise NotImplementedError
+
+    def get_bundle(self, session_id: str, user_id: str,
+                   limit: Optional[int] = None) -> Tuple[List[Turn], List[Turn], Optional[list]]:
+        """一次取回 (最近 limit 条对话, 工作记忆, 画像快照)"""
+        raise NotImplementedError
+
+    def set_profile(self, user_id: str, profile: list) -> None:
+        raise NotImplementedError
+
+    def invalidate_profile(self, user_id: str) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    max_turns / max_working: 每个会话保留的对话轮次 / 工作记忆条数；
+    ttl: 会话空闲淘汰时间（秒）；memory_budget_bytes: 全部会话的估算内存上限，均分到各分片；
+    profile_ttl: 画像快照有效期（秒）；sweep_interval: 写入路径上顺带全量清理空闲会话的最小间隔（秒），
+    避免长期无写入的分片里残留过期会话
+    """
+
+    backend = "memory"
+
+    def __init__(self, max_turns: int = 20, max_working: int = 10, ttl: float = 3600.0,
+                 memory_budget_bytes: int = 64 << 20, shards: int = 16, profile_ttl: float = 300.0,
+                 max_profiles: int = 10000, sweep_interval: float = 60.0):
+        self.max_turns = max_turns
+        self.max_working = max_working
+        self.ttl = ttl
+        self.memory_budget_bytes = memory_budget_bytes
+        self._shards = [_Shard() for _ in range(max(1, shards))]
+        self._shard_budget = memory_budget_bytes // len(self._shards)
+        self.profile_ttl = profile_ttl
+        self.max_profiles = max_profiles
+        self._profiles: "OrderedDict[str, tuple]" = OrderedDict()  # user_id -> (写入时间, 画像列表)
+        self._profile_lock = threading.Lock()
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.time() + sweep_interval
+        self._sweep_lock = threading.Lock()
+
+    def _shard(self, session_id: str) -> _Shard:
+        return self._shards[zlib.crc32(session_id.encode("utf-8")) % len(self._shards)]
+
+    # ---------- 分片内部操作（调用方持有分片锁） ----------
+
+    def _drop(self, shard: _Shard, session_id: str):
+        session = shard.sessions.pop(session_id)
+        shard.bytes -= session.bytes
+
+    def _get(self, shard: _Shard, session_id: str, now: float, create: bool) -> Optional[_Session]:
+        session = shard.sessions.get(session_id)
+        if session is not None and now - session.last_access > self.ttl:
+            self._drop(shard, session_id)
+            shard.evicted_idle += 1
+            session = None
+        if session is None:
+            if not create:
+                return None
+            session = shard.sessions[session_id] = _Session(self.max_turns, self.max_working, now)
+        else:
+            shard.sessions.move_to_end(session_id)
+        session.last_access = now
+        return session
+
+    def _append(self, shard: _Shard, session: _Session, buf: deque, entry: Turn):
+        size = _entry_bytes(entry.text)
+        if len(buf) == buf.maxlen:
+            evicted = _entry_bytes(buf[0].text)
+            session.bytes -= evicted
+            shard.bytes -= evicted
+        buf.append(entry)
+        session.bytes += size
+        shard.bytes += size
+
+    def _enforce(self, shard: _Shard, now: float, keep: str):
+        """淘汰队首的空闲会话；仍超预算时继续按 LRU 淘汰（不淘汰当前写入的会话）"""
+        while shard.sessions:
+            sid, session = next(iter(shard.sessions.items()))
+            if now - session.last_access > self.ttl:
+                self._drop(shard, sid)
+                shard.evicted_idle += 1
+            elif shard.bytes > self._shard_budget and sid != keep:
+                self._drop(shard, sid)
+                shard.evicted_budget += 1
+            else:
+                break
+
+    # ---------- 对话轮次 ----------
+
+    def append_turn(self, session_id: str, role: str, text: str) -> None:
+        shard = self._shard(session_id)
+        now = time.time()
+        with shard.lock:
+            session = self._get(shard, session_id, now, create=True)
+            self._append(shard, session, session.turns, Turn(now, role, text))
+            self._enforce(shard, now, keep=session_id)
+        self._maybe_sweep(now)
+
+    @staticmethod
+    def _tail(buf: deque, limit: Optional[int]) -> List[Turn]:
+        if limit is not None and limit < len(buf):
+            return [buf[i] for i in range(len(buf) - limit, len(buf))]
+        return list(buf)
+
+    def get_turns(self, session_id: str, limit: Optional[int] = None) -> List[Turn]:
+        shard = self._shard(session_id)
+        with shard.lock:
+            session = self._get(shard, session_id, time.time(), create=False)
+            return self._tail(session.turns, limit) if session is not None else []
+
+    def clear_turns(self, session_id: str) -> None:
+        self._clear(session_id, "turns")
+
+    def drop_turns_until(self, session_id: str, ts: float) -> int:
+        shard = self._shard(session_id)
+        with shard.lock:
+            session = shard.sessions.get(session_id)
+            if session is None:
+                return 0
+            removed = 0
+            while session.turns and session.turns[0].ts <= ts:
+                freed = _entry_bytes(session.turns.popleft().text)
+                session.bytes -= freed
+                shard.bytes -= freed
+                removed += 1
+            return removed
+
+    # ---------- 工作记忆 ----------
+
+    def append_working(self, session_id: str, key: str, value: str) -> None:
+        shard = self._shard(session_id)
+        now = time.time()
+        with shard.lock:
+            session = self._get(shard, session_id, now, create=True)
+            self._append(shard, session, session.working, Turn(now, key, value))
+            self._enforce(shard, now, keep=session_id)
+        self._maybe_sweep(now)
+
+    def get_working(self, session_id: str) -> List[Turn]:
+        shard = self._shard(session_id)
+        with shard.lock:
+            session = self._get(shard, session_id, time.time(), create=False)
+            return list(session.working) if session is not None else []
+
+    def clear_working(self, session_id: str) -> None:
+        self._clear(session_id, "working")
+
+    def _clear(self, session_id: str, field: str):
+        shard = self._shard(session_id)
+        with shard.lock:
+            session = shard.sessions.get(session_id)
+            if session is None:
+                return
+            buf = getattr(session, field)
+            freed = sum(_entry_bytes(e.text) for e in buf)
+            buf.clear()
+            session.bytes -= freed
+            shard.bytes -= freed
+            if not session.turns and not session.working:
+                self._drop(shard, session_id)
+
+    # ---------- 组装上下文 ----------
+
+    def get_bundle(self, session_id: str, user_id: str,
+                   limit: Optional[int] = None) -> Tuple[List[Turn], List[Turn], Optional[list]]:
+        shard = self._shard(session_id)
+        with shard.lock:
+            session = self._get(shard, session_id, time.time(), create=False)
+            turns = self._tail(session.turns, limit) if session is not None else []
+            working = list(session.working) if session is not None else []
+        with self._profile_lock:
+            cached = self._profiles.get(user_id)
+            profile = None
+            if cached is not None and time.time() - cached[0] <= self.profile_ttl:
+                self._profiles.move_to_end(user_id)
+                profile = list(cached[1])
+        return turns, working, profile
+
+    def set_profile(self, user_id: str, profile: list) -> None:
+        with self._profile_lock:
+            self._profiles[user_id] = (time.time(), list(profile))
+            self._profiles.move_to_end(user_id)
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+
+    def invalidate_profile(self, user_id: str) -> None:
+        with self._profile_lock:
+            self._profiles.pop(user_id, None)
+
+    # ---------- 维护与指标 ----------
+
+    def sweep(self) -> int:
+        """主动清理所有分片中的空闲会话，返回淘汰数"""
+        now = time.time()
+        removed = 0
+        for shard in self._shards:
+            with shard.lock:
+                # 会话按最近访问排序：从队首弹出，遇到未过期的会话即停
+                while shard.sessions:
+                    sid, session = next(iter(shard.sessions.items()))
+                    if now - session.last_access <= self.ttl:
+                        break
+                    self._drop(shard, sid)
+                    shard.evicted_idle += 1
+                    removed += 1
+        return removed
+
+    def _maybe_sweep(self, now: float):
+        """写入路径调用：距上次清理超过 sweep_interval 时由一个写入者执行 sweep，其余直接返回"""
+        if now < self._next_sweep or not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            if now >= self._next_sweep:
+                self._next_sweep = now + self.sweep_interval
+                self.sweep()
+        finally:
+            self._sweep_lock.release()
+
+    def stats(self) -> dict:
+        sessions = turns = resident = idle = budget = 0
+        for shard in self._shards:
+            with shard.lock:
+                sessions += len(shard.sessions)
+                turns += sum(len(s.turns) for s in shard.sessions.values())
+                resident += shard.bytes
+                idle += shard.evicted_idle
+                budget += shard.evicted_budget
+        with self._profile_lock:
+            profiles = len(self._profiles)
+        return {
+            "backend": self.backend,
+            "sessions": sessions,
+            "turns": turns,
+            "resident_bytes": resident,
+            "budget_bytes": self.memory_budget_bytes,
+            "evicted_idle": idle,
+            "evicted_budget": budget,
+            "shards": len(self._shards),
+            "profiles": profiles,
+        }
+
+
+class RedisSessionStore(SessionStore):
+    """
+    client: redis.Redis 兼容客户端（如 redis.Redis.from_url，或测试用 fakeredis.FakeRedis）。
+    键：{prefix}turns:{session_id} / {prefix}working:{session_id} 为 JSON 记录的列表，{prefix}profile:{user_id} 为 JSON 列表；
+    会话键每次访问续期 ttl 秒，由 Redis 过期淘汰（内存上限交给服务端 maxmemory 策略）。
+    Redis 不可用时读返回空、写丢弃并计数，不影响对话本身
+    """
+
+    backend = "redis"
+
+    def __init__(self, client, max_turns: int = 20, max_working: int = 10, ttl: float = 3600.0,
+                 profile_ttl: float = 300.0, prefix: str = "agent:session:"):
+        self.client = client
+        self.max_turns = max_turns
+        self.max_working = max_working
+        self.ttl = max(1, int(ttl))
+        self.profile_ttl = max(1, int(profile_ttl))
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {"round_trips": 0, "commands": 0, "errors": 0}
+
+    def _turns_key(self, session_id: str) -> str:
+        return f"{self.prefix}turns:{session_id}"
+
+    def _working_key(self, session_id: str) -> str:
+        return f"{self.prefix}working:{session_id}"
+
+    def _profile_key(self, user_id: str) -> str:
+        return f"{self.prefix}profile:{user_id}"
+
+    def _execute(self, build) -> Optional[list]:
+        """build(pipe) 向流水线追加命令；一次往返执行，失败返回 None"""
+        pipe = self.client.pipeline(transaction=False)
+        build(pipe)
+        n = len(pipe)
+        try:
+            result = pipe.execute()
+        except Exception as e:
+            with self._lock:
+                self._counters["errors"] += 1
+            print(f"短期记忆后端访问失败: {e}", file=sys.stderr)
+            return None
+        with self._lock:
+            self._counters["round_trips"] += 1
+            self._counters["commands"] += n
+        return result
+
+    @staticmethod
+    def _decode(items) -> List[Turn]:
+        return [Turn(*json.loads(item)) for item in items or []]
+
+    def _append(self, key: str, maxlen: int, first: str, second: str):
+        record = json.dumps([time.time(), first, second], ensure_ascii=False)
+
+        def build(pipe):
+            pipe.rpush(key, record)
+            pipe.ltrim(key, -maxlen, -1)
+            pipe.expire(key, self.ttl)
+        self._execute(build)
+
+    def _range(self, key: str, limit: Optional[int]) -> List[Turn]:
+        start = -limit if limit else 0
+
+        def build(pipe):
+            pipe.lrange(key, start, -1)
+            pipe.expire(key, self.ttl)
+        result = self._execute(build)
+        return self._decode(result[0]) if result else []
+
+    def _delete(self, key: str):
+        self._execute(lambda pipe: pipe.delete(key))
+
+    def append_turn(self, session_id: str, role: str, text: str) -> None:
+        self._append(self._turns_key(session_id), self.max_turns, role, text)
+
+    def get_turns(self, session_id: str, limit: Optional[int] = None) -> List[Turn]:
+        return self._range(self._turns_key(session_id), limit)
+
+    def clear_turns(self, session_id: str) -> None:
+        self._delete(self._turns_key(session_id))
+
+    def drop_turns_until(self, session_id: str, ts: float) -> int:
+        """WATCH + MULTI 乐观事务：读取与裁剪之间若有新的写入则重试"""
+        from redis.exceptions import WatchError
+
+        key = self._turns_key(session_id)
+        for _ in range(3):
+            try:
+                with self.client.pipeline() as pipe:
+                    pipe.watch(key)
+                    removed = 0
+                    for item in pipe.lrange(key, 0, -1):
+                        if json.loads(item)[0] > ts:
+                            break
+                        removed += 1
+                    if removed:
+                        pipe.multi()
+                        pipe.ltrim(key, removed, -1)
+                        pipe.execute()
+                with self._lock:
+                    self._counters["round_trips"] += 2 if removed else 1
+                    self._counters["commands"] += 3 if removed else 1
+                return removed
+            except WatchError:
+                continue
+            except Exception as e:
+                with self._lock:
+                    self._counters["errors"] += 1
+                print(f"短期记忆后端访问失败: {e}", file=sys.stderr)
+                return 0
+        return 0
+
+    def append_working(self, session_id: str, key: str, value: str) -> None:
+        self._append(self._working_key(session_id), self.max_working, key, value)
+
+    def get_working(self, session_id: str) -> List[Turn]:
+        return self._range(self._working_key(session_id), None)
+
+    def clear_working(self, session_id: str) -> None:
+        self._delete(self._working_key(session_id))
+
+    def get_bundle(self, session_id: str, user_id: str,
+                   limit: Optional[int] = None) -> Tuple[List[Turn], List[Turn], Optional[list]]:
+        turns_key, working_key = self._turns_key(session_id), self._working_key(session_id)
+
+        def build(pipe):
+            pipe.lrange(turns_key, -limit if limit else 0, -1)
+            pipe.lrange(working_key, 0, -1)
+            pipe.get(self._profile_key(user_id))
+            pipe.expire(turns_key, self.ttl)
+            pipe.expire(working_key, self.ttl)
+        result = self._execute(build)
+        if result is None:
+            return [], [], None
+        profile = json.loads(result[2]) if result[2] is not None else None
+        return self._decode(result[0]), self._decode(result[1]), profile
+
+    def set_profile(self, user_id: str, profile: list) -> None:
+        data = json.dumps(list(profile), ensure_ascii=False)
+        self._execute(lambda pipe: pipe.set(self._profile_key(user_id), data, ex=self.profile_ttl))
+
+    def invalidate_profile(self, user_id: str) -> None:
+        self._delete(self._profile_key(user_id))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters, backend=self.backend)
+
+
+def create_session_store(backend: str = "memory", redis_url: str = "", redis_timeout: float = 0.5,
+                         redis_connect_timeout: float = 0.5, **kwargs) -> SessionStore:
+    """
+    backend: memory | redis；redis 需安装 redis 包，kwargs 中的 memory_budget_bytes / shards 仅对 memory 生效；
+    redis_timeout / redis_connect_timeout: 单次读写与建连超时（秒）
+    """
+    if backend == "redis":
+        import redis
+
+        kwargs.pop("memory_budget_bytes", None)
+        kwargs.pop("shards", None)
+        client = redis.Redis.from_url(redis_url, socket_timeout=redis_timeout,
+                                      socket_connect_timeout=redis_connect_timeout)
+        return RedisSessionStore(client, **kwargs)
+    if backend != "memory":
+        raise ValueError(f"未知的短期记忆后端: {backend}")
+    return InMemorySessionStore(**kwargs)
@@ -0,0 +1,48 @@
+"""
+本地 token 计数：不调用模型服务，用于记忆压缩预算与 prompt 体积统计
+- 配置 TOKENIZER_PATH（如 Qwen 的 tokenizer.json）时使用 HuggingFace tokenizers 本地分词，与线上计费口径一致
+- 未配置或加载失败时退化为估算：中日韩字符及全角标点按 1 token 计，
+  其余字符（英文、数字、空白、半角标点）按约 4 字符 1 token 计，只用于预算与趋势对比
+"""
+import os
+import re
+import sys
+
+try:
+    from config import TOKENIZER_PATH
+except ImportError:
+    TOKENIZER_PATH = os.getenv("TOKENIZER_PATH", "")
+
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+_tokenizer = None
+_tokenizer_loaded = False
+
+
+def _get_tokenizer():
+    global _tokenizer, _tokenizer_loaded
+    if not _tokenizer_loaded:
+        _tokenizer_loaded = True
+        if TOKENIZER_PATH:
+            try:
+                from tokenizers import Tokenizer
+
+                _tokenizer = Tokenizer.from_file(TOKENIZER_PATH)
+            except Exception as e:
+                print(f"加载本地 tokenizer 失败，改用估算: {e}", file=sys.stderr)
+    return _tokenizer
+
+
+def tokenizer_name() -> str:
+    return os.path.basename(TOKENIZER_PATH) if _get_tokenizer() is not None else "estimate"
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
@@ -0,0 +1,128 @@
+"""
+MCP 工具读穿缓存：按 key（如 patent_no）缓存后端查询结果
+- 每个工具独立 TTL：新鲜期内直接命中；过期后 stale_ttl 窗口内先返回旧值，同时后台刷新（stale-while-revalidate）
+- LRU 限制条目数；只缓存成功结果
+- 支持按 key 或整体失效（业务中台数据变更时调用），命中率等计数通过 stats() 导出
+- 失效按 key 代际隔离：加载开始时记下代际，失效后才返回的旧加载结果不会写回缓存
+"""
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+
+class _Entry:
+    __slots__ = ("value", "fetched_at")
+
+    def __init__(self, value, fetched_at):
+        self.value = value
+        self.fetched_at = fetched_at
+
+
+class ReadThroughCache:
+    """
+    loader: 无参异步函数，返回 (value, cacheable)；cacheable=False（如后端报错）时结果不入缓存
+    """
+
+    def __init__(self, name: str, ttl: float, stale_ttl: float = 0.0, max_entries: int = 2048):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._refreshing = set()
+        self._tasks = set()  # 后台刷新任务的强引用（event loop 只持有弱引用）
+        self._epoch = 0  # 整体失效时递增
+        self._generations = {}  # key -> 按 key 失效次数
+        self._lock = threading.Lock()  # inprocess 传输下多个 event loop 线程共享同一缓存
+        self._counters = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+
+    def _generation(self, key):
+        """调用方需持有 _lock"""
+        return self._epoch, self._generations.get(key, 0)
+
+    def _store(self, key, value, generation) -> bool:
+        """加载期间 key 被失效过（代际变化）时丢弃结果，返回是否写入"""
+        with self._lock:
+            if self._generation(key) != generation:
+                return False
+            self._entries[key] = _Entry(value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+            return True
+
+    async def get(self, key: str, loader: Callable[[], Awaitable[tuple]]):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = now - entry.fetched_at
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return entry.value
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self._counters["stale_hits"] += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        task = asyncio.get_running_loop().create_task(
+                            self._refresh(key, loader, self._generation(key)))
+                        self._tasks.add(task)
+                        task.add_done_callback(self._tasks.discard)
+                    return entry.value
+            self._counters["misses"] += 1
+            generation = self._generation(key)
+        value, cacheable = await loader()
+        if cacheable:
+            self._store(key, value, generation)
+        return value
+
+    async def _refresh(self, key, loader, generation):
+        try:
+            value, cacheable = await loader()
+            if cacheable and self._store(key, value, generation):
+                with self._lock:
+                    self._counters["refreshes"] += 1
+        except Exception:
+            pass  # 刷新失败时保留旧值，过了 stale 窗口后由前台请求重新加载
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def invalidate(self, key: str = None) -> int:
+        """key 为空时清空整个缓存；返回删除的条目数"""
+        with self._lock:
+            if key:
+                removed = 1 if self._entries.pop(key, None) is not None else 0
+                self._generations[key] = self._generations.get(key, 0) + 1
+                if len(self._generations) > self.max_entries:
+                    # 代际表有界：整体换代后清空（只会让在途加载的结果不入缓存）
+                    self._epoch += 1
+                    self._generations.clear()
+            else:
+                removed = len(self._entries)
+                self._entries.clear()
+                self._epoch += 1
+                self._generations.clear()
+            self._counters["invalidations"] += removed
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._entries)
+        hits = stats["hits"] + stats["stale_hits"]
+        total = hits + stats["misses"]
+        stats["hit_rate"] = round(hits / total, 4) if total else 0.0
+        return stats
@@ -0,0 +1,96 @@
+"""
+MCP 工具目录缓存：连接时拉取一次 list_tools，并预先生成 OpenAI function-calling 的 tools 载荷
+- 仅在收到 notifications/tools/list_changed 或重连时刷新，每轮对话不再调用 list_tools
+- 工具集合变化（按载荷指纹判断）时 version 自增，便于日志与下游缓存判断是否需要失效
+- admin_ 前缀的内部管理工具（如缓存失效）只供运行时调用，不进入 LLM 的工具列表
+"""
+import asyncio
+import hashlib
+import json
+
+import mcp.types as types
+
+from agent.token_count import count_tokens
+
+INTERNAL_TOOL_PREFIX = "admin_"
+
+
+def to_openai_tools(tools) -> list:
+    """MCP Tool 列表 -> OpenAI tools 载荷"""
+    return [
+        {
+            "type": "function",
+            "function": {
+                "name": tool.name,
+                "description": tool.description,
+                "parameters": tool.inputSchema
+            }
+        }
+        for tool in tools
+    ]
+
+
+def is_tool_list_changed(message) -> bool:
+    """判断 ClientSession message_handler 收到的消息是否为工具列表变更通知"""
+    return isinstance(message, types.ServerNotification) and \
+        isinstance(message.root, types.ToolListChangedNotification)
+
+
+class ToolCatalog:
+    """
+    tools: MCP Tool 列表；payload: 预生成的 OpenAI tools（只读，直接传给 chat.completions）；
+    payload_json: 规范化序列化结果，fingerprint 为其哈希；payload_tokens: 载荷的本地 token 数（prompt 预算计入）
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.tools = []
+        self.names = frozenset()
+        self.payload = []
+        self.payload_json = "[]"
+        self.fingerprint = ""
+        self.payload_tokens = 0
+        self.stale = True
+        self.refreshes = 0
+        self._lock = asyncio.Lock()
+
+    def mark_stale(self):
+        self.stale = True
+
+    async def refresh(self, session) -> bool:
+        """重新拉取工具列表；返回工具集合是否发生变化"""
+        response = await session.list_tools()
+        tools = [tool for tool in response.tools if not tool.name.startswith(INTERNAL_TOOL_PREFIX)]
+        payload = to_openai_tools(tools)
+        payload_json = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        fingerprint = hashlib.sha256(payload_json.encode("utf-8")).hexdigest()[:16]
+        changed = fingerprint != self.fingerprint
+        if changed:
+            self.tools = tools
+            self.names = frozenset(tool.name for tool in self.tools)
+            self.payload = payload
+            self.payload_json = payload_json
+            self.fingerprint = fingerprint
+            self.payload_tokens = count_tokens(payload_json)
+            self.version += 1
+        self.stale = False
+        self.refreshes += 1
+        return changed
+
+    async def get(self, session) -> list:
+        """返回缓存的 tools 载荷；收到变更通知后的首次访问才会刷新"""
+        if self.stale:
+            async with self._lock:
+                if self.stale:
+                    await self.refresh(session)
+        return self.payload
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "fingerprint": self.fingerprint,
+            "payload_tokens": self.payload_tokens,
+            "tools": sorted(self.names),
+            "refreshes": self.refreshes,
+            "stale": self.stale,
+        }
@@ -4,6 +4,7 @@ FastAPI 接口：独立启动 LLM/Agent 服务，无需 Java 后端
 """
 import os
 import sys
+import json
 from pathlib import Path
 
 # 确保项目根在 path 中
@@ -11,6 +12,7 @@ _root = Path(__file__).resolve().parent
 sys.path.insert(0, str(_root))
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 
@@ -45,8 +47,16 @@ class ChatResponse(BaseModel):
 
 @app.get("/health")
 def health():
-    """健康检查"""
-    return {"status": "ok", "service": "patent-agent"}
+    """健康检查（含 RAG 检索引擎就绪状态、Agent 工作池排队深度与利用率、工具缓存命中率）"""
+    try:
+        rag = runtime.rag_status()
+    except Exception as e:
+        rag = {"ready": False, "error": str(e)}
+    try:
+        tool_cache = runtime.tool_cache_stats()
+    except Exception as e:
+        tool_cache = {"error": str(e)}
+    return {"status": "ok", "service": "patent-agent", "rag": rag, "pool": runtime.stats(), "tool_cache": tool_cache}
 
 
 @app.post("/chat", response_model=ChatResponse)
@@ -69,6 +79,42 @@ def chat(req: ChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/chat/stream")
+def chat_stream(req: ChatRequest):
+    """
+    流式 Agent 对话接口（text/event-stream）
+    逐条推送 token / thought / plan / tool_call / observation / final 事件，
+    final 事件的 ttft_ms 为首 token 延迟
+    """
+    def sse():
+        try:
+            for event in runtime.stream(
+                req.query,
+                user_id=req.user_id or "default_user",
+                mode=req.mode or "cot+react",
+                timeout=120.0,
+            ):
+                yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'type': 'error', 'content': str(e)}, ensure_ascii=False)}\n\n"
+
+    # StreamingResponse 在线程池中迭代同步生成器，客户端读取慢时生成器不会被继续拉取
+    return StreamingResponse(sse(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.post("/cache/invalidate")
+def cache_invalidate(patent_no: Optional[str] = "", tool: Optional[str] = ""):
+    """
+    业务中台数据变更后失效工具缓存
+    POST /cache/invalidate?patent_no=CN123&tool=get_patent_analysis（参数为空表示全部）
+    """
+    try:
+        return {"invalidated": runtime.invalidate_tool_cache(patent_no or "", tool or "")}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/chat/simple")
 def chat_simple(query: str, user_id: Optional[str] = None, mode: Optional[str] = "cot+react"):
     """
@@ -92,5 +138,6 @@ if __name__ == "__main__":
     port = int(os.getenv("AGENT_API_PORT", "8000"))
     print(f"Agent API: http://127.0.0.1:{port}")
     print(f"Postman 测试: POST http://127.0.0.1:{port}/chat")
+    print(f"流式接口: POST http://127.0.0.1:{port}/chat/stream（text/event-stream）")
     print('  Body JSON: {"query": "你好", "user_id": "test_user", "mode": "cot+react"}')
     uvicorn.run(app, host="0.0.0.0", port=port)
@@ -1,52 +1,306 @@
 import grpc
 from concurrent import futures
 import asyncio
+import logging
+import sys
 import threading
+import time
+import zlib
+from collections import deque
 
 import rag_pb2
 import rag_pb2_grpc
-from agent.ib_agent import IBAgent
+from agent.ib_agent import IBAgent, llm_slots
+from agent.memory import memory_store
+from rag.embedding_cache import embedding_cache
+from config import AGENT_POOL_SIZE, AGENT_LOOP_THREADS, MCP_TRANSPORT
+
+logger = logging.getLogger(__name__)
 
 
 # =========================
 # Async Agent Runtime
 # =========================
-class AgentRuntime:
-    """
-    独立线程 + 常驻 asyncio event loop
-    所有 Agent / MCP 调用都在这里跑
-    """
-    def __init__(self, mcp_server_script: str):
-        self.loop = asyncio.new_event_loop()
-        self.thread = threading.Thread(
-            target=self._run_loop,
-            daemon=True
-        )
-        self.agent = IBAgent(user_id="default_user")
+class EventLoopThread:
+    """独立线程 + 常驻 asyncio event loop"""
 
+    def __init__(self, name: str):
+        self.name = name
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run_loop, name=name, daemon=True)
         self.thread.start()
 
-        # 在 event loop 线程中初始化 MCP 连接
-        fut = asyncio.run_coroutine_threadsafe(
-            self.agent.connect_to_server(mcp_server_script),
-            self.loop
-        )
-        fut.result()  # 启动阶段允许阻塞
-
     def _run_loop(self):
         asyncio.set_event_loop(self.loop)
         self.loop.run_forever()
 
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+
+class AgentWorker:
+    """
+    池中的一个 Agent：独立的 IBAgent + MCP 会话，绑定在某个 event loop 线程上。
+    不同用户的请求在同一 worker 上并发执行；同一用户的请求经 per-user 锁按提交顺序串行。
+    """
+
+    def __init__(self, index: int, loop_thread: EventLoopThread):
+        self.index = index
+        self.loop_thread = loop_thread
+        self.agent = IBAgent(user_id="default_user")
+        self._user_locks = {}  # user_id -> [asyncio.Lock, 引用数]，仅在 loop 线程内访问
+        self._counter_lock = threading.Lock()
+        self.pending = 0  # 已提交未完成（含排队与执行中）
+        self.active = 0  # 执行中
+        self.completed = 0
+        self._busy_total = 0.0
+        self._busy_since = None
+        self._started_at = time.perf_counter()
+
+    def _submitted(self):
+        """在 loop 上开始执行时计入 pending：未开始就被取消的协程不会进入 run，也就不会漏减"""
+        with self._counter_lock:
+            self.pending += 1
+
+    def _enter(self):
+        with self._counter_lock:
+            if self.active == 0:
+                self._busy_since = time.perf_counter()
+            self.active += 1
+
+    def _finish(self, entered: bool):
+        """请求结束（含排队中被取消）：pending 必减，执行过的才计入 active/completed"""
+        with self._counter_lock:
+            self.pending -= 1
+            if not entered:
+                return
+            self.active -= 1
+            self.completed += 1
+            if self.active == 0:
+                self._busy_total += time.perf_counter() - self._busy_since
+                self._busy_since = None
+
+    def _acquire_slot(self, user_id: str):
+        slot = self._user_locks.setdefault(user_id, [asyncio.Lock(), 0])
+        slot[1] += 1
+        return slot
+
+    def _release_slot(self, user_id: str, slot):
+        slot[1] -= 1
+        if slot[1] == 0:
+            self._user_locks.pop(user_id, None)
+
+    async def run(self, user_id: str, coro_factory):
+        """在该用户的顺序锁内执行 coro_factory()"""
+        self._submitted()
+        slot = self._acquire_slot(user_id)
+        entered = False
+        try:
+            async with slot[0]:
+                self._enter()
+                entered = True
+                return await coro_factory()
+        finally:
+            self._finish(entered)
+            self._release_slot(user_id, slot)
+
+    async def run_stream(self, user_id: str, agen_factory):
+        """流式版本：整个事件流在该用户的顺序锁内产出"""
+        self._submitted()
+        slot = self._acquire_slot(user_id)
+        entered = False
+        try:
+            async with slot[0]:
+                self._enter()
+                entered = True
+                agen = agen_factory()
+                try:
+                    async for event in agen:
+                        yield event
+                finally:
+                    await agen.aclose()
+        finally:
+            self._finish(entered)
+            self._release_slot(user_id, slot)
+
+    def stats(self) -> dict:
+        with self._counter_lock:
+            now = time.perf_counter()
+            busy = self._busy_total + (now - self._busy_since if self._busy_since is not None else 0.0)
+            elapsed = now - self._started_at
+            return {
+                "index": self.index,
+                "loop": self.loop_thread.name,
+                "queue_depth": self.pending - self.active,
+                "active": self.active,
+                "completed": self.completed,
+                "utilization": round(busy / elapsed, 4) if elapsed else 0.0,
+                "tools_version": self.agent.tool_catalog.version,
+                "prompt": self.agent.prompt_builder.stats(),
+            }
+
+
+class LatencyWindow:
+    """最近 size 次观测的滑动窗口，stats() 给出分位数（毫秒）；线程安全"""
+
+    def __init__(self, size: int = 1024):
+        self._samples = deque(maxlen=size)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def record(self, ms: float):
+        with self._lock:
+            self._samples.append(ms)
+            self._count += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            samples = sorted(self._samples)
+            count = self._count
+        if not samples:
+            return {"count": count, "p50": None, "p90": None, "p99": None, "max": None}
+
+        def pct(q):
+            return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+        return {"count": count, "p50": pct(0.5), "p90": pct(0.9), "p99": pct(0.99), "max": samples[-1]}
+
+
+class AgentRuntime:
+    """
+    Agent 工作池：pool_size 个 IBAgent（各自独立的 MCP 会话），
+    轮流分布在 loop_threads 个 event loop 线程上，所有 Agent / MCP 调用都在这些线程里跑。
+    MCP_TRANSPORT=auto 且 pool_size > 1 时使用 inprocess 传输：stdio 下每个 Agent 一个子进程，
+    各自加载一份 RAG 引擎（3 个 embedding 模型 + Chroma + BM25）与缓存，常驻内存成倍增长且缓存命中率被摊薄。
+    请求按 user_id 的稳定哈希路由到固定 worker，同一会话内保持顺序，不同用户并行。
+    """
+    def __init__(self, mcp_server_script: str, pool_size: int = None, loop_threads: int = None):
+        pool_size = max(1, pool_size or AGENT_POOL_SIZE)
+        loop_threads = max(1, min(loop_threads or AGENT_LOOP_THREADS, pool_size))
+        self.loops = [EventLoopThread(f"agent-loop-{i}") for i in range(loop_threads)]
+        self.workers = [AgentWorker(i, self.loops[i % loop_threads]) for i in range(pool_size)]
+        self.ttft = LatencyWindow()  # 流式请求的首 token 延迟
+
+        transport = MCP_TRANSPORT
+        if transport == "auto":
+            transport = "inprocess" if pool_size > 1 else "stdio"
+
+        # 在各自的 event loop 线程中并行初始化 MCP 连接
+        futs = [
+            w.loop_thread.submit(w.agent.connect_to_server(mcp_server_script, transport=transport))
+            for w in self.workers
+        ]
+        for fut in futs:
+            fut.result()  # 启动阶段允许阻塞
+        print(f"Agent pool started: workers={pool_size} loop_threads={loop_threads} transport={transport}")
+
+    def _route(self, user_id: str) -> AgentWorker:
+        return self.workers[zlib.crc32((user_id or "").encode("utf-8")) % len(self.workers)]
+
     def process(self, query: str, user_id: str = "default_user", mode: str = "cot+react", timeout: float = 60.0) -> str:
         """
-        线程安全地提交 coroutine 给 asyncio loop
+        线程安全地把请求提交给该用户所属 worker 的 event loop
+        """
+        worker = self._route(user_id)
+        fut = worker.loop_thread.submit(
+            worker.run(user_id, lambda: worker.agent.process_query(query, user_id=user_id, mode=mode))
+        )
+        try:
+            return fut.result(timeout=timeout)
+        except futures.TimeoutError:
+            # 超时后取消，避免占住该用户的顺序锁
+            fut.cancel()
+            raise
+
+    def stream(self, query: str, user_id: str = "default_user", mode: str = "cot+react", timeout: float = 60.0):
+        """
+        同步生成器：逐条产出 Agent 事件（token/thought/plan/tool_call/observation/final）。
+        每次只向 event loop 拉取一条事件，消费者不拉取时 Agent 在有界队列处等待（背压）；
+        timeout 为相邻两条事件之间的最长等待。
         """
-        fut = asyncio.run_coroutine_threadsafe(
-            self.agent.process_query(query, user_id=user_id, mode=mode),
-            self.loop
+        worker = self._route(user_id)
+        agen = worker.run_stream(
+            user_id, lambda: worker.agent.process_query_stream(query, user_id=user_id, mode=mode)
         )
+        try:
+            while True:
+                # 超时在 loop 内判定：wait_for 取消挂起的 __anext__ 并等其结束后才抛出，生成器不会停在运行中
+                fut = worker.loop_thread.submit(asyncio.wait_for(agen.__anext__(), timeout))
+                try:
+                    event = fut.result()
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise futures.TimeoutError(f"no agent event within {timeout}s") from None
+                if event["type"] == "final":
+                    if event.get("ttft_ms") is not None:
+                        self.ttft.record(event["ttft_ms"])
+                    logger.debug("Agent stream finished: user_id=%s worker=%d ttft_ms=%s", user_id, worker.index,
+                                 event.get("ttft_ms"))
+                yield event
+        finally:
+            # 客户端提前断开或超时时关闭生成器并等待其完成：取消后台推理任务、释放顺序锁与计数
+            try:
+                worker.loop_thread.submit(agen.aclose()).result(timeout=timeout)
+            except Exception as e:
+                print(f"Agent stream close failed: user_id={user_id} worker={worker.index} error={e!r}",
+                      file=sys.stderr)
+
+    def rag_status(self, timeout: float = 2.0) -> dict:
+        """查询 RAG 检索引擎就绪状态"""
+        worker = self.workers[0]
+        fut = worker.loop_thread.submit(worker.agent.get_rag_status())
         return fut.result(timeout=timeout)
 
+    def _on_all_workers(self, fn, timeout: float) -> list:
+        """在每个 worker 的 event loop 上执行 fn(agent) 并收集结果"""
+        futs = [w.loop_thread.submit(fn(w.agent)) for w in self.workers]
+        return [fut.result(timeout=timeout) for fut in futs]
+
+    def invalidate_tool_cache(self, patent_no: str = "", tool: str = "", timeout: float = 5.0) -> int:
+        """
+        业务中台数据变更后失效工具缓存：stdio 模式下每个 worker 的 MCP 子进程各有一份缓存，需逐个失效。
+        返回删除的条目总数
+        """
+        removed = sum(self._on_all_workers(lambda a: a.invalidate_tool_cache(patent_no, tool), timeout))
+        logger.debug("Tool cache invalidated: patent_no=%s tool=%s removed=%d", patent_no or "*", tool or "*", removed)
+        return removed
+
+    def tool_cache_stats(self, timeout: float = 2.0) -> dict:
+        """汇总各 MCP Server 进程的工具缓存统计（inprocess 模式下各 worker 共享同一份，按 pid 去重）"""
+        per_process = {s["pid"]: s["caches"] for s in self._on_all_workers(lambda a: a.get_tool_cache_status(), timeout)}
+        totals = {}
+        for caches in per_process.values():
+            for name, stats in caches.items():
+                agg = totals.setdefault(name, {})
+                for k, v in stats.items():
+                    if k != "hit_rate":
+                        agg[k] = agg.get(k, 0) + v
+        for agg in totals.values():
+            hits = agg["hits"] + agg["stale_hits"]
+            total = hits + agg["misses"]
+            agg["hit_rate"] = round(hits / total, 4) if total else 0.0
+        return totals
+
+    def stats(self) -> dict:
+        """工作池状态：总排队深度、平均利用率及各 worker 明细"""
+        workers = [w.stats() for w in self.workers]
+        return {
+            "workers": len(workers),
+            "loop_threads": len(self.loops),
+            "queue_depth": sum(w["queue_depth"] for w in workers),
+            "active": sum(w["active"] for w in workers),
+            "utilization": round(sum(w["utilization"] for w in workers) / len(workers), 4),
+            "ttft_ms": self.ttft.stats(),
+            "llm_inflight": llm_slots.stats(),
+            "router": self.workers[0].agent.router.stats() if self.workers[0].agent.router else None,
+            "memory_writes": memory_store.write_stats(),
+            "sessions": memory_store.session_stats(),
+            "compaction": memory_store.compaction_stats(),
+            "embedding_cache": embedding_cache.stats(),
+            "per_worker": workers,
+        }
+
 
 # =========================
 # gRPC Service
@@ -71,6 +325,41 @@ class AgentService(rag_pb2_grpc.AgentServiceServicer):
             context.set_details("Agent internal error")
             return rag_pb2.AgentResponse()
 
+    def InvalidateToolCache(self, request, context):
+        """业务中台在专利/问卷数据变更后调用，失效对应的工具缓存"""
+        try:
+            removed = self.runtime.invalidate_tool_cache(request.patent_no, request.tool)
+            return rag_pb2.CacheInvalidateResponse(invalidated=removed)
+        except Exception:
+            import traceback
+            print("Agent cache invalidate exception:")
+            traceback.print_exc()
+
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details("Agent internal error")
+            return rag_pb2.CacheInvalidateResponse()
+
+    def ChatStream(self, request, context):
+        """服务端流式：gRPC 按传输就绪情况拉取下一条事件，天然传递背压"""
+        try:
+            user_id = getattr(request, 'user_id', None) or ""
+            for event in self.runtime.stream(request.query, user_id=user_id or "default_user"):
+                if not context.is_active():
+                    break
+                yield rag_pb2.AgentEvent(
+                    type=event["type"],
+                    stage=event.get("stage") or "",
+                    content=event.get("content") or "",
+                    ttft_ms=event.get("ttft_ms") or 0.0,
+                )
+        except Exception:
+            import traceback
+            print("Agent stream exception:")
+            traceback.print_exc()
+
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details("Agent internal error")
+
 
 
 # =========================
@@ -80,9 +369,9 @@ def serve(mcp_server_script: str):
     # 1️⃣ 启动 Agent Runtime（只一次）
     runtime = AgentRuntime(mcp_server_script)
 
-    # 2️⃣ gRPC server
+    # 2️⃣ gRPC server：线程数不少于 worker 数，保证每个 worker 都能被喂满
     server = grpc.server(
-        futures.ThreadPoolExecutor(max_workers=10)
+        futures.ThreadPoolExecutor(max_workers=max(10, 2 * len(runtime.workers)))
     )
 
     rag_pb2_grpc.add_AgentServiceServicer_to_server(
@@ -2,6 +2,7 @@
 专利 Agent 平台配置：从环境变量读取 API Keys、后端地址等
 """
 import os
+import json
 from pathlib import Path
 
 # 加载 .env（如存在）
@@ -14,12 +15,90 @@ if _env_path.exists():
 QWEN_API_BASE = os.getenv("QWEN_API_BASE", "https://dashscope.aliyuncs.com/compatible-mode/v1")
 QWEN_API_KEY = os.getenv("QWEN_API_KEY", "sk-b9dc7ac8811d4a10b9ee1f084005053c")
 
+# LLM 异步客户端：连接池大小、单次请求超时（秒）、同时在途的 completion 上限
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "8"))
+
+# 短期会话记忆：空闲淘汰时间（秒）、全部会话的内存预算（MB）、分片数（锁分段）
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))
+SESSION_MEMORY_BUDGET_MB = int(os.getenv("SESSION_MEMORY_BUDGET_MB", "64"))
+SESSION_SHARDS = int(os.getenv("SESSION_SHARDS", "16"))
+# 短期会话后端：memory（进程内，单副本）| redis（多副本共享，SESSION_REDIS_URL）；画像快照缓存有效期（秒）
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+SESSION_PROFILE_TTL = float(os.getenv("SESSION_PROFILE_TTL", "300"))
+# Redis 会话后端的读写超时与连接超时（秒）：Redis 变慢时快速失败，不拖住对话
+SESSION_REDIS_TIMEOUT = float(os.getenv("SESSION_REDIS_TIMEOUT", "0.5"))
+SESSION_REDIS_CONNECT_TIMEOUT = float(os.getenv("SESSION_REDIS_CONNECT_TIMEOUT", "0.5"))
+# 记忆上下文组装：短期/画像与长期召回并行；长期召回的延迟预算（毫秒，0 表示不限），超时则本轮跳过召回
+MEMORY_CONTEXT_BUDGET_MS = float(os.getenv("MEMORY_CONTEXT_BUDGET_MS", "800"))
+MEMORY_CONTEXT_WORKERS = int(os.getenv("MEMORY_CONTEXT_WORKERS", "8"))
+# 对话压缩：短期历史超过 token 预算时，后台把较早的轮次摘要写入长期 episodic 记忆并移出短期历史（至少保留最近若干条）
+MEMORY_COMPACTION = os.getenv("MEMORY_COMPACTION", "true").lower() == "true"
+MEMORY_HISTORY_TOKEN_BUDGET = int(os.getenv("MEMORY_HISTORY_TOKEN_BUDGET", "1500"))
+MEMORY_COMPACT_KEEP_TURNS = int(os.getenv("MEMORY_COMPACT_KEEP_TURNS", "4"))
+# Prompt 组装：每次 LLM 调用的输入 token 预算（超出时先裁剪最早的历史，再省略较早的工具结果）；
+# 本地 tokenizer 文件（如 Qwen 的 tokenizer.json），未配置时按字符估算
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+TOKENIZER_PATH = os.getenv("TOKENIZER_PATH", "")
+
+# 意图路由：cot+react 模式下先用本地 embedding 分类，寒暄/单工具查询跳过 CoT 规划
+AGENT_ROUTER = os.getenv("AGENT_ROUTER", "true").lower() == "true"
+AGENT_ROUTER_THRESHOLD = float(os.getenv("AGENT_ROUTER_THRESHOLD", "0.6"))
+AGENT_ROUTER_MARGIN = float(os.getenv("AGENT_ROUTER_MARGIN", "0.05"))
+
+# ReAct 工具调用：同一轮的多个 tool_calls 并发执行；单个工具默认超时（秒），可用 JSON 按工具名覆盖
+TOOL_CALL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", "20"))
+TOOL_TIMEOUTS = json.loads(os.getenv("TOOL_TIMEOUTS", '{"get_rag_patent_info": 60, "get_rag_patent_info_batch": 120}'))
+
+# MCP 传输：stdio（工具运行在独立子进程）| inprocess（工具与 RAG 引擎直接运行在 Agent 进程内，无序列化与进程跳转）
+# | auto（默认：Agent 池大于 1 时用 inprocess，池中 Agent 共享一份 RAG 引擎与缓存；单个 Agent 用 stdio）
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "auto").lower()
+
 # Cohere Rerank（可选）
 COHERE_API_KEY = os.getenv("COHERE_API_KEY", "")
 USE_COHERE_RERANK = os.getenv("USE_COHERE_RERANK", "false").lower() == "true"
 
 # Spring Boot 业务中台地址（MCP 工具调用）
 BACKEND_BASE_URL = os.getenv("BACKEND_BASE_URL", "http://localhost:8190")
+# 业务中台共享连接池：最大连接数、keep-alive 连接数、读/连接超时（秒）；只读请求的重试次数与退避基数（秒）
+BACKEND_MAX_CONNECTIONS = int(os.getenv("BACKEND_MAX_CONNECTIONS", "20"))
+BACKEND_MAX_KEEPALIVE = int(os.getenv("BACKEND_MAX_KEEPALIVE", "10"))
+BACKEND_TIMEOUT = float(os.getenv("BACKEND_TIMEOUT", "30"))
+BACKEND_CONNECT_TIMEOUT = float(os.getenv("BACKEND_CONNECT_TIMEOUT", "5"))
+BACKEND_RETRIES = int(os.getenv("BACKEND_RETRIES", "2"))
+BACKEND_RETRY_BACKOFF = float(os.getenv("BACKEND_RETRY_BACKOFF", "0.2"))
+# 工具读穿缓存（按 patent_no）：专利详情/企业兴趣各自的 TTL（秒），过期后 stale 窗口内先返回旧值并后台刷新
+TOOL_CACHE = os.getenv("TOOL_CACHE", "true").lower() == "true"
+TOOL_CACHE_SIZE = int(os.getenv("TOOL_CACHE_SIZE", "2048"))
+PATENT_CACHE_TTL = float(os.getenv("PATENT_CACHE_TTL", "3600"))
+ENTERPRISE_CACHE_TTL = float(os.getenv("ENTERPRISE_CACHE_TTL", "300"))
+TOOL_CACHE_STALE_TTL = float(os.getenv("TOOL_CACHE_STALE_TTL", "600"))
+# 批量查询工具：单次最多专利数、并发请求上限
+TOOL_BATCH_MAX = int(os.getenv("TOOL_BATCH_MAX", "50"))
+TOOL_BATCH_CONCURRENCY = int(os.getenv("TOOL_BATCH_CONCURRENCY", "8"))
 
 # RAG 向量库路径
 RAG_PERSIST_ROOT = os.getenv("RAG_PERSIST_ROOT", str(Path(__file__).parent / "chroma_db_multi"))
+
+# RAG 检索引擎启动时是否后台预热（加载 embedding 模型、向量库与语料）
+RAG_WARMUP = os.getenv("RAG_WARMUP", "true").lower() == "true"
+
+# RAG 多路检索并发：BM25 与各向量库并行执行，单路超时（秒）后丢弃该路结果
+RAG_PARALLEL_RETRIEVAL = os.getenv("RAG_PARALLEL_RETRIEVAL", "true").lower() == "true"
+RAG_LEG_TIMEOUT = float(os.getenv("RAG_LEG_TIMEOUT", "3.0"))
+
+# 向量缓存：(模型名, 归一化文本) -> 向量，记忆召回与 RAG 检索共享，LRU 条目上限
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+
+# RAG 语义答案缓存：精确 + 向量相似度命中，TTL 过期、LRU 淘汰，向量库更新时失效
+RAG_ANSWER_CACHE = os.getenv("RAG_ANSWER_CACHE", "true").lower() == "true"
+RAG_ANSWER_CACHE_SIZE = int(os.getenv("RAG_ANSWER_CACHE_SIZE", "512"))
+RAG_ANSWER_CACHE_TTL = float(os.getenv("RAG_ANSWER_CACHE_TTL", "3600"))
+RAG_ANSWER_CACHE_THRESHOLD = float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", "0.95"))
+
+# Agent 工作池：Agent 实例数（各自独立的 MCP 会话）与承载它们的 event loop 线程数；
+# 请求按 user_id 哈希固定到某个 Agent，同一用户的请求按提交顺序串行
+AGENT_POOL_SIZE = int(os.getenv("AGENT_POOL_SIZE", "4"))
+AGENT_LOOP_THREADS = int(os.getenv("AGENT_LOOP_THREADS", "2"))
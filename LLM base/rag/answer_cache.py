@@ -0,0 +1,138 @@
+"""
+RAG 语义答案缓存：位于 adaptive_rag_answer 之前
+- 精确命中：归一化 query（去空白/标点、小写）完全相同
+- 语义命中：query 向量与缓存条目余弦相似度 >= similarity_threshold，且两者包含的专利号/申请号完全一致
+  （只差一个专利号的 query 向量几乎相同，不能互相命中）
+- TTL 过期 + LRU 容量淘汰；向量库重建（索引版本变化）时整体失效
+- hits/misses/evictions 等计数通过 stats() 导出
+"""
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import numpy as np
+
+_STRIP_RE = re.compile(r"[\s　，。！？、；：“”‘’（）《》【】,.!?;:'\"()\[\]<>~～…·]+")
+# 专利公开号（如 CN112345678A、US2020123456A1）与申请号（如 202010123456.7）
+_IDENTIFIER_RE = re.compile(r"[A-Za-z]{2}\d{5,}[A-Za-z]?\d?|\d{8,}(?:\.[\dXx])?")
+
+
+def normalize_query(query: str) -> str:
+    return _STRIP_RE.sub("", (query or "").lower())
+
+
+def extract_identifiers(query: str) -> frozenset:
+    """query 中出现的专利号/申请号（大写）"""
+    return frozenset(m.upper() for m in _IDENTIFIER_RE.findall(query or ""))
+
+
+class _Entry:
+    __slots__ = ("answer", "vector", "tag", "identifiers", "expires_at")
+
+    def __init__(self, answer, vector, tag, identifiers, expires_at):
+        self.answer = answer
+        self.vector = vector
+        self.tag = tag
+        self.identifiers = identifiers
+        self.expires_at = expires_at
+
+
+class SemanticAnswerCache:
+    """
+    embed_fn: text -> 向量（为 None 时只做精确匹配）
+    tag: 区分检索参数（如 top_k）与查询对象（如 patent_no），只有相同 tag 且专利号集合相同的条目才参与语义匹配
+    """
+
+    def __init__(self, embed_fn: Optional[Callable[[str], List[float]]] = None, max_entries: int = 512,
+                 ttl: float = 3600.0, similarity_threshold: float = 0.95):
+        self.embed_fn = embed_fn
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits_exact": 0,
+            "hits_semantic": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    def _key(self, query: str, tag: str) -> str:
+        return f"{tag}|{normalize_query(query)}"
+
+    def _embed(self, query: str):
+        if self.embed_fn is None:
+            return None
+        vec = np.asarray(self.embed_fn(query), dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _expire_locked(self, now: float):
+        expired = [k for k, e in self._entries.items() if e.expires_at <= now]
+        for k in expired:
+            del self._entries[k]
+        self._counters["expirations"] += len(expired)
+
+    def get(self, query: str, tag: str = "") -> Optional[str]:
+        return self.lookup(query, tag)[0]
+
+    def lookup(self, query: str, tag: str = ""):
+        """返回 (answer 或 None, query 向量)；向量可在未命中后传给 put 复用"""
+        key = self._key(query, tag)
+        identifiers = extract_identifiers(query)
+        now = time.time()
+        with self._lock:
+            self._expire_locked(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._counters["hits_exact"] += 1
+                return entry.answer, None
+            candidates = [(k, e) for k, e in self._entries.items()
+                          if e.tag == tag and e.identifiers == identifiers and e.vector is not None]
+        vec = self._embed(query) if candidates else None
+        if vec is not None:
+            matrix = np.stack([e.vector for _, e in candidates])
+            sims = matrix @ vec
+            best = int(np.argmax(sims))
+            if sims[best] >= self.similarity_threshold:
+                best_key = candidates[best][0]
+                with self._lock:
+                    entry = self._entries.get(best_key)
+                    if entry is not None:
+                        self._entries.move_to_end(best_key)
+                        self._counters["hits_semantic"] += 1
+                        return entry.answer, vec
+        with self._lock:
+            self._counters["misses"] += 1
+        return None, vec
+
+    def put(self, query: str, answer: str, tag: str = "", vector=None) -> None:
+        key = self._key(query, tag)
+        vec = vector if vector is not None else self._embed(query)
+        with self._lock:
+            self._entries[key] = _Entry(answer, vec, tag, extract_identifiers(query), time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def invalidate(self) -> None:
+        """向量库/索引重建后清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._counters["invalidations"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._entries)
+        hits = stats["hits_exact"] + stats["hits_semantic"]
+        total = hits + stats["misses"]
+        stats["hit_rate"] = round(hits / total, 4) if total else 0.0
+        return stats
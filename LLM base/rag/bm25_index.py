@@ -0,0 +1,435 @@
+"""
+持久化 BM25 稀疏倒排索引（与 Chroma 向量库并列存放于 RAG_PERSIST_ROOT/bm25）
+- 中文感知分词：CJK 连续片段切成单字 + 双字（bigram），英文/数字按词切分，无需额外依赖
+- 段式存储：每次 add_documents 写入一个新段（postings/tf/文档长度均为定长数组文件），
+  启动时 mmap 加载，查询代价只与查询词命中的 postings 数量相关，与语料规模无关
+- 增量更新：新增写新段、删除记 tombstone；段数超过 max_segments 时按大小分层合并
+  （只合并文档数之和最小的 merge_factor 个相邻段，大段不会被反复重写）
+- 段的总 token 数在构建/加载时算好，索引维护语料级累计值，查询不再遍历文档长度
+- 多进程写入（如多个 MCP 子进程同时首次构建）经索引目录下的 .lock 文件锁串行，
+  持锁后先重新加载其他进程写入的 manifest 再修改
+"""
+import os
+import re
+import json
+import math
+import mmap
+import heapq
+import shutil
+import threading
+from array import array
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # 非 POSIX 平台退化为仅进程内加锁
+    fcntl = None
+
+BM25_DIRNAME = "bm25"
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = ".lock"
+
+_TOKEN_RE = re.compile(r"[一-鿿㐀-䶿]+|[a-z0-9]+(?:[._-][a-z0-9]+)*")
+_CJK_RE = re.compile(r"[一-鿿㐀-䶿]")
+
+
+def tokenize(text: str) -> List[str]:
+    """中文单字 + 双字，英文/数字整词（小写）"""
+    tokens = []
+    for piece in _TOKEN_RE.findall((text or "").lower()):
+        if _CJK_RE.match(piece):
+            tokens.extend(piece)
+            tokens.extend(piece[i:i + 2] for i in range(len(piece) - 1))
+        else:
+            tokens.append(piece)
+    return tokens
+
+
+def bm25_dir(persist_root: str) -> str:
+    return os.path.join(persist_root, BM25_DIRNAME)
+
+
+def _load_array(path: str, typecode: str):
+    """mmap 只读加载定长数组；空文件无法 mmap，返回空数组"""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return array(typecode), None
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mm).cast(typecode), mm
+
+
+class _Segment:
+    """一个不可变索引段：terms -> postings 区间，postings/tf/doc_len 为数组"""
+
+    def __init__(self, name, terms, postings, tfs, doc_len, doc_ids, doc_off, docs_blob, mmaps=(),
+                 total_len=None):
+        self.name = name
+        self.terms = terms          # {term: [start, count]}
+        self.postings = postings    # uint32 段内文档序号
+        self.tfs = tfs              # uint16 词频
+        self.doc_len = doc_len      # uint32 文档长度（token 数）
+        self.doc_ids = doc_ids      # 段内序号 -> 全局 doc id
+        self.doc_off = doc_off      # uint64 docs.jsonl 字节偏移（n+1）
+        self.docs_blob = docs_blob  # mmap / bytes
+        self._mmaps = list(mmaps)
+        self._id_set = None
+        self.total_len = sum(doc_len) if total_len is None else total_len  # 段内文档长度之和
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_ids)
+
+    @property
+    def id_set(self) -> set:
+        if self._id_set is None:
+            self._id_set = set(self.doc_ids)
+        return self._id_set
+
+    def df(self, term: str) -> int:
+        entry = self.terms.get(term)
+        return entry[1] if entry else 0
+
+    def document(self, idx: int) -> dict:
+        raw = self.docs_blob[self.doc_off[idx]:self.doc_off[idx + 1]]
+        return json.loads(bytes(raw).decode("utf-8"))
+
+    def close(self):
+        for mm in self._mmaps:
+            try:
+                mm.close()
+            except BufferError:
+                # 仍有 memoryview 引用时交给 GC 回收
+                pass
+        self._mmaps = []
+
+    @classmethod
+    def build(cls, name, ids, texts, metadatas):
+        postings_map = defaultdict(list)
+        doc_len = array("I")
+        blob = bytearray()
+        doc_off = array("Q", [0])
+        for idx, (doc_id, text, meta) in enumerate(zip(ids, texts, metadatas)):
+            counts = Counter(tokenize(text))
+            doc_len.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings_map[term].append((idx, min(tf, 0xFFFF)))
+            blob += json.dumps({"id": doc_id, "text": text, "metadata": meta or {}}, ensure_ascii=False).encode("utf-8")
+            doc_off.append(len(blob))
+        terms = {}
+        postings = array("I")
+        tfs = array("H")
+        for term in sorted(postings_map):
+            plist = postings_map[term]
+            terms[term] = [len(postings), len(plist)]
+            for idx, tf in plist:
+                postings.append(idx)
+                tfs.append(tf)
+        return cls(name, terms, postings, tfs, doc_len, list(ids), doc_off, bytes(blob))
+
+    def save(self, seg_dir: str):
+        os.makedirs(seg_dir, exist_ok=True)
+        for fname, arr in (("postings.bin", self.postings), ("tfs.bin", self.tfs),
+                           ("doclen.bin", self.doc_len), ("docoff.bin", self.doc_off)):
+            with open(os.path.join(seg_dir, fname), "wb") as f:
+                f.write(bytes(arr))
+        with open(os.path.join(seg_dir, "docs.jsonl"), "wb") as f:
+            f.write(bytes(self.docs_blob))
+        with open(os.path.join(seg_dir, "terms.json"), "w", encoding="utf-8") as f:
+            json.dump({"terms": self.terms, "doc_ids": self.doc_ids, "total_len": self.total_len}, f,
+                      ensure_ascii=False)
+
+    @classmethod
+    def load(cls, name, seg_dir: str):
+        with open(os.path.join(seg_dir, "terms.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        mmaps = []
+        arrays = {}
+        for fname, code in (("postings.bin", "I"), ("tfs.bin", "H"), ("doclen.bin", "I"), ("docoff.bin", "Q")):
+            arr, mm = _load_array(os.path.join(seg_dir, fname), code)
+            arrays[fname] = arr
+            if mm is not None:
+                mmaps.append(mm)
+        blob, mm = _load_array(os.path.join(seg_dir, "docs.jsonl"), "B")
+        if mm is not None:
+            mmaps.append(mm)
+        return cls(name, meta["terms"], arrays["postings.bin"], arrays["tfs.bin"], arrays["doclen.bin"],
+                   meta["doc_ids"], arrays["docoff.bin"], blob, mmaps, total_len=meta.get("total_len"))
+
+
+class BM25Index:
+    """
+    段式 BM25 索引。path=None 时为纯内存索引（不落盘）。
+    线程安全：写操作与 refresh 持锁，查询读取 (段列表, 文档数, 总长度) 快照。
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75, max_segments: int = 8,
+                 merge_factor: int = 4):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.max_segments = max_segments
+        self.merge_factor = max(2, merge_factor)
+        self.segments: List[_Segment] = []
+        self._view = ([], 0, 0)  # 查询快照：(段列表, 段内文档总数, 文档长度总和)
+        self.deleted = set()  # {(段名, doc id)} tombstone
+        self.version = 0
+        self._manifest_mtime = None
+        self._lock = threading.Lock()
+
+    # ---------- 加载 / 持久化 ----------
+
+    @classmethod
+    def open(cls, path: str, **kwargs) -> "BM25Index":
+        index = cls(path, **kwargs)
+        if os.path.exists(index._manifest_path()):
+            index._load_shared()
+        return index
+
+    @classmethod
+    def from_texts(cls, texts: List[str], metadatas: Optional[List[dict]] = None, **kwargs) -> "BM25Index":
+        """从文本列表构建内存索引（兼容旧的 docs 列表用法）"""
+        index = cls(None, **kwargs)
+        index.add_documents([str(i) for i in range(len(texts))], texts, metadatas)
+        return index
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.path, MANIFEST_NAME)
+
+    def _load(self):
+        manifest_path = self._manifest_path()
+        if not os.path.exists(manifest_path):
+            return
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        old = self.segments
+        self._set_segments([_Segment.load(name, os.path.join(self.path, name)) for name in manifest["segments"]])
+        self.deleted = {tuple(key) for key in manifest.get("deleted", [])}
+        self.version = manifest.get("version", 0)
+        self.k1 = manifest.get("k1", self.k1)
+        self.b = manifest.get("b", self.b)
+        self._manifest_mtime = os.path.getmtime(manifest_path)
+        for seg in old:
+            seg.close()
+
+    def _set_segments(self, segments: List[_Segment]):
+        """替换段列表并同步语料级累计值（O(段数)）"""
+        self.segments = segments
+        self._view = (segments, sum(seg.num_docs for seg in segments), sum(seg.total_len for seg in segments))
+
+    def _next_segment_name(self) -> str:
+        self.version += 1
+        return f"seg_{self.version:06d}"
+
+    def _write_manifest(self):
+        self.version += 1
+        manifest = {
+            "segments": [seg.name for seg in self.segments],
+            "deleted": [list(key) for key in sorted(self.deleted)],
+            "version": self.version,
+            "k1": self.k1,
+            "b": self.b,
+        }
+        tmp = self._manifest_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp, self._manifest_path())
+        self._manifest_mtime = os.path.getmtime(self._manifest_path())
+
+    @contextmanager
+    def _file_lock(self, operation):
+        """索引目录下 .lock 的跨进程锁：写入持排他锁，加载持共享锁（合并删除旧段目录时不会有进程正在读）"""
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, LOCK_NAME), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, operation)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _exclusive(self):
+        """写操作的进程内锁 + 跨进程排他锁；持锁后若其他进程更新过 manifest 先重新加载"""
+        with self._lock:
+            if not self.path:
+                yield
+                return
+            with self._file_lock(fcntl.LOCK_EX if fcntl is not None else None):
+                try:
+                    mtime = os.path.getmtime(self._manifest_path())
+                except OSError:
+                    mtime = None
+                if mtime is not None and mtime != self._manifest_mtime:
+                    self._load()
+                yield
+
+    def _load_shared(self):
+        with self._file_lock(fcntl.LOCK_SH if fcntl is not None else None):
+            self._load()
+
+    def refresh(self) -> bool:
+        """其他进程（如 build_vector_db）更新了索引时重新加载，返回是否发生重载"""
+        if not self.path:
+            return False
+        try:
+            mtime = os.path.getmtime(self._manifest_path())
+        except OSError:
+            return False
+        if mtime == self._manifest_mtime:
+            return False
+        with self._lock:
+            self._load_shared()
+        return True
+
+    # ---------- 增量更新 ----------
+
+    def add_documents(self, ids: List[str], texts: List[str], metadatas: Optional[List[dict]] = None) -> None:
+        """新增文档写入新段；已存在的同 id 文档在旧段中标记删除"""
+        if not ids:
+            return
+        with self._exclusive():
+            self._add_locked(ids, texts, metadatas)
+
+    def add_if_empty(self, fetch: Callable[[], Tuple[List[str], List[str], Optional[List[dict]]]]) -> bool:
+        """
+        索引为空时用 fetch() 返回的 (ids, texts, metadatas) 构建首个段，返回是否构建。
+        持锁后重新检查：多个进程同时首次打开同一目录时只有一个进程构建，其余直接加载其结果
+        """
+        with self._exclusive():
+            if self.num_docs:
+                return False
+            ids, texts, metadatas = fetch()
+            if not ids:
+                return False
+            self._add_locked(ids, texts, metadatas)
+            return True
+
+    def _add_locked(self, ids, texts, metadatas):
+        metadatas = metadatas or [{}] * len(ids)
+        name = self._next_segment_name()
+        seg = _Segment.build(name, ids, texts, metadatas)
+        if self.path:
+            self._save_segment(seg)
+        self._tombstone(set(ids))
+        self._set_segments(self.segments + [seg])
+        if len(self.segments) > self.max_segments:
+            self._merge_tiers_locked()
+        elif self.path:
+            self._write_manifest()
+
+    def _save_segment(self, seg: _Segment):
+        """先写临时目录再 os.replace，读者不会看到写了一半的段"""
+        seg_dir = os.path.join(self.path, seg.name)
+        tmp_dir = seg_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        seg.save(tmp_dir)
+        os.replace(tmp_dir, seg_dir)
+
+    def delete(self, ids: Iterable[str]) -> int:
+        """按 id 删除（tombstone），合并时物理清除；返回删除条数"""
+        with self._exclusive():
+            hit = self._tombstone(set(ids))
+            if hit and self.path:
+                self._write_manifest()
+            return hit
+
+    def compact(self) -> None:
+        """全量合并为一个段（显式调用，如离线重建后）"""
+        with self._exclusive():
+            if self.segments:
+                self._merge_locked(0, len(self.segments))
+
+    def _tombstone(self, ids: set) -> int:
+        hit = 0
+        for seg in self.segments:
+            for doc_id in ids.intersection(seg.id_set):
+                key = (seg.name, doc_id)
+                if key not in self.deleted:
+                    self.deleted.add(key)
+                    hit += 1
+        return hit
+
+    def _merge_tiers_locked(self):
+        """段数超限时反复合并文档数之和最小的 merge_factor 个相邻段（保持段的先后顺序）"""
+        while len(self.segments) > self.max_segments:
+            width = min(self.merge_factor, len(self.segments))
+            sizes = [seg.num_docs for seg in self.segments]
+            start = min(range(len(sizes) - width + 1), key=lambda i: sum(sizes[i:i + width]))
+            self._merge_locked(start, start + width)
+
+    def _merge_locked(self, start: int, end: int):
+        """把 segments[start:end] 合并为一个新段，物理清除其中的 tombstone 文档"""
+        group = self.segments[start:end]
+        names = {seg.name for seg in group}
+        ids, texts, metas = [], [], []
+        for seg in group:
+            for idx, doc_id in enumerate(seg.doc_ids):
+                if (seg.name, doc_id) in self.deleted:
+                    continue
+                doc = seg.document(idx)
+                ids.append(doc_id)
+                texts.append(doc["text"])
+                metas.append(doc["metadata"])
+        name = self._next_segment_name()
+        merged = _Segment.build(name, ids, texts, metas)
+        if self.path:
+            self._save_segment(merged)
+        self._set_segments(self.segments[:start] + ([merged] if merged.num_docs else []) + self.segments[end:])
+        self.deleted = {key for key in self.deleted if key[0] not in names}
+        if self.path:
+            self._write_manifest()
+            for seg in group:
+                seg.close()
+                shutil.rmtree(os.path.join(self.path, seg.name), ignore_errors=True)
+
+    def ids(self) -> set:
+        """当前有效（未删除）的文档 id"""
+        live = set()
+        for seg in self.segments:
+            live.update(doc_id for doc_id in seg.doc_ids if (seg.name, doc_id) not in self.deleted)
+        return live
+
+    # ---------- 查询 ----------
+
+    @property
+    def num_docs(self) -> int:
+        return sum(seg.num_docs for seg in self.segments) - len(self.deleted)
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[float, dict]]:
+        """返回 [(score, {"id", "text", "metadata"})]，按分数降序"""
+        segments, n_docs, total_len = self._view
+        deleted = self.deleted
+        terms = set(tokenize(query))
+        if not terms or not segments:
+            return []
+        avgdl = (total_len / n_docs) if n_docs else 0.0
+        if not avgdl:
+            return []
+        k1, b = self.k1, self.b
+        idf = {}
+        for term in terms:
+            df = sum(seg.df(term) for seg in segments)
+            if df:
+                idf[term] = math.log((n_docs - df + 0.5) / (df + 0.5) + 1.0)
+        scored = []
+        for seg_no, seg in enumerate(segments):
+            scores: Dict[int, float] = defaultdict(float)
+            doc_len = seg.doc_len
+            for term, w in idf.items():
+                entry = seg.terms.get(term)
+                if not entry:
+                    continue
+                start, count = entry
+                for pos in range(start, start + count):
+                    idx = seg.postings[pos]
+                    tf = seg.tfs[pos]
+                    norm = k1 * (1.0 - b + b * doc_len[idx] / avgdl)
+                    scores[idx] += w * tf * (k1 + 1.0) / (tf + norm)
+            for idx, score in scores.items():
+                if deleted and (seg.name, seg.doc_ids[idx]) in deleted:
+                    continue
+                scored.append((score, seg_no, idx))
+        return [(score, segments[seg_no].document(idx)) for score, seg_no, idx in heapq.nlargest(k, scored)]
@@ -1,44 +1,173 @@
-
 import os
-from tqdm import tqdm
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+from pathlib import Path
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
-from langchain_community.document_loaders import PyPDFLoader
+
+# 确保项目根在 path 中（支持 python rag/build_vector_db.py 直接运行）
+_root = Path(__file__).resolve().parents[1]
+if str(_root) not in sys.path:
+    sys.path.insert(0, str(_root))
+
+from rag.bm25_index import BM25Index, bm25_dir
+from rag.ingest_pipeline import IngestPipeline, EncoderPool, chunk_ids
+from rag.rag_chain import EMBEDDING_CONFIGS  # 多表征模型与检索端共用一份配置
+# 各模型编码 batch 大小（按模型显存/速度调整）
+ENCODE_BATCH_SIZES = {
+    "bge-base-zh-v1.5": 32,
+    "text2vec-base-chinese": 64,
+    "e5-base": 32,
+}
+MANIFEST_NAME = "ingest_manifest.json"
 
 
-def load_pdfs(pdf_dir):
-    docs = []
-    for fname in tqdm(os.listdir(pdf_dir)):
-        if fname.lower().endswith('.pdf'):
-            loader = PyPDFLoader(os.path.join(pdf_dir, fname))
-            docs.extend(loader.load())
-    return docs
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
 
 
-def build_multi_representation_indexes(pdf_dir, persist_root="./chroma_db_multi"):
+class IngestManifest:
+    """
+    增量入库清单：{文件名: {"sha256", "id_prefix", "status": partial|done, "num_chunks", "batches_done"}}
+    每完成一个 batch 原子落盘一次，崩溃后从已完成的 batch 之后继续。
+    id_prefix 缺失的是旧版（按内容哈希命名 chunk）的记录，删除时按 sha256 前 16 位还原 id。
+    """
+
+    def __init__(self, persist_root):
+        self.path = os.path.join(persist_root, MANIFEST_NAME)
+        self.files = {}
+        self.exists = os.path.exists(self.path)
+        if self.exists:
+            with open(self.path, encoding="utf-8") as f:
+                self.files = json.load(f).get("files", {})
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+    def plan(self, pdf_dir):
+        """对比磁盘文件与清单，返回 (待入库 {fname: sha256}, 待删除 [fname])"""
+        current = {
+            fname: file_sha256(os.path.join(pdf_dir, fname))
+            for fname in sorted(os.listdir(pdf_dir)) if fname.lower().endswith('.pdf')
+        }
+        to_ingest = {
+            fname: sha for fname, sha in current.items()
+            if not (self.files.get(fname, {}).get("sha256") == sha and self.files[fname].get("status") == "done")
+        }
+        # 内容变化的文件先删除旧 chunk；同内容的 partial 记录保留以便续跑（旧版 id 的 partial 记录无法续跑，删除后重入）
+        to_remove = [
+            fname for fname, entry in self.files.items()
+            if fname not in current or entry.get("sha256") != current[fname]
+            or (entry.get("status") == "partial" and "id_prefix" not in entry)
+        ]
+        return to_ingest, to_remove
+
+    def chunk_ids(self, fname):
+        entry = self.files[fname]
+        return chunk_ids(entry.get("id_prefix") or entry["sha256"][:16], entry.get("num_chunks", 0))
+
+
+def _open_stores(persist_root, with_embeddings=True):
+    """with_embeddings=False 时只打开存储（编码由 EncoderPool 子进程完成，父进程无需加载模型）"""
+    stores = {}
+    for tag, model_name in EMBEDDING_CONFIGS:
+        embeddings = HuggingFaceEmbeddings(model_name=model_name) if with_embeddings else None
+        stores[tag] = Chroma(persist_directory=os.path.join(persist_root, tag), embedding_function=embeddings)
+    return stores
+
+
+def build_multi_representation_indexes(pdf_dir, persist_root="./chroma_db_multi", batch_size=64, rebuild=False,
+                                       parse_workers=None, queue_size=4, parallel_encoders=True):
     """
     对同一批文档，分别用多种embedding模型编码，分层存储。
     persist_root: 根目录，每种表征一个子目录
+    增量模式：按文件内容哈希只处理新增/变化的 PDF，删除已移除文件的 chunk，
+    按 batch 记录进度，中断后重跑会跳过已完成的 batch。
+    rebuild=True 时清空已有索引后全量重建。
+    入库走流式流水线（parse 进程池 → split → embed → write），见 rag/ingest_pipeline.py。
+    parallel_encoders=True 时每个模型一个编码子进程，同一 batch 并行编码，三库并发写入。
     """
-    docs = load_pdfs(pdf_dir)
+    if rebuild:
+        for tag, _ in EMBEDDING_CONFIGS:
+            shutil.rmtree(os.path.join(persist_root, tag), ignore_errors=True)
+        shutil.rmtree(bm25_dir(persist_root), ignore_errors=True)
+        if os.path.exists(os.path.join(persist_root, MANIFEST_NAME)):
+            os.remove(os.path.join(persist_root, MANIFEST_NAME))
+
+    manifest = IngestManifest(persist_root)
+    index_dirs = [os.path.join(persist_root, tag) for tag, _ in EMBEDDING_CONFIGS] + [bm25_dir(persist_root)]
+    if not manifest.exists and any(os.path.isdir(d) for d in index_dirs):
+        # 旧版全量构建的 chunk 是随机 id，增量写入会与之重复，只能重建
+        sys.exit(f"{persist_root} 下已有索引但没有入库清单（旧版全量构建），增量更新会产生重复 chunk，"
+                 f"请使用 --rebuild 重建")
+    to_ingest, to_remove = manifest.plan(pdf_dir)
+    if not to_ingest and not to_remove:
+        print("索引已是最新，无需更新")
+        return
+    manifest.save()  # 先于创建索引目录落盘，中途失败后重跑不会被误判为旧版索引
+
+    stores = _open_stores(persist_root, with_embeddings=not parallel_encoders)
+    bm25 = BM25Index.open(bm25_dir(persist_root))
+
+    for fname in to_remove:
+        ids = manifest.chunk_ids(fname)
+        if ids:
+            for db in stores.values():
+                db.delete(ids=ids)
+            bm25.delete(ids)
+        del manifest.files[fname]
+        manifest.save()
+        print(f"[删除] {fname}：{len(ids)} 块")
+
     splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    splits = splitter.split_documents(docs)
-
-    # 多表征模型，可按需扩展
-    embedding_configs = [
-        ("bge-base-zh-v1.5", "BAAI/bge-base-zh-v1.5"),
-        ("text2vec-base-chinese", "GanymedeNil/text2vec-base-chinese"),
-        ("e5-base", "intfloat/e5-base"),
-    ]
-    for tag, model_name in embedding_configs:
-        print(f"正在处理embedding模型: {model_name}")
-        embeddings = HuggingFaceEmbeddings(model_name=model_name)
-        persist_dir = os.path.join(persist_root, tag)
-        vectordb = Chroma.from_documents(splits, embeddings, persist_directory=persist_dir)
-        vectordb.persist()
-        print(f"[{tag}] 入库完成，文档数：{len(docs)}，切分块数：{len(splits)}")
-        
+    encoders = EncoderPool(dict(EMBEDDING_CONFIGS), ENCODE_BATCH_SIZES) if parallel_encoders and to_ingest else None
+    pipeline = IngestPipeline(stores, bm25, manifest, splitter, batch_size=batch_size,
+                              parse_workers=parse_workers, queue_size=queue_size, encoders=encoders)
+    try:
+        report = pipeline.run(pdf_dir, to_ingest)
+    finally:
+        if encoders is not None:
+            encoders.shutdown()
+    for stage in ("parse", "split", "embed", "write"):
+        st = report[stage]
+        print(f"[{stage}] {st['items']} {st['unit']}，忙碌 {st['busy_s']}s，"
+              f"{st[st['unit'] + '_per_s']} {st['unit']}/s（按总耗时 {st[st['unit'] + '_per_wall_s']} {st['unit']}/s）")
+    print(f"各模型编码耗时：{report['embed_models_busy_s']}")
+    print(f"流水线总耗时：{report['wall_s']}s")
+    failed = report["failed_files"]
+    print(f"增量更新完成：新增/更新 {len(to_ingest) - len(failed)} 个文件，删除 {len(to_remove)} 个文件，"
+          f"BM25 总块数：{bm25.num_docs}")
+    if failed:
+        print(f"{len(failed)} 个文件解析失败已跳过（未写入清单，下次运行会重试）：")
+        for fname, error in failed.items():
+            print(f"  {fname}: {error}")
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="构建/增量更新多表征向量库与 BM25 索引")
     # 假设你的PDF都在 ./patent_pdfs 目录
-    build_multi_representation_indexes("./patent_pdfs")
\ No newline at end of file
+    parser.add_argument("--pdf-dir", default="./patent_pdfs")
+    parser.add_argument("--persist-root", default="./chroma_db_multi")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--rebuild", action="store_true", help="清空已有索引后全量重建")
+    parser.add_argument("--parse-workers", type=int, default=None, help="PDF 解析进程数")
+    parser.add_argument("--queue-size", type=int, default=4, help="流水线阶段间队列容量")
+    parser.add_argument("--sequential-encoders", action="store_true",
+                        help="在主进程内依次用各模型编码（默认每个模型一个子进程并行编码）")
+    args = parser.parse_args()
+    build_multi_representation_indexes(args.pdf_dir, args.persist_root, batch_size=args.batch_size,
+                                       rebuild=args.rebuild, parse_workers=args.parse_workers,
+                                       queue_size=args.queue_size,
+                                       parallel_encoders=not args.sequential_encoders)
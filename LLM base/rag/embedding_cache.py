@@ -0,0 +1,112 @@
+"""
+向量 LRU 缓存：键为 (模型名, 归一化文本)，位于记忆召回与 RAG 检索的所有 encode / embed_query 调用之前
+- 同一轮对话内（记忆召回、兜底检索、各路向量检索）以及跨轮的重复文本只编码一次
+- 批量接口只对未命中的文本做一次前向编码
+- 按模型统计 hits / misses
+- 向量以只读 np.float32 数组存放（比 list[float] 省约 8 倍内存），被多个调用方共享；需要 list 的调用方自行 tolist()
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Sequence
+
+import numpy as np
+
+try:
+    from langchain_core.embeddings import Embeddings
+except ImportError:
+    from langchain.embeddings.base import Embeddings
+
+try:
+    from config import EMBEDDING_CACHE_SIZE
+except ImportError:
+    EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+
+
+def normalize_text(text: str) -> str:
+    """折叠空白；不改变大小写与标点（会影响向量）"""
+    return " ".join((text or "").split())
+
+
+class EmbeddingCache:
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {}  # model -> {"hits", "misses"}
+
+    @staticmethod
+    def _freeze(vec) -> np.ndarray:
+        arr = np.array(vec, dtype=np.float32)
+        arr.setflags(write=False)
+        return arr
+
+    def get_many(self, model: str, texts: Sequence[str], compute: Callable[[List[str]], Sequence]) -> list:
+        """返回与 texts 一一对应的只读 float32 向量；未命中的文本去重后一次性交给 compute 编码"""
+        keys = [(model, normalize_text(t)) for t in texts]
+        result = [None] * len(keys)
+        missing = {}
+        with self._lock:
+            counters = self._counters.setdefault(model, {"hits": 0, "misses": 0})
+            for i, key in enumerate(keys):
+                vec = self._entries.get(key)
+                if vec is not None:
+                    self._entries.move_to_end(key)
+                    result[i] = vec
+                    counters["hits"] += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+                    counters["misses"] += 1
+        if missing:
+            # 编码在锁外进行，避免阻塞其他模型/线程的命中路径
+            vectors = [self._freeze(v) for v in compute([texts[idx[0]] for idx in missing.values()])]
+            with self._lock:
+                for (key, idx), vec in zip(missing.items(), vectors):
+                    for i in idx:
+                        result[i] = vec
+                    old = self._entries.pop(key, None)
+                    if old is not None:
+                        self._bytes -= old.nbytes
+                    self._entries[key] = vec
+                    self._bytes += vec.nbytes
+                while len(self._entries) > self.max_entries:
+                    self._bytes -= self._entries.popitem(last=False)[1].nbytes
+        return result
+
+    def get(self, model: str, text: str, compute: Callable[[List[str]], Sequence]):
+        return self.get_many(model, [text], compute)[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            models = {}
+            for model, c in self._counters.items():
+                total = c["hits"] + c["misses"]
+                models[model] = dict(c, hit_rate=round(c["hits"] / total, 4) if total else 0.0)
+            return {"size": len(self._entries), "max_entries": self.max_entries, "resident_bytes": self._bytes,
+                    "models": models}
+
+
+# 进程内共享
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_SIZE)
+
+
+class CachedEmbeddings(Embeddings):
+    """LangChain Embeddings 包装：embed_query / embed_documents 均经过 embedding_cache"""
+
+    def __init__(self, inner: Embeddings, model_name: str, cache: EmbeddingCache = None):
+        self.inner = inner
+        self.model_name = model_name
+        self.cache = cache or embedding_cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [vec.tolist() for vec in self.cache.get_many(self.model_name, texts, self.inner.embed_documents)]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.cache.get(self.model_name, text, lambda t: [self.inner.embed_query(t[0])]).tolist()
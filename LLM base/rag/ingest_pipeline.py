@@ -0,0 +1,347 @@
+"""
+流式 PDF 入库流水线：parse（进程池）→ split → embed（批量）→ write（Chroma + BM25）
+- 各阶段在独立线程中运行，之间用有界队列连接，内存峰值只与队列长度和 batch 大小相关，与语料规模无关
+- 每个阶段统计处理量与吞吐（parse: pages/s，其余: chunks/s）
+- 与 IngestManifest 配合：按 batch 记录进度，续跑时跳过已写入的 batch
+- 单个 PDF 解析失败（损坏/加密）时跳过该文件并记入报告的 failed_files，不写入清单，下次增量运行会重试；
+  其余阶段（编码、写库）的异常仍中止整个流水线
+- 可选 EncoderPool：每个 embedding 模型一个常驻子进程，同一 batch 同时交给所有模型编码，
+  三个向量库并发写入，总耗时接近最慢模型而非三者之和
+"""
+import os
+import time
+import hashlib
+import queue
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+_END = object()
+
+
+def chunk_id_prefix(fname: str, sha: str) -> str:
+    """chunk id 前缀由文件名 + 内容哈希确定：内容相同的两个文件互不覆盖，删除其一不影响另一个"""
+    return hashlib.blake2b(f"{fname}\0{sha}".encode("utf-8"), digest_size=8).hexdigest()
+
+
+def chunk_ids(prefix: str, n: int):
+    """chunk id = 前缀 + 序号，重跑时幂等"""
+    return [f"{prefix}:{i}" for i in range(n)]
+
+
+def parse_pdf(path):
+    """在子进程中解析 PDF，返回 ([(page_content, metadata)], 耗时秒)"""
+    from langchain_community.document_loaders import PyPDFLoader
+    start = time.perf_counter()
+    pages = [(d.page_content, d.metadata) for d in PyPDFLoader(path).load()]
+    return pages, time.perf_counter() - start
+
+
+_encoder = None
+
+
+def _init_encoder(model_name, batch_size):
+    """编码子进程初始化：模型在进程生命周期内只加载一次"""
+    global _encoder
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    _encoder = HuggingFaceEmbeddings(model_name=model_name, encode_kwargs={"batch_size": batch_size})
+
+
+def _encode(texts):
+    start = time.perf_counter()
+    vectors = _encoder.embed_documents(texts)
+    return vectors, time.perf_counter() - start
+
+
+class EncoderPool:
+    """
+    每个模型一个单进程池（spawn，避免 fork 后 CUDA/线程状态问题），按模型设置编码 batch 大小。
+    models: {tag: 模型名}；batch_sizes: {tag: batch 大小}
+    """
+
+    def __init__(self, models: dict, batch_sizes: dict = None, default_batch_size: int = 32):
+        ctx = multiprocessing.get_context("spawn")
+        batch_sizes = batch_sizes or {}
+        self.pools = {
+            tag: ProcessPoolExecutor(
+                max_workers=1, mp_context=ctx, initializer=_init_encoder,
+                initargs=(model_name, batch_sizes.get(tag, default_batch_size)),
+            )
+            for tag, model_name in models.items()
+        }
+
+    def submit(self, texts) -> dict:
+        """同一批文本同时提交给所有模型，返回 {tag: Future[(vectors, 耗时)]}"""
+        return {tag: pool.submit(_encode, texts) for tag, pool in self.pools.items()}
+
+    def shutdown(self):
+        for pool in self.pools.values():
+            pool.shutdown()
+
+
+class _Aborted(Exception):
+    """其他阶段失败，当前阶段退出"""
+
+
+class StageStats:
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.busy = 0.0
+
+    def record(self, items: int, seconds: float):
+        self.items += items
+        self.busy += seconds
+
+    def as_dict(self, wall: float) -> dict:
+        return {
+            "items": self.items,
+            "unit": self.unit,
+            "busy_s": round(self.busy, 3),
+            f"{self.unit}_per_s": round(self.items / self.busy, 2) if self.busy else None,
+            f"{self.unit}_per_wall_s": round(self.items / wall, 2) if wall else None,
+        }
+
+
+class IngestPipeline:
+    """
+    stores: {tag: Chroma}；bm25: BM25Index；manifest: IngestManifest
+    parse_workers: 解析进程数；queue_size: 阶段间队列容量（单位：文件或 batch）
+    encoders: 可选 EncoderPool；为 None 时在当前进程用各 store 的 embedding 依次编码
+    """
+
+    def __init__(self, stores, bm25, manifest, splitter, batch_size=64, parse_workers=None, queue_size=4,
+                 encoders: EncoderPool = None):
+        self.stores = stores
+        self.bm25 = bm25
+        self.manifest = manifest
+        self.splitter = splitter
+        self.batch_size = batch_size
+        self.parse_workers = parse_workers or max(1, min(4, os.cpu_count() or 1))
+        self.queue_size = queue_size
+        self.encoders = encoders
+        self.model_busy = {tag: 0.0 for tag in stores}
+        self._write_pool = ThreadPoolExecutor(max_workers=len(stores) or 1, thread_name_prefix="ingest-write")
+        self.stats = {
+            "parse": StageStats("parse", "pages"),
+            "split": StageStats("split", "chunks"),
+            "embed": StageStats("embed", "chunks"),
+            "write": StageStats("write", "chunks"),
+        }
+        self.failed_files = {}  # 解析失败而跳过的文件 -> 错误信息
+        self._failed = threading.Event()
+        self._errors = []
+
+    # ---------- 队列工具：失败时不阻塞在满/空队列上 ----------
+
+    def _put(self, q, item):
+        while True:
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                if self._failed.is_set():
+                    raise _Aborted()
+
+    def _get(self, q):
+        while True:
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                if self._failed.is_set():
+                    raise _Aborted()
+
+    def _stage(self, fn, *args):
+        def _run():
+            try:
+                fn(*args)
+            except _Aborted:
+                pass
+            except BaseException as e:
+                self._errors.append(e)
+                self._failed.set()
+        t = threading.Thread(target=_run, daemon=True)
+        t.start()
+        return t
+
+    # ---------- 各阶段 ----------
+
+    def _parse_stage(self, pdf_dir, files, out_q):
+        """进程池解析，滑动窗口限制在途文件数，按提交顺序输出"""
+        window = deque()
+        with ProcessPoolExecutor(max_workers=self.parse_workers) as pool:
+            for fname, sha in files.items():
+                window.append((fname, sha, pool.submit(parse_pdf, os.path.join(pdf_dir, fname))))
+                if len(window) >= self.parse_workers + self.queue_size:
+                    self._emit_parsed(window.popleft(), out_q)
+            while window:
+                self._emit_parsed(window.popleft(), out_q)
+        self._put(out_q, _END)
+
+    def _emit_parsed(self, item, out_q):
+        fname, sha, fut = item
+        try:
+            pages, seconds = fut.result()
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            self.failed_files[fname] = f"{type(e).__name__}: {e}"
+            print(f"[跳过] {fname} 解析失败：{e}")
+            return
+        self.stats["parse"].record(len(pages), seconds)
+        self._put(out_q, (fname, sha, pages))
+
+    def _split_stage(self, resume, in_q, out_q):
+        from langchain_core.documents import Document
+        while True:
+            item = self._get(in_q)
+            if item is _END:
+                break
+            fname, sha, pages = item
+            start = time.perf_counter()
+            splits = self.splitter.split_documents(
+                [Document(page_content=text, metadata=meta) for text, meta in pages]
+            )
+            for doc in splits:
+                doc.metadata["source_hash"] = sha
+            ids = chunk_ids(chunk_id_prefix(fname, sha), len(splits))
+            self.stats["split"].record(len(splits), time.perf_counter() - start)
+            done = resume.get((fname, sha), 0)
+            n_batches = (len(splits) + self.batch_size - 1) // self.batch_size
+            self._put(out_q, {"kind": "file", "fname": fname, "sha": sha, "num_chunks": len(splits)})
+            for b in range(n_batches):
+                lo, hi = b * self.batch_size, (b + 1) * self.batch_size
+                self._put(out_q, {
+                    "kind": "batch",
+                    "fname": fname,
+                    "index": b,
+                    "skip": b < done,  # 续跑：已写入的 batch 不再编码，只参与 BM25
+                    "ids": ids[lo:hi],
+                    "texts": [d.page_content for d in splits[lo:hi]],
+                    "metadatas": [d.metadata for d in splits[lo:hi]],
+                })
+            self._put(out_q, {"kind": "end", "fname": fname})
+        self._put(out_q, _END)
+
+    def _embed_stage(self, in_q, out_q):
+        if self.encoders is not None:
+            return self._embed_stage_parallel(in_q, out_q)
+        while True:
+            item = self._get(in_q)
+            if item is _END:
+                break
+            if item["kind"] == "batch" and not item["skip"]:
+                start = time.perf_counter()
+                item["vectors"] = {}
+                for tag, db in self.stores.items():
+                    t0 = time.perf_counter()
+                    item["vectors"][tag] = db.embeddings.embed_documents(item["texts"])
+                    self.model_busy[tag] += time.perf_counter() - t0
+                self.stats["embed"].record(len(item["texts"]), time.perf_counter() - start)
+            self._put(out_q, item)
+        self._put(out_q, _END)
+
+    def _embed_stage_parallel(self, in_q, out_q):
+        """每个 batch 同时交给所有模型编码；窗口内保留多个在途 batch，让最慢的模型持续满载"""
+        window = deque()
+        while True:
+            item = self._get(in_q)
+            if item is _END:
+                break
+            if item["kind"] == "batch" and not item["skip"]:
+                item["futures"] = self.encoders.submit(item["texts"])
+            window.append(item)
+            if len(window) > self.queue_size:
+                self._emit_embedded(window.popleft(), out_q)
+        while window:
+            self._emit_embedded(window.popleft(), out_q)
+        self._put(out_q, _END)
+
+    def _emit_embedded(self, item, out_q):
+        futures = item.pop("futures", None)
+        if futures is not None:
+            item["vectors"] = {}
+            slowest = 0.0
+            for tag, fut in futures.items():
+                vectors, seconds = fut.result()
+                item["vectors"][tag] = vectors
+                self.model_busy[tag] += seconds
+                slowest = max(slowest, seconds)
+            self.stats["embed"].record(len(item["texts"]), slowest)
+        self._put(out_q, item)
+
+    def _write_stage(self, in_q):
+        manifest = self.manifest
+        pending = None  # 当前文件的 (ids, texts, metadatas)，文件结束时写入 BM25
+        while True:
+            item = self._get(in_q)
+            if item is _END:
+                break
+            kind, fname = item["kind"], item["fname"]
+            if kind == "file":
+                entry = manifest.files.get(fname)
+                if not entry or entry.get("sha256") != item["sha"]:
+                    manifest.files[fname] = {"sha256": item["sha"], "id_prefix": chunk_id_prefix(fname, item["sha"]),
+                                             "status": "partial", "num_chunks": item["num_chunks"],
+                                             "batches_done": 0}
+                    manifest.save()
+                pending = ([], [], [])
+            elif kind == "batch":
+                pending[0].extend(item["ids"])
+                pending[1].extend(item["texts"])
+                pending[2].extend(item["metadatas"])
+                if item["skip"]:
+                    continue
+                start = time.perf_counter()
+                # 三个向量库并发批量 upsert
+                writes = [
+                    self._write_pool.submit(db._collection.upsert, ids=item["ids"], embeddings=item["vectors"][tag],
+                                            documents=item["texts"], metadatas=item["metadatas"])
+                    for tag, db in self.stores.items()
+                ]
+                for fut in writes:
+                    fut.result()
+                manifest.files[fname]["batches_done"] = item["index"] + 1
+                manifest.save()
+                self.stats["write"].record(len(item["ids"]), time.perf_counter() - start)
+            else:
+                # BM25 在文件全部 batch 完成后一次性写入新段，续跑时不会重复
+                self.bm25.add_documents(*pending)
+                manifest.files[fname]["status"] = "done"
+                manifest.save()
+                print(f"[入库] {fname}：{len(pending[0])} 块")
+                pending = None
+
+    # ---------- 入口 ----------
+
+    def run(self, pdf_dir, files: dict) -> dict:
+        """files: {文件名: sha256}；返回各阶段吞吐统计，以及解析失败被跳过的文件 failed_files"""
+        resume = {
+            (fname, entry["sha256"]): entry.get("batches_done", 0)
+            for fname, entry in self.manifest.files.items()
+            if entry.get("status") == "partial"
+        }
+        parsed_q = queue.Queue(maxsize=self.queue_size)
+        split_q = queue.Queue(maxsize=self.queue_size)
+        embedded_q = queue.Queue(maxsize=self.queue_size)
+        start = time.perf_counter()
+        threads = [
+            self._stage(self._parse_stage, pdf_dir, files, parsed_q),
+            self._stage(self._split_stage, resume, parsed_q, split_q),
+            self._stage(self._embed_stage, split_q, embedded_q),
+            self._stage(self._write_stage, embedded_q),
+        ]
+        for t in threads:
+            t.join()
+        self._write_pool.shutdown()
+        if self._errors:
+            raise self._errors[0]
+        wall = time.perf_counter() - start
+        report = {name: stats.as_dict(wall) for name, stats in self.stats.items()}
+        report["embed_models_busy_s"] = {tag: round(sec, 3) for tag, sec in self.model_busy.items()}
+        report["wall_s"] = round(wall, 3)
+        report["failed_files"] = dict(self.failed_files)
+        return report
@@ -1,19 +1,30 @@
 
 import os
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 # LangChain 0.2+ 将 vectorstores/embeddings/retrievers 迁移到 langchain_community
 # LangChain 新版本将模块迁移到 langchain_community，兼容多种版本
 try:
     from langchain_community.vectorstores import Chroma
     from langchain_community.embeddings import HuggingFaceEmbeddings
-    from langchain_community.retrievers import BM25Retriever
 except ImportError:
     from langchain.vectorstores import Chroma
     from langchain.embeddings import HuggingFaceEmbeddings
-    from langchain.retrievers import BM25Retriever
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    from langchain.schema import Document
 
 from langchain_openai import OpenAI
 import requests
 from collections import defaultdict
+from typing import Optional
+
+from rag.bm25_index import BM25Index, bm25_dir
+from rag.answer_cache import SemanticAnswerCache
+from rag.embedding_cache import CachedEmbeddings, embedding_cache
 
 def rrf_fusion(results_lists, k=60):
     """
@@ -51,32 +62,63 @@ def cohere_semantic_rerank(query, docs, cohere_api_key, top_n=5, use_cohere=Fals
 
 # 1. 加载Chroma向量库
 
+# 多表征模型配置：(子目录tag, HuggingFace 模型名)
+EMBEDDING_CONFIGS = [
+    ("bge-base-zh-v1.5", "BAAI/bge-base-zh-v1.5"),
+    ("text2vec-base-chinese", "GanymedeNil/text2vec-base-chinese"),
+    ("e5-base", "intfloat/e5-base"),
+]
+MAIN_TAG = "bge-base-zh-v1.5"
+
+
 def load_multi_chroma(persist_root="./chroma_db_multi"):
     """
     加载多表征Chroma索引，返回dict: tag->vectordb
+    各库的 embedding 经过进程内共享的向量缓存，相同查询文本每个模型只编码一次
     """
-    configs = [
-        ("bge-base-zh-v1.5", "BAAI/bge-base-zh-v1.5"),
-        ("text2vec-base-chinese", "GanymedeNil/text2vec-base-chinese"),
-        ("e5-base", "intfloat/e5-base"),
-    ]
     dbs = {}
-    for tag, model_name in configs:
+    for tag, model_name in EMBEDDING_CONFIGS:
         persist_dir = os.path.join(persist_root, tag)
-        embeddings = HuggingFaceEmbeddings(model_name=model_name)
+        embeddings = CachedEmbeddings(HuggingFaceEmbeddings(model_name=model_name), model_name)
         dbs[tag] = Chroma(persist_directory=persist_dir, embedding_function=embeddings)
     return dbs
 
+
+def load_bm25_index(persist_root, main_db=None) -> BM25Index:
+    """
+    打开 persist_root/bm25 下的持久化 BM25 索引（mmap）。
+    索引不存在而主向量库已有数据时，从主库一次性构建并落盘（多进程同时启动时只有一个进程构建）。
+    """
+    index = BM25Index.open(bm25_dir(persist_root))
+    if index.num_docs == 0 and main_db is not None:
+        def fetch():
+            data = main_db.get(include=["documents", "metadatas"])
+            return data.get("ids") or [], data.get("documents") or [], data.get("metadatas")
+
+        index.add_if_empty(fetch)
+    return index
+
+
+def bm25_search(bm25: BM25Index, query, k=5):
+    """BM25 检索，返回 Document 列表"""
+    return [Document(page_content=doc["text"], metadata=doc.get("metadata") or {})
+            for _, doc in bm25.search(query, k)]
+
 # 2. 构建 BM25+向量 混合检索器（使用 rrf_fusion，不依赖 EnsembleRetriever）
 
 def build_adaptive_retriever(multi_dbs, docs, query, top_k=5):
     """
     自适应融合 BM25 和多表征向量检索，使用 RRF 融合。
     不依赖 EnsembleRetriever，兼容不同 LangChain 版本。
+    docs: 持久化 BM25Index，或文本列表（构建临时内存索引）
     """
-    bm25_retriever = BM25Retriever.from_documents(docs)
-    bm25_retriever.k = top_k
-    retrievers = [bm25_retriever] + [db.as_retriever(search_kwargs={"k": top_k}) for db in multi_dbs.values()]
+    bm25 = docs if isinstance(docs, BM25Index) else BM25Index.from_texts(list(docs))
+
+    class _BM25Leg:
+        def get_relevant_documents(self, q):
+            return bm25_search(bm25, q, top_k)
+
+    retrievers = [_BM25Leg()] + [db.as_retriever(search_kwargs={"k": top_k}) for db in multi_dbs.values()]
 
     class RRFEnsembleRetriever:
         def get_relevant_documents(self, q):
@@ -87,35 +129,87 @@ def build_adaptive_retriever(multi_dbs, docs, query, top_k=5):
 
 # 3. RAG 检索+生成（不依赖 RetrievalQA，兼容各版本 LangChain）
 
-def _custom_retrieve(multi_dbs, docs, query, top_k, rerank_top_n, cohere_api_key, use_cohere):
-    """多路检索：BM25 + 向量，RRF 融合，可选 Cohere 重排"""
-    results_lists = []
-    bm25 = BM25Retriever.from_documents(docs)
-    bm25.k = top_k
-    results_lists.append(bm25.get_relevant_documents(query))
-    for db in multi_dbs.values():
-        retr = db.as_retriever(search_kwargs={"k": top_k})
-        results_lists.append(retr.get_relevant_documents(query))
+def _timed_call(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def multi_retrieve(multi_dbs, bm25, query, top_k, executor=None, leg_timeout=None):
+    """
+    执行 BM25 + 各向量库检索，返回 (results_lists, timings)。
+    - executor 为 None 时串行执行；否则各路并发执行，总等待不超过 leg_timeout 秒，
+      超时或异常的一路不参与 RRF 融合，超时时尚未开始执行的一路被取消
+    - timings: {路名: {"status": ok|timeout|error, "ms": 耗时}}
+    """
+    legs = [("bm25", lambda: bm25_search(bm25, query, top_k))]
+    for tag, db in multi_dbs.items():
+        legs.append((tag, lambda db=db: db.similarity_search(query, k=top_k)))
+
+    results_lists, timings = [], {}
+    if executor is None:
+        for name, fn in legs:
+            docs, elapsed = _timed_call(fn)
+            results_lists.append(docs)
+            timings[name] = {"status": "ok", "ms": round(elapsed * 1000, 1)}
+        return results_lists, timings
+
+    start = time.perf_counter()
+    futures = [(name, executor.submit(_timed_call, fn)) for name, fn in legs]
+    for name, fut in futures:
+        remaining = None
+        if leg_timeout is not None:
+            remaining = max(0.0, leg_timeout - (time.perf_counter() - start))
+        try:
+            docs, elapsed = fut.result(timeout=remaining)
+            results_lists.append(docs)
+            timings[name] = {"status": "ok", "ms": round(elapsed * 1000, 1)}
+        except FuturesTimeout:
+            # 还在排队未开始的一路直接取消，不再占用共享线程池拖慢下一次查询
+            fut.cancel()
+            timings[name] = {"status": "timeout", "ms": round((time.perf_counter() - start) * 1000, 1)}
+        except Exception as e:
+            timings[name] = {"status": "error", "ms": round((time.perf_counter() - start) * 1000, 1), "error": str(e)}
+    return results_lists, timings
+
+
+def _store_search_batch(db, queries, top_k):
+    """单个向量库的批量检索：一次批量编码所有 query，一次向量化 query 调用取回全部结果"""
+    vectors = db.embeddings.embed_documents(list(queries))
+    res = db._collection.query(query_embeddings=vectors, n_results=top_k, include=["documents", "metadatas"])
+    return [
+        [Document(page_content=text, metadata=meta or {}) for text, meta in zip(texts, metas)]
+        for texts, metas in zip(res["documents"], res["metadatas"])
+    ]
+
+
+def multi_retrieve_batch(multi_dbs, bm25, queries, top_k, executor=None):
+    """
+    批量多路检索，返回每个 query 的 results_lists（BM25 + 各向量库）。
+    每个模型只做一次批量前向，每个库只发一次 query；有 executor 时各库并发。
+    """
+    per_query = [[bm25_search(bm25, q, top_k)] for q in queries]
+    if executor is None:
+        store_results = [_store_search_batch(db, queries, top_k) for db in multi_dbs.values()]
+    else:
+        futures = [executor.submit(_store_search_batch, db, queries, top_k) for db in multi_dbs.values()]
+        store_results = [f.result() for f in futures]
+    for results in store_results:
+        for i, docs in enumerate(results):
+            per_query[i].append(docs)
+    return per_query
+
+
+def _custom_retrieve(multi_dbs, bm25, query, top_k, rerank_top_n, cohere_api_key, use_cohere,
+                     executor=None, leg_timeout=None):
+    """多路检索：BM25 + 向量（可并发），RRF 融合，可选 Cohere 重排"""
+    results_lists, _ = multi_retrieve(multi_dbs, bm25, query, top_k, executor=executor, leg_timeout=leg_timeout)
     fused = rrf_fusion(results_lists, k=60)
     return cohere_semantic_rerank(query, fused, cohere_api_key, top_n=rerank_top_n, use_cohere=use_cohere)
 
 
-def build_adaptive_rag_chain(qwen_api_base, qwen_api_key, cohere_api_key, persist_root="./chroma_db_multi", query="", top_k=5, rerank_top_n=5, use_cohere=False):
-    """构建 RAG 链（ manual 实现，无 RetrievalQA 依赖）"""
-    multi_dbs = load_multi_chroma(persist_root)
-    main_db = multi_dbs["bge-base-zh-v1.5"]
-    docs = main_db.get()["documents"]
-    llm = OpenAI(
-        openai_api_base=qwen_api_base,
-        openai_api_key=qwen_api_key,
-        model_name="qwen-turbo",
-        temperature=0.2
-    )
-
-    def run_rag(q: str):
-        retrieved = _custom_retrieve(multi_dbs, docs, q, top_k, rerank_top_n, cohere_api_key, use_cohere)
-        context = "\n\n".join(getattr(d, "page_content", str(d)) for d in retrieved)
-        prompt = f"""基于以下参考内容回答问题。如果参考内容中没有相关信息，请基于常识回答。
+def _build_prompt(context: str, q: str) -> str:
+    return f"""基于以下参考内容回答问题。如果参考内容中没有相关信息，请基于常识回答。
 
 参考内容：
 {context}
@@ -123,19 +217,253 @@ def build_adaptive_rag_chain(qwen_api_base, qwen_api_key, cohere_api_key, persis
 问题：{q}
 
 请给出简洁准确的回答："""
-        return llm.invoke(prompt), retrieved
+
+
+class RetrievalEngine:
+    """
+    常驻检索引擎：embedding 模型、Chroma 向量库、BM25 索引与 LLM 客户端在进程内只加载一次，
+    之后所有 RAG 查询共享，避免每次调用都重新加载模型和向量库。
+    - warm_up(): 同步加载（幂等、线程安全）
+    - warm_up_async(): 后台线程预热，供服务启动时使用
+    - ready / status(): 就绪信号，供 /health 上报
+    - parallel=True 时 BM25 与三路向量检索并发执行，leg_timeout 秒内未返回的一路被丢弃
+    - answer_cache: 可选语义答案缓存，answer_text() 先查缓存；索引更新时整体失效
+    """
+
+    def __init__(self, qwen_api_base, qwen_api_key, cohere_api_key="", persist_root="./chroma_db_multi",
+                 use_cohere=False, parallel=True, leg_timeout=None,
+                 answer_cache: Optional[SemanticAnswerCache] = None):
+        self.qwen_api_base = qwen_api_base
+        self.qwen_api_key = qwen_api_key
+        self.cohere_api_key = cohere_api_key
+        self.persist_root = persist_root
+        self.use_cohere = use_cohere
+        self.leg_timeout = leg_timeout
+        # 超时的检索仍会占用线程直到返回，线程数留出余量
+        self.executor = ThreadPoolExecutor(
+            max_workers=4 * (len(EMBEDDING_CONFIGS) + 1), thread_name_prefix="rag-leg"
+        ) if parallel else None
+        self.answer_cache = answer_cache
+        if answer_cache is not None and answer_cache.embed_fn is None:
+            answer_cache.embed_fn = self._embed_main_query
+        self.multi_dbs = None
+        self.bm25 = None
+        self.llm = None
+        self.load_seconds = None
+        self.load_error = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        # 问答路径的检索耗时累计：{"queries", "total_ms", "legs": {路名: {"calls", "ms", "timeout", "error"}}}
+        self._timing_lock = threading.Lock()
+        self._retrieval_stats = {"queries": 0, "total_ms": 0.0, "legs": {}}
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def warm_up(self):
+        """加载模型、向量库、语料与 LLM 客户端；已就绪时直接返回"""
+        if self._ready.is_set():
+            return self
+        with self._lock:
+            if self._ready.is_set():
+                return self
+            start = time.time()
+            try:
+                self.multi_dbs = load_multi_chroma(self.persist_root)
+                self.bm25 = load_bm25_index(self.persist_root, self.multi_dbs[MAIN_TAG])
+                self.llm = OpenAI(
+                    openai_api_base=self.qwen_api_base,
+                    openai_api_key=self.qwen_api_key,
+                    model_name="qwen-turbo",
+                    temperature=0.2
+                )
+            except Exception as e:
+                self.load_error = str(e)
+                raise
+            self.load_error = None
+            self.load_seconds = round(time.time() - start, 3)
+            self._ready.set()
+        return self
+
+    def warm_up_async(self) -> threading.Thread:
+        """后台线程预热，异常记录在 load_error 中，首次查询时会重试"""
+        def _run():
+            try:
+                self.warm_up()
+            except Exception as e:
+                # MCP stdio 模式下 stdout 用于协议通信，日志写 stderr
+                print(f"RAG 引擎预热失败: {e}", file=sys.stderr)
+
+        t = threading.Thread(target=_run, name="rag-warmup", daemon=True)
+        t.start()
+        return t
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "persist_root": self.persist_root,
+            "corpus_size": self.bm25.num_docs if self.bm25 is not None else 0,
+            "load_seconds": self.load_seconds,
+            "error": self.load_error,
+            "answer_cache": self.answer_cache.stats() if self.answer_cache is not None else None,
+            "embedding_cache": embedding_cache.stats(),
+            "retrieval": self.retrieval_stats(),
+        }
+
+    def _record_timings(self, query, detail: dict) -> None:
+        """累计各路检索耗时；有路超时或出错（结果降级）时写 stderr"""
+        timings = detail["timings"]
+        with self._timing_lock:
+            stats = self._retrieval_stats
+            stats["queries"] += 1
+            stats["total_ms"] += detail["total_ms"]
+            for name, t in timings.items():
+                leg = stats["legs"].setdefault(name, {"calls": 0, "ms": 0.0, "timeout": 0, "error": 0})
+                leg["calls"] += 1
+                leg["ms"] += t["ms"]
+                if t["status"] != "ok":
+                    leg[t["status"]] += 1
+        degraded = {name: t for name, t in timings.items() if t["status"] != "ok"}
+        if degraded:
+            print(f"RAG 检索降级: query={query[:50]!r} total_ms={detail['total_ms']} legs={degraded}", file=sys.stderr)
+
+    def retrieval_stats(self) -> dict:
+        """问答路径的检索耗时汇总：平均总耗时、各路平均耗时与超时/出错次数"""
+        with self._timing_lock:
+            stats = self._retrieval_stats
+            queries = stats["queries"]
+            return {
+                "queries": queries,
+                "avg_total_ms": round(stats["total_ms"] / queries, 1) if queries else 0.0,
+                "legs": {
+                    name: {"calls": leg["calls"], "avg_ms": round(leg["ms"] / leg["calls"], 1),
+                           "timeout": leg["timeout"], "error": leg["error"]}
+                    for name, leg in stats["legs"].items()
+                },
+            }
+
+    def _embed_main_query(self, text):
+        self.warm_up()
+        return self.multi_dbs[MAIN_TAG].embeddings.embed_query(text)
+
+    def _refresh_index(self):
+        """build_vector_db 增量写入后自动加载新段，并使答案缓存失效"""
+        if self.bm25.refresh() and self.answer_cache is not None:
+            self.answer_cache.invalidate()
+
+    def retrieve_detailed(self, query, top_k=5, rerank_top_n=5) -> dict:
+        """检索并返回 {"docs": 融合重排后的片段, "timings": 各路耗时, "total_ms": 总耗时}"""
+        self.warm_up()
+        self._refresh_index()
+        start = time.perf_counter()
+        results_lists, timings = multi_retrieve(self.multi_dbs, self.bm25, query, top_k,
+                                                executor=self.executor, leg_timeout=self.leg_timeout)
+        fused = rrf_fusion(results_lists, k=60)
+        docs = cohere_semantic_rerank(query, fused, self.cohere_api_key, top_n=rerank_top_n,
+                                      use_cohere=self.use_cohere)
+        return {"docs": docs, "timings": timings, "total_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+    def retrieve(self, query, top_k=5, rerank_top_n=5):
+        return self.retrieve_detailed(query, top_k=top_k, rerank_top_n=rerank_top_n)["docs"]
+
+    def retrieve_batch(self, queries, top_k=5, rerank_top_n=5):
+        """批量检索，返回与 queries 一一对应的融合片段列表"""
+        queries = list(queries)
+        if not queries:
+            return []
+        self.warm_up()
+        self._refresh_index()
+        per_query = multi_retrieve_batch(self.multi_dbs, self.bm25, queries, top_k, executor=self.executor)
+        return [
+            cohere_semantic_rerank(q, rrf_fusion(results_lists, k=60), self.cohere_api_key,
+                                   top_n=rerank_top_n, use_cohere=self.use_cohere)
+            for q, results_lists in zip(queries, per_query)
+        ]
+
+    def answer_batch(self, queries, top_k=5, rerank_top_n=5):
+        """批量问答：批量检索后并发生成，返回 [(LLM 回答, 检索片段)]"""
+        queries = list(queries)
+        retrieved_lists = self.retrieve_batch(queries, top_k=top_k, rerank_top_n=rerank_top_n)
+        prompts = [
+            _build_prompt("\n\n".join(getattr(d, "page_content", str(d)) for d in retrieved), q)
+            for q, retrieved in zip(queries, retrieved_lists)
+        ]
+        answers = self.llm.batch(prompts) if prompts else []
+        return list(zip(answers, retrieved_lists))
+
+    def answer(self, query, top_k=5, rerank_top_n=5):
+        """返回 (LLM 回答, 检索片段)；检索各路耗时计入 retrieval_stats()"""
+        detail = self.retrieve_detailed(query, top_k=top_k, rerank_top_n=rerank_top_n)
+        self._record_timings(query, detail)
+        retrieved = detail["docs"]
+        context = "\n\n".join(getattr(d, "page_content", str(d)) for d in retrieved)
+        return self.llm.invoke(_build_prompt(context, query)), retrieved
+
+    def answer_text(self, query, top_k=5, rerank_top_n=5, cache_scope: str = "") -> str:
+        """带语义缓存的问答，返回回答文本；cache_scope（如专利号）不同的查询互不命中"""
+        self.warm_up()
+        self._refresh_index()
+        cache = self.answer_cache
+        tag = f"{top_k}:{rerank_top_n}:{cache_scope}"
+        vector = None
+        if cache is not None:
+            cached, vector = cache.lookup(query, tag)
+            if cached is not None:
+                return cached
+        ans, _ = self.answer(query, top_k=top_k, rerank_top_n=rerank_top_n)
+        text = ans.content if hasattr(ans, "content") else str(ans)
+        if cache is not None:
+            cache.put(query, text, tag, vector=vector)
+        return text
+
+
+# 进程级引擎注册表：同一 persist_root 只保留一个常驻引擎
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_retrieval_engine(qwen_api_base, qwen_api_key, cohere_api_key="", persist_root="./chroma_db_multi",
+                         use_cohere=False, parallel=True, leg_timeout=None,
+                         answer_cache: Optional[SemanticAnswerCache] = None) -> RetrievalEngine:
+    """获取（必要时创建）进程共享的检索引擎；LLM、并发与缓存配置以首次创建时为准"""
+    key = os.path.abspath(persist_root)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = RetrievalEngine(qwen_api_base, qwen_api_key, cohere_api_key,
+                                     persist_root=persist_root, use_cohere=use_cohere,
+                                     parallel=parallel, leg_timeout=leg_timeout, answer_cache=answer_cache)
+            _engines[key] = engine
+        return engine
+
+
+def build_adaptive_rag_chain(qwen_api_base, qwen_api_key, cohere_api_key, persist_root="./chroma_db_multi", query="", top_k=5, rerank_top_n=5, use_cohere=False):
+    """构建 RAG 链（ manual 实现，无 RetrievalQA 依赖），底层复用进程共享的检索引擎"""
+    engine = get_retrieval_engine(qwen_api_base, qwen_api_key, cohere_api_key,
+                                  persist_root=persist_root, use_cohere=use_cohere)
+
+    def run_rag(q: str):
+        return engine.answer(q, top_k=top_k, rerank_top_n=rerank_top_n)
 
     return run_rag
 
 
 def adaptive_rag_answer(query, qwen_api_base, qwen_api_key, cohere_api_key, top_k=5, rerank_top_n=5,
                        use_cohere=False, persist_root="./chroma_db_multi"):
-    run_rag = build_adaptive_rag_chain(
-        qwen_api_base, qwen_api_key, cohere_api_key,
-        persist_root=persist_root, query=query, top_k=top_k, rerank_top_n=rerank_top_n, use_cohere=use_cohere
-    )
-    ans, _ = run_rag(query)
-    return ans.content if hasattr(ans, "content") else str(ans)
+    """单次问答；引擎配置了答案缓存时先查缓存"""
+    engine = get_retrieval_engine(qwen_api_base, qwen_api_key, cohere_api_key,
+                                  persist_root=persist_root, use_cohere=use_cohere)
+    return engine.answer_text(query, top_k=top_k, rerank_top_n=rerank_top_n)
+
+
+def adaptive_rag_answer_batch(queries, qwen_api_base, qwen_api_key, cohere_api_key, top_k=5, rerank_top_n=5,
+                             use_cohere=False, persist_root="./chroma_db_multi"):
+    """批量版 adaptive_rag_answer，返回与 queries 一一对应的回答文本"""
+    engine = get_retrieval_engine(qwen_api_base, qwen_api_key, cohere_api_key,
+                                  persist_root=persist_root, use_cohere=use_cohere)
+    return [ans.content if hasattr(ans, "content") else str(ans)
+            for ans, _ in engine.answer_batch(queries, top_k=top_k, rerank_top_n=rerank_top_n)]
 
 
 if __name__ == "__main__":
@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\trag.proto\"3\n\nRagRequest\x12\x12\n\nuser_query\x18\x01 \x01(\t\x12\x11\n\tpatent_no\x18\x02 \x01(\t\"\x1d\n\x0bRagResponse\x12\x0e\n\x06\x61nswer\x18\x01 \x01(\t\"&\n\x11PatentInfoRequest\x12\x11\n\tpatent_no\x18\x01 \x01(\t\")\n\x12PatentInfoResponse\x12\x13\n\x0bpatent_info\x18\x01 \x01(\t\".\n\x19\x45nterpriseInterestRequest\x12\x11\n\tpatent_no\x18\x01 \x01(\t\"4\n\x1a\x45nterpriseInterestResponse\x12\x16\n\x0einterest_level\x18\x01 \x01(\t\"\x1d\n\x0c\x41gentRequest\x12\r\n\x05query\x18\x01 \x01(\t\"\x1f\n\rAgentResponse\x12\x0e\n\x06\x61nswer\x18\x01 \x01(\t2\xc3\x01\n\nRagService\x12)\n\x0cGetRagAnswer\x12\x0b.RagRequest\x1a\x0c.RagResponse\x12\x38\n\rGetPatentInfo\x12\x12.PatentInfoRequest\x1a\x13.PatentInfoResponse\x12P\n\x15GetEnterpriseInterest\x12\x1a.EnterpriseInterestRequest\x1a\x1b.EnterpriseInterestResponse25\n\x0c\x41gentService\x12%\n\x04\x43hat\x12\r.AgentRequest\x1a\x0e.AgentResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\trag.proto\"3\n\nRagRequest\x12\x12\n\nuser_query\x18\x01 \x01(\t\x12\x11\n\tpatent_no\x18\x02 \x01(\t\"\x1d\n\x0bRagResponse\x12\x0e\n\x06\x61nswer\x18\x01 \x01(\t\"&\n\x11PatentInfoRequest\x12\x11\n\tpatent_no\x18\x01 \x01(\t\")\n\x12PatentInfoResponse\x12\x13\n\x0bpatent_info\x18\x01 \x01(\t\".\n\x19\x45nterpriseInterestRequest\x12\x11\n\tpatent_no\x18\x01 \x01(\t\"4\n\x1a\x45nterpriseInterestResponse\x12\x16\n\x0einterest_level\x18\x01 \x01(\t\"B\n\x0c\x41gentRequest\x12\r\n\x05query\x18\x01 \x01(\t\x12\x0f\n\x07user_id\x18\x02 \x01(\t\x12\x12\n\nsession_id\x18\x03 \x01(\t\"\x1f\n\rAgentResponse\x12\x0e\n\x06\x61nswer\x18\x01 \x01(\t\"K\n\nAgentEvent\x12\x0c\n\x04type\x18\x01 \x01(\t\x12\r\n\x05stage\x18\x02 \x01(\t\x12\x0f\n\x07\x63ontent\x18\x03 \x01(\t\x12\x0f\n\x07ttft_ms\x18\x04 \x01(\x01\"9\n\x16\x43\x61\x63heInvalidateRequest\x12\x11\n\tpatent_no\x18\x01 \x01(\t\x12\x0c\n\x04tool\x18\x02 \x01(\t\".\n\x17\x43\x61\x63heInvalidateResponse\x12\x13\n\x0binvalidated\x18\x01 \x01(\x05\x32\xc3\x01\n\nRagService\x12)\n\x0cGetRagAnswer\x12\x0b.RagRequest\x1a\x0c.RagResponse\x12\x38\n\rGetPatentInfo\x12\x12.PatentInfoRequest\x1a\x13.PatentInfoResponse\x12P\n\x15GetEnterpriseInterest\x12\x1a.EnterpriseInterestRequest\x1a\x1b.EnterpriseInterestResponse2\xab\x01\n\x0c\x41gentService\x12%\n\x04\x43hat\x12\r.AgentRequest\x1a\x0e.AgentResponse\x12*\n\nChatStream\x12\r.AgentRequest\x1a\x0b.AgentEvent0\x01\x12H\n\x13InvalidateToolCache\x12\x17.CacheInvalidateRequest\x1a\x18.CacheInvalidateResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -44,11 +44,17 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_ENTERPRISEINTERESTRESPONSE']._serialized_start=228
   _globals['_ENTERPRISEINTERESTRESPONSE']._serialized_end=280
   _globals['_AGENTREQUEST']._serialized_start=282
-  _globals['_AGENTREQUEST']._serialized_end=311
-  _globals['_AGENTRESPONSE']._serialized_start=313
-  _globals['_AGENTRESPONSE']._serialized_end=344
-  _globals['_RAGSERVICE']._serialized_start=347
-  _globals['_RAGSERVICE']._serialized_end=542
-  _globals['_AGENTSERVICE']._serialized_start=544
-  _globals['_AGENTSERVICE']._serialized_end=597
+  _globals['_AGENTREQUEST']._serialized_end=348
+  _globals['_AGENTRESPONSE']._serialized_start=350
+  _globals['_AGENTRESPONSE']._serialized_end=381
+  _globals['_AGENTEVENT']._serialized_start=383
+  _globals['_AGENTEVENT']._serialized_end=458
+  _globals['_CACHEINVALIDATEREQUEST']._serialized_start=460
+  _globals['_CACHEINVALIDATEREQUEST']._serialized_end=517
+  _globals['_CACHEINVALIDATERESPONSE']._serialized_start=519
+  _globals['_CACHEINVALIDATERESPONSE']._serialized_end=565
+  _globals['_RAGSERVICE']._serialized_start=568
+  _globals['_RAGSERVICE']._serialized_end=763
+  _globals['_AGENTSERVICE']._serialized_start=766
+  _globals['_AGENTSERVICE']._serialized_end=937
 # @@protoc_insertion_point(module_scope)
@@ -197,6 +197,16 @@ class AgentServiceStub(object):
                 request_serializer=rag__pb2.AgentRequest.SerializeToString,
                 response_deserializer=rag__pb2.AgentResponse.FromString,
                 _registered_method=True)
+        self.ChatStream = channel.unary_stream(
+                '/AgentService/ChatStream',
+                request_serializer=rag__pb2.AgentRequest.SerializeToString,
+                response_deserializer=rag__pb2.AgentEvent.FromString,
+                _registered_method=True)
+        self.InvalidateToolCache = channel.unary_unary(
+                '/AgentService/InvalidateToolCache',
+                request_serializer=rag__pb2.CacheInvalidateRequest.SerializeToString,
+                response_deserializer=rag__pb2.CacheInvalidateResponse.FromString,
+                _registered_method=True)
 
 
 class AgentServiceServicer(object):
@@ -208,6 +218,20 @@ class AgentServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def ChatStream(self, request, context):
+        """流式：逐 token 与推理步骤事件
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def InvalidateToolCache(self, request, context):
+        """业务数据变更后失效工具缓存
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_AgentServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -216,6 +240,16 @@ def add_AgentServiceServicer_to_server(servicer, server):
                     request_deserializer=rag__pb2.AgentRequest.FromString,
                     response_serializer=rag__pb2.AgentResponse.SerializeToString,
             ),
+            'ChatStream': grpc.unary_stream_rpc_method_handler(
+                    servicer.ChatStream,
+                    request_deserializer=rag__pb2.AgentRequest.FromString,
+                    response_serializer=rag__pb2.AgentEvent.SerializeToString,
+            ),
+            'InvalidateToolCache': grpc.unary_unary_rpc_method_handler(
+                    servicer.InvalidateToolCache,
+                    request_deserializer=rag__pb2.CacheInvalidateRequest.FromString,
+                    response_serializer=rag__pb2.CacheInvalidateResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'AgentService', rpc_method_handlers)
@@ -253,3 +287,57 @@ class AgentService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def ChatStream(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/AgentService/ChatStream',
+            rag__pb2.AgentRequest.SerializeToString,
+            rag__pb2.AgentEvent.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def InvalidateToolCache(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/AgentService/InvalidateToolCache',
+            rag__pb2.CacheInvalidateRequest.SerializeToString,
+            rag__pb2.CacheInvalidateResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
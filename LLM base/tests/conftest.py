@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 测试从仓库的 "LLM base" 目录导入 agent / rag 包
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -0,0 +1,41 @@
+from rag.answer_cache import SemanticAnswerCache, extract_identifiers
+
+
+def _constant_embed(_query):
+    # 最坏情况：所有 query 向量完全相同（余弦相似度 1.0）
+    return [1.0, 0.0, 0.0]
+
+
+def test_default_queries_for_different_patents_do_not_share_entry():
+    cache = SemanticAnswerCache(embed_fn=_constant_embed, similarity_threshold=0.95)
+    query_a = "专利 CN112345678A 的相关信息、技术要点、应用场景"
+    query_b = "专利 CN198765432B 的相关信息、技术要点、应用场景"
+    cache.put(query_a, "answer for A", tag="5:5")
+
+    answer, _ = cache.lookup(query_b, tag="5:5")
+
+    assert answer is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_semantic_hit_requires_same_patent_number():
+    cache = SemanticAnswerCache(embed_fn=_constant_embed, similarity_threshold=0.95)
+    cache.put("专利 CN112345678A 的技术要点", "answer for A", tag="5:5")
+
+    answer, _ = cache.lookup("请介绍专利CN112345678A的技术要点", tag="5:5")
+
+    assert answer == "answer for A"
+    assert cache.stats()["hits_semantic"] == 1
+
+
+def test_scope_tag_separates_identical_queries():
+    cache = SemanticAnswerCache(embed_fn=_constant_embed)
+    cache.put("技术要点是什么", "answer for A", tag="5:5:CN112345678A")
+
+    assert cache.get("技术要点是什么", tag="5:5:CN198765432B") is None
+    assert cache.get("技术要点是什么", tag="5:5:CN112345678A") == "answer for A"
+
+
+def test_extract_identifiers():
+    assert extract_identifiers("对比 cn112345678a 与申请号 202010123456.7") == \
+        frozenset({"CN112345678A", "202010123456.7"})
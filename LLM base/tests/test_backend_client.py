@@ -0,0 +1,103 @@
+import asyncio
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from agent.backend_client import BackendClient
+
+
+class _Backend(BaseHTTPRequestHandler):
+    """本地替身后端：/slow 延迟返回，/flaky 首次 503，/down 始终 503"""
+    hits = Counter()
+
+    def _handle(self):
+        path = self.path.split("?")[0]
+        _Backend.hits[path] += 1
+        if path == "/slow":
+            time.sleep(0.2)
+        if path == "/down" or (path == "/flaky" and _Backend.hits[path] == 1):
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps({"code": 1, "data": path}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self._handle()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def backend():
+    _Backend.hits.clear()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Backend)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _run(base_url, fn, **kwargs):
+    async def main():
+        client = BackendClient(base_url, backoff=0.01, **kwargs)
+        try:
+            return await fn(client), client.stats()
+        finally:
+            await client.aclose()
+    return asyncio.run(main())
+
+
+def test_identical_idempotent_requests_are_coalesced(backend):
+    async def fn(client):
+        return await asyncio.gather(*(client.request("/slow", params={"no": "CN1"}, idempotent=True)
+                                      for _ in range(5)))
+
+    results, stats = _run(backend, fn)
+    assert all(r == {"code": 1, "data": "/slow"} for r in results)
+    assert _Backend.hits["/slow"] == 1
+    assert stats["coalesced"] == 4 and stats["backend_calls"] == 1 and stats["inflight"] == 0
+
+
+def test_different_params_are_not_coalesced(backend):
+    async def fn(client):
+        return await asyncio.gather(client.request("/slow", method="GET", params={"no": "CN1"}),
+                                    client.request("/slow", method="GET", params={"no": "CN2"}))
+
+    _, stats = _run(backend, fn)
+    assert _Backend.hits["/slow"] == 2 and stats["coalesced"] == 0
+
+
+def test_503_is_retried_then_succeeds(backend):
+    result, stats = _run(backend, lambda client: client.request("/flaky", method="GET"))
+    assert result == {"code": 1, "data": "/flaky"}
+    assert _Backend.hits["/flaky"] == 2
+    assert stats["retries"] == 1 and stats["errors"] == 0
+
+
+def test_retries_are_bounded(backend):
+    result, stats = _run(backend, lambda client: client.request("/down", method="GET"), retries=2)
+    assert result["code"] == 503
+    assert _Backend.hits["/down"] == 3 and stats["errors"] == 1
+
+
+def test_non_idempotent_request_is_not_retried(backend):
+    result, stats = _run(backend, lambda client: client.request("/flaky", json_data={"a": 1}))
+    assert result["code"] == 503
+    assert _Backend.hits["/flaky"] == 1
+    assert stats["retries"] == 0 and stats["backend_calls"] == 1
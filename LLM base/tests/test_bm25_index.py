@@ -0,0 +1,91 @@
+import multiprocessing
+import os
+
+from rag.bm25_index import BM25Index
+
+
+def _corpus(n):
+    return [f"专利{i} 涉及锂电池 电极材料 第{i}号方案" + " 储能" * (i % 3) for i in range(n)]
+
+
+def test_corpus_totals_track_segments(tmp_path):
+    index = BM25Index.open(str(tmp_path / "bm25"), max_segments=4)
+    texts = _corpus(30)
+    for i, text in enumerate(texts):
+        index.add_documents([str(i)], [text])
+    index.delete(["3", "7"])
+
+    _, n_docs, total_len = index._view
+    assert n_docs == sum(seg.num_docs for seg in index.segments)
+    assert total_len == sum(sum(seg.doc_len) for seg in index.segments)
+
+    reopened = BM25Index.open(str(tmp_path / "bm25"))
+    assert reopened._view[1:] == index._view[1:]
+    assert [d["id"] for _, d in reopened.search("锂电池 储能", k=5)] == \
+        [d["id"] for _, d in index.search("锂电池 储能", k=5)]
+
+
+def test_size_tiered_merge_keeps_large_segment(tmp_path):
+    index = BM25Index.open(str(tmp_path / "bm25"), max_segments=8, merge_factor=4)
+    big = _corpus(200)
+    index.add_documents([f"big{i}" for i in range(len(big))], big)
+    big_segment = index.segments[0].name
+    for i in range(40):
+        index.add_documents([f"small{i}"], [f"小文件 {i} 的正文"])
+
+    assert len(index.segments) <= 8
+    assert index.segments[0].name == big_segment
+    assert index.num_docs == 240
+
+
+def test_merge_drops_tombstones(tmp_path):
+    index = BM25Index.open(str(tmp_path / "bm25"), max_segments=2, merge_factor=2)
+    for i in range(3):
+        index.add_documents([str(i)], [f"文档 {i}"])
+    index.add_documents(["0"], ["文档 0 新版本"])
+
+    assert index.ids() == {"0", "1", "2"}
+    assert index.num_docs == 3
+    assert all(key[0] in {seg.name for seg in index.segments} for key in index.deleted)
+
+
+def _concurrent_add(path, worker):
+    index = BM25Index.open(path, max_segments=2, merge_factor=2)
+    for i in range(5):
+        index.add_documents([f"w{worker}-{i}"], [f"进程 {worker} 文档 {i}"])
+
+
+def _concurrent_build(path, counter):
+    index = BM25Index.open(path)
+    if index.add_if_empty(lambda: (["a", "b"], ["锂电池", "储能"], None)):
+        with counter.get_lock():
+            counter.value += 1
+
+
+def test_concurrent_processes_share_one_index(tmp_path):
+    ctx = multiprocessing.get_context("fork")
+    path = str(tmp_path / "bm25")
+    procs = [ctx.Process(target=_concurrent_add, args=(path, w)) for w in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    assert [p.exitcode for p in procs] == [0] * 4
+
+    index = BM25Index.open(path)
+    assert index.ids() == {f"w{w}-{i}" for w in range(4) for i in range(5)}
+    assert not [name for name in os.listdir(path) if name.endswith(".tmp")]
+
+
+def test_first_build_happens_once(tmp_path):
+    ctx = multiprocessing.get_context("fork")
+    path = str(tmp_path / "bm25")
+    counter = ctx.Value("i", 0)
+    procs = [ctx.Process(target=_concurrent_build, args=(path, counter)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    assert [p.exitcode for p in procs] == [0] * 4
+    assert counter.value == 1
+    assert BM25Index.open(path).num_docs == 2
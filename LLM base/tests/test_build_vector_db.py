@@ -0,0 +1,49 @@
+import pytest
+
+from rag.build_vector_db import IngestManifest, build_multi_representation_indexes
+from rag.ingest_pipeline import chunk_id_prefix
+
+
+def _write_pdfs(pdf_dir, files):
+    pdf_dir.mkdir()
+    for name, content in files.items():
+        (pdf_dir / name).write_bytes(content)
+
+
+def test_legacy_stores_without_manifest_require_rebuild(tmp_path):
+    _write_pdfs(tmp_path / "pdfs", {"a.pdf": b"%PDF a"})
+    root = tmp_path / "db"
+    (root / "bge-base-zh-v1.5").mkdir(parents=True)
+
+    with pytest.raises(SystemExit) as exc:
+        build_multi_representation_indexes(str(tmp_path / "pdfs"), str(root))
+    assert "--rebuild" in str(exc.value.code)
+    assert not (root / "ingest_manifest.json").exists()
+
+
+def test_identical_files_get_distinct_chunk_ids(tmp_path):
+    _write_pdfs(tmp_path / "pdfs", {"a.pdf": b"%PDF same", "b.pdf": b"%PDF same"})
+    manifest = IngestManifest(str(tmp_path / "db"))
+    to_ingest, _ = manifest.plan(str(tmp_path / "pdfs"))
+
+    assert to_ingest["a.pdf"] == to_ingest["b.pdf"]
+    for fname, sha in to_ingest.items():
+        manifest.files[fname] = {"sha256": sha, "id_prefix": chunk_id_prefix(fname, sha),
+                                 "status": "done", "num_chunks": 2}
+    assert not set(manifest.chunk_ids("a.pdf")) & set(manifest.chunk_ids("b.pdf"))
+
+
+def test_legacy_manifest_entries(tmp_path):
+    _write_pdfs(tmp_path / "pdfs", {"done.pdf": b"%PDF done", "partial.pdf": b"%PDF partial"})
+    manifest = IngestManifest(str(tmp_path / "db"))
+    current, _ = manifest.plan(str(tmp_path / "pdfs"))
+    manifest.files = {
+        "done.pdf": {"sha256": current["done.pdf"], "status": "done", "num_chunks": 2},
+        "partial.pdf": {"sha256": current["partial.pdf"], "status": "partial", "num_chunks": 3, "batches_done": 1},
+    }
+
+    to_ingest, to_remove = manifest.plan(str(tmp_path / "pdfs"))
+    # 旧版 id 的 partial 记录无法续跑：删除已写入的 chunk 后重新入库；done 记录保持不动
+    assert to_remove == ["partial.pdf"]
+    assert list(to_ingest) == ["partial.pdf"]
+    assert manifest.chunk_ids("done.pdf") == [f"{current['done.pdf'][:16]}:{i}" for i in range(2)]
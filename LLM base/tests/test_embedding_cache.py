@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from rag.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class _Inner:
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 0.5] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_vectors_are_stored_as_read_only_float32():
+    cache = EmbeddingCache(max_entries=2)
+    vecs = cache.get_many("m", ["a", "bb", "a"], lambda texts: [[1.0, 2.0] for _ in texts])
+    assert all(v.dtype == np.float32 for v in vecs)
+    assert vecs[0] is vecs[2]
+    with pytest.raises(ValueError):
+        vecs[0][0] = 3.0
+    assert cache.stats()["resident_bytes"] == 2 * 2 * 4
+
+    cache.get("m", "ccc", lambda texts: [[1.0, 2.0]])  # 淘汰最早的 "a"
+    assert cache.stats()["size"] == 2 and cache.stats()["resident_bytes"] == 2 * 2 * 4
+
+
+def test_cached_embeddings_return_lists_and_encode_misses_once():
+    inner = _Inner()
+    embeddings = CachedEmbeddings(inner, "m", cache=EmbeddingCache())
+    assert embeddings.embed_query("ab") == [2.0, 0.5]
+    assert embeddings.embed_documents(["ab", "abc", "abc"]) == [[2.0, 0.5], [3.0, 0.5], [3.0, 0.5]]
+    assert inner.calls == [["ab"], ["abc"]]
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from openai import AsyncOpenAI  # noqa: E402
+
+from agent.ib_agent import IBAgent  # noqa: E402
+from agent.llm_limiter import InflightLimiter  # noqa: E402
+
+# 流式返回两个并行 tool_call：id/name 在首包，arguments 分多片到达，两个调用的分片交错
+_STREAM_DELTAS = [
+    {"role": "assistant", "content": "查"},
+    {"content": "询"},
+    {"tool_calls": [{"index": 0, "id": "call_a", "type": "function",
+                     "function": {"name": "get_patent_analysis", "arguments": ""}}]},
+    {"tool_calls": [{"index": 0, "function": {"arguments": "{\"patent_no\": "}}]},
+    {"tool_calls": [{"index": 1, "id": "call_b", "type": "function",
+                     "function": {"name": "get_enterprise_interest", "arguments": "{\"patent_no\""}}]},
+    {"tool_calls": [{"index": 0, "function": {"arguments": "\"CN1\"}"}}]},
+    {"tool_calls": [{"index": 1, "function": {"arguments": ": \"CN1\"}"}}]},
+]
+
+
+class _StubLLM(BaseHTTPRequestHandler):
+    """本地替身 OpenAI 兼容接口：记录并发峰值，每次请求停留 0.1s"""
+    lock = threading.Lock()
+    active = 0
+    peak = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with _StubLLM.lock:
+            _StubLLM.active += 1
+            _StubLLM.peak = max(_StubLLM.peak, _StubLLM.active)
+        try:
+            time.sleep(0.1)
+            if body.get("stream"):
+                self._stream()
+            else:
+                self._json({"id": "c", "object": "chat.completion", "created": 0, "model": body["model"],
+                            "choices": [{"index": 0, "finish_reason": "stop",
+                                         "message": {"role": "assistant", "content": "你好"}}]})
+        finally:
+            with _StubLLM.lock:
+                _StubLLM.active -= 1
+
+    def _json(self, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for delta in _STREAM_DELTAS:
+            chunk = {"id": "c", "object": "chat.completion.chunk", "created": 0, "model": "m",
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def llm_url():
+    _StubLLM.active = _StubLLM.peak = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubLLM)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+def _agent(llm_url, limit):
+    # 只测 LLM 调用路径：不连接 MCP、不初始化路由
+    agent = IBAgent.__new__(IBAgent)
+    agent.llm = AsyncOpenAI(base_url=llm_url, api_key="test")
+    agent._llm_slots = InflightLimiter(limit)
+    return agent
+
+
+def test_completions_respect_inflight_limit(llm_url):
+    agent = _agent(llm_url, limit=2)
+
+    async def main():
+        return await asyncio.gather(*(
+            agent._complete_text(None, "cot", model="qwen", messages=[{"role": "user", "content": str(i)}])
+            for i in range(6)
+        ))
+
+    assert asyncio.run(main()) == ["你好"] * 6
+    assert _StubLLM.peak == 2
+
+
+def test_streamed_tool_call_deltas_are_accumulated(llm_url):
+    agent = _agent(llm_url, limit=2)
+    events = []
+
+    async def emit(event):
+        events.append(event)
+
+    content, tool_calls = asyncio.run(
+        agent._complete_message(emit, "react", model="qwen", messages=[{"role": "user", "content": "q"}])
+    )
+    assert content == "查询"
+    assert [e["content"] for e in events] == ["查", "询"]
+    assert tool_calls == [
+        {"id": "call_a", "type": "function",
+         "function": {"name": "get_patent_analysis", "arguments": "{\"patent_no\": \"CN1\"}"}},
+        {"id": "call_b", "type": "function",
+         "function": {"name": "get_enterprise_interest", "arguments": "{\"patent_no\": \"CN1\"}"}},
+    ]
+    assert all(json.loads(call["function"]["arguments"]) == {"patent_no": "CN1"} for call in tool_calls)
@@ -0,0 +1,69 @@
+import pytest
+
+pytest.importorskip("pypdf")
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter  # noqa: E402
+
+from rag.bm25_index import BM25Index  # noqa: E402
+from rag.build_vector_db import IngestManifest  # noqa: E402
+from rag.ingest_pipeline import IngestPipeline  # noqa: E402
+
+
+def _pdf(text: str) -> bytes:
+    """单页、单行文本的最小合法 PDF"""
+    content = f"BT /F1 18 Tf 20 100 Td ({text}) Tj ET".encode()
+    objs = [b"<< /Type /Catalog /Pages 2 0 R >>", b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 300 144] /Contents 4 0 R "
+            b"/Resources << /Font << /F1 5 0 R >> >> >>",
+            b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream",
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for i, obj in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer << /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref)
+    return bytes(out)
+
+
+class _Embeddings:
+    def embed_documents(self, texts):
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+class _Collection:
+    def __init__(self):
+        self.docs = {}
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.docs.update(zip(ids, documents))
+
+
+class _Store:
+    def __init__(self):
+        self.embeddings = _Embeddings()
+        self._collection = _Collection()
+
+
+def test_unparseable_pdf_is_skipped_and_reported(tmp_path):
+    pdf_dir = tmp_path / "pdfs"
+    pdf_dir.mkdir()
+    (pdf_dir / "good.pdf").write_bytes(_pdf("lithium battery"))
+    (pdf_dir / "broken.pdf").write_bytes(b"not a pdf")
+    manifest = IngestManifest(str(tmp_path / "db"))
+    to_ingest, _ = manifest.plan(str(pdf_dir))
+    store, bm25 = _Store(), BM25Index(None)
+
+    pipeline = IngestPipeline({"m": store}, bm25, manifest, RecursiveCharacterTextSplitter(chunk_size=500),
+                              parse_workers=1)
+    report = pipeline.run(str(pdf_dir), to_ingest)
+
+    assert list(report["failed_files"]) == ["broken.pdf"]
+    assert list(store._collection.docs.values()) == ["lithium battery"]
+    assert bm25.num_docs == 1
+    # 失败文件不进入清单：下次增量运行会重新尝试
+    assert manifest.files["good.pdf"]["status"] == "done"
+    assert "broken.pdf" not in manifest.files
+    assert list(manifest.plan(str(pdf_dir))[0]) == ["broken.pdf"]
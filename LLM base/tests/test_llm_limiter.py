@@ -0,0 +1,52 @@
+import asyncio
+import threading
+
+from agent.llm_limiter import InflightLimiter
+
+
+def _run_on_loops(limiter, n_loops, per_loop, hold=0.02):
+    peak = [0]
+    current = [0]
+    lock = threading.Lock()
+
+    async def job():
+        async with limiter:
+            with lock:
+                current[0] += 1
+                peak[0] = max(peak[0], current[0])
+            await asyncio.sleep(hold)
+            with lock:
+                current[0] -= 1
+
+    async def main():
+        await asyncio.gather(*(job() for _ in range(per_loop)))
+
+    threads = [threading.Thread(target=asyncio.run, args=(main(),)) for _ in range(n_loops)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return peak[0]
+
+
+def test_limit_applies_across_event_loops():
+    limiter = InflightLimiter(3)
+    assert _run_on_loops(limiter, n_loops=4, per_loop=5) == 3
+    assert limiter.stats() == {"limit": 3, "active": 0, "waiting": 0}
+
+
+def test_cancelled_waiter_returns_its_slot():
+    limiter = InflightLimiter(1)
+
+    async def main():
+        await limiter.__aenter__()
+        waiter = asyncio.create_task(limiter.__aenter__())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        await limiter.__aexit__(None, None, None)
+        async with limiter:
+            assert limiter.stats()["active"] == 1
+
+    asyncio.run(main())
+    assert limiter.stats() == {"limit": 1, "active": 0, "waiting": 0}
@@ -0,0 +1,122 @@
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from agent import memory  # noqa: E402
+from agent.session_store import InMemorySessionStore  # noqa: E402
+
+
+class _FakeModel:
+    """按文本哈希生成确定性向量，不加载真实模型"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def encode(self, texts, **kwargs):
+        return np.array([np.random.default_rng(abs(hash(t)) % (1 << 32)).random(8) for t in texts],
+                        dtype=np.float32)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory, "SentenceTransformer", _FakeModel)
+    ms = memory.MemoryStore(persist_dir=str(tmp_path), embedding_model_name=f"fake-{uuid.uuid4().hex}",
+                            session_store=InMemorySessionStore(), write_batch_window=0.01)
+    yield ms
+    ms.close()
+
+
+def test_skipped_recalls_do_not_pile_up(store):
+    store._context_executor = ThreadPoolExecutor(max_workers=2)
+    calls = []
+    release = threading.Event()
+
+    def slow_query(*args, **kwargs):
+        calls.append(1)
+        release.wait(2)
+        return ["召回"]
+
+    store._query_long_term = slow_query
+    for _ in range(5):
+        ctx = store.get_context_for_agent("u", "s", "问题", latency_budget_ms=30)
+        assert ctx["timings"]["recall_skipped"]
+    release.set()
+    store._context_executor.shutdown(wait=True)
+    # 前两次召回占住线程，之后排队的召回在超时后被取消，不会在池中积压
+    assert len(calls) == 2
+
+
+def test_profile_fallback_runs_alongside_recall(store):
+    store.add_long_term("u", "name", "小王")
+    assert store.flush(10)
+    store.sessions.invalidate_profile("u")
+
+    def slow_query(*args, **kwargs):
+        time.sleep(0.2)
+        return ["召回"]
+
+    store._query_long_term = slow_query
+    ctx = store.get_context_for_agent("u", "s", "问题", latency_budget_ms=0)
+    assert ctx["profile"] == ["小王"]
+    assert ctx["relevant_long_term"] == ["召回"]
+    assert store.sessions.get_bundle("s", "u", 10)[2] == ["小王"]
+
+
+class _FlakyCollection:
+    """包装 Chroma collection：前 failures 次 upsert 抛异常"""
+
+    def __init__(self, inner, failures):
+        self.inner = inner
+        self.failures = failures
+        self.upserts = 0
+
+    def upsert(self, **kwargs):
+        self.upserts += 1
+        if self.upserts <= self.failures:
+            raise RuntimeError("chroma unavailable")
+        return self.inner.upsert(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+
+def test_flush_waits_for_batched_writes(store):
+    for i in range(5):
+        store.add_long_term("u", f"k{i}", f"v{i}")
+    store.add_long_term("u", "k0", "v0-new")  # 未落盘前覆盖：只写最新值
+    assert store.flush(10)
+    stats = store.write_stats()
+    assert stats["pending"] == 0 and stats["written"] == 5 and stats["failed"] == 0
+    got = store.collection.get(ids=["u:semantic:k0", "u:semantic:k4"])
+    assert dict(zip(got["ids"], got["documents"])) == {"u:semantic:k0": "v0-new", "u:semantic:k4": "v4"}
+
+
+def test_failed_write_is_retried_then_written(store):
+    store.write_retry_backoff = 0.01
+    store.collection = _FlakyCollection(store.collection, failures=2)
+    store.add_long_term("u", "name", "小王")
+    assert store.flush(10)
+    stats = store.write_stats()
+    assert stats["failed"] == 2 and stats["retried"] == 2 and stats["written"] == 1 and stats["dead_letter"] == 0
+    assert store.collection.get(ids=["u:semantic:name"])["documents"] == ["小王"]
+
+
+def test_write_is_dead_lettered_after_retries(store):
+    store.write_retry_backoff = 0.01
+    store.write_max_retries = 2
+    store.collection = _FlakyCollection(store.collection, failures=100)
+    store.add_long_term("u", "name", "小王")
+    assert store.flush(10)
+    stats = store.write_stats()
+    assert stats["failed"] == 3 and stats["retried"] == 2 and stats["dead_letter"] == 1 and stats["pending"] == 0
+    with open(store.dead_letter_path, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f]
+    assert [(e["id"], e["document"], e["error"]) for e in entries] == [
+        ("u:semantic:name", "小王", "chroma unavailable")]
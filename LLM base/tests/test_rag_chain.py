@@ -0,0 +1,86 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from rag.bm25_index import BM25Index
+from rag.embedding_cache import CachedEmbeddings, EmbeddingCache
+from rag.rag_chain import Chroma, RetrievalEngine, multi_retrieve
+
+_CORPUS = [
+    "锂电池 正极材料 制备方法",
+    "固态电解质 锂离子电池",
+    "储能系统 电池管理",
+    "光伏组件 逆变器 并网",
+    "风力发电机 叶片 结构",
+    "氢燃料电池 质子交换膜",
+]
+
+
+class _SlowStore:
+    def __init__(self, delay, calls):
+        self.delay = delay
+        self.calls = calls
+
+    def similarity_search(self, query, k=5):
+        self.calls.append(threading.current_thread().name)
+        time.sleep(self.delay)
+        return []
+
+
+def test_timed_out_legs_that_never_started_are_cancelled():
+    bm25 = BM25Index.from_texts(["锂电池 电极材料", "储能 系统"])
+    calls = []
+    dbs = {"slow": _SlowStore(0.3, calls), "queued": _SlowStore(0.0, calls)}
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    results, timings = multi_retrieve(dbs, bm25, "锂电池", 2, executor=executor, leg_timeout=0.1)
+    executor.shutdown(wait=True)
+
+    assert timings["bm25"]["status"] == "ok"
+    assert timings["slow"]["status"] == "timeout"
+    assert timings["queued"]["status"] == "timeout"
+    assert len(results) == 1
+    # queued 一路排在 slow 之后、超时前没有空闲线程：被取消而不是稍后再执行
+    assert len(calls) == 1
+
+
+class _CharEmbeddings:
+    """按字符哈希到固定维度的确定性向量，不加载真实模型"""
+
+    def __init__(self, dim, salt):
+        self.dim = dim
+        self.salt = salt
+
+    def embed_documents(self, texts):
+        vectors = []
+        for text in texts:
+            vec = [0.0] * self.dim
+            for ch in text:
+                vec[(ord(ch) * self.salt) % self.dim] += 1.0
+            vectors.append(vec)
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_retrieve_batch_matches_per_query_retrieve():
+    cache = EmbeddingCache()
+    dbs = {}
+    for tag, dim, salt in (("a", 16, 1), ("b", 24, 7)):
+        dbs[tag] = Chroma(collection_name=f"{tag}-{uuid.uuid4().hex}",
+                          embedding_function=CachedEmbeddings(_CharEmbeddings(dim, salt), tag, cache=cache))
+        dbs[tag].add_texts(_CORPUS, metadatas=[{"i": i} for i in range(len(_CORPUS))])
+    engine = RetrievalEngine("http://unused", "x", parallel=True)
+    engine.multi_dbs = dbs
+    engine.bm25 = BM25Index.from_texts(_CORPUS)
+    engine._ready.set()
+
+    queries = ["锂电池 材料", "电池", "光伏 并网", "锂电池 材料"]
+    batch = engine.retrieve_batch(queries, top_k=3, rerank_top_n=4)
+    single = [engine.retrieve(q, top_k=3, rerank_top_n=4) for q in queries]
+    engine.executor.shutdown(wait=True)
+
+    assert [[d.page_content for d in docs] for docs in batch] == [[d.page_content for d in docs] for docs in single]
+    assert batch[0][0].page_content != batch[2][0].page_content
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from agent.router import CHITCHAT, EXEMPLARS, MULTI_STEP, PLAN_TEMPLATES, SINGLE_TOOL, IntentRouter
+
+
+def _char_embed(texts):
+    """字符袋向量：确定性、无需加载模型，相同文本相似度为 1"""
+    vectors = np.zeros((len(texts), 512), dtype=np.float32)
+    for i, text in enumerate(texts):
+        for ch in text.lower():
+            vectors[i, ord(ch) % 512] += 1.0
+    return list(vectors)
+
+
+@pytest.fixture
+def router():
+    return IntentRouter(_char_embed)
+
+
+@pytest.mark.parametrize("route, tool, text", EXEMPLARS)
+def test_exemplars_route_to_their_own_label(router, route, tool, text):
+    decision = router.classify(text)
+    assert (decision.route, decision.tool) == (route, tool)
+    if route == SINGLE_TOOL:
+        assert decision.plan == PLAN_TEMPLATES[tool]
+
+
+def test_multi_step_connectives_skip_the_single_tool_fast_path(router):
+    assert router.classify("查询专利CN112345678A的详情").route == SINGLE_TOOL
+    decision = router.classify("查询专利CN112345678A的详情，然后对比")
+    assert decision.route == MULTI_STEP and decision.tool is None and decision.plan == ""
+
+
+def test_long_or_empty_queries_are_multi_step(router):
+    assert router.classify("").route == MULTI_STEP
+    assert router.classify("你好" * 41).route == MULTI_STEP  # 超过 max_chars
+
+
+def test_low_confidence_falls_back_to_multi_step():
+    router = IntentRouter(_char_embed, threshold=0.99)
+    assert router.classify("你好呀").route == MULTI_STEP
+    assert IntentRouter(_char_embed).classify("你好呀").route == CHITCHAT
+
+
+def test_record_estimates_saved_planning_time(router):
+    assert router.record(router.classify("分析专利的技术价值并推荐企业"), plan_ms=100.0) == 0.0
+    saved = router.record(router.classify("你好"))
+    assert 0 < saved <= 100.0
+    stats = router.stats()
+    assert stats["routes"] == {CHITCHAT: 1, SINGLE_TOOL: 0, MULTI_STEP: 1}
+    assert stats["plan_ms_avg"] == 100.0 and stats["saved_ms_total"] == round(saved, 1)
@@ -0,0 +1,74 @@
+import time
+
+import fakeredis
+import pytest
+
+from agent.session_store import InMemorySessionStore, RedisSessionStore
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request):
+    if request.param == "memory":
+        return InMemorySessionStore(max_turns=8)
+    return RedisSessionStore(fakeredis.FakeRedis(), max_turns=8)
+
+
+def test_drop_turns_until_removes_oldest(store):
+    for i in range(5):
+        store.append_turn("s", "user", f"m{i}")
+        time.sleep(0.001)
+    cutoff = store.get_turns("s")[2].ts
+
+    assert store.drop_turns_until("s", cutoff) == 3
+    assert [t.text for t in store.get_turns("s")] == ["m3", "m4"]
+
+
+def test_redis_drop_retries_on_concurrent_write(monkeypatch):
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeRedis(server=server)
+    store = RedisSessionStore(client, max_turns=8)
+    for i in range(3):
+        store.append_turn("s", "user", f"m{i}")
+        time.sleep(0.001)
+    cutoff = store.get_turns("s")[1].ts
+
+    # 第一次事务执行前插入一条新写入，使 WATCH 失效
+    other = RedisSessionStore(fakeredis.FakeRedis(server=server))
+    original = client.pipeline
+    calls = []
+
+    def pipeline(*args, **kwargs):
+        pipe = original(*args, **kwargs)
+        calls.append(1)
+        if len(calls) == 1:
+            execute = pipe.execute
+
+            def racing_execute(*a, **kw):
+                other.append_turn("s", "user", "late")
+                return execute(*a, **kw)
+            pipe.execute = racing_execute
+        return pipe
+    monkeypatch.setattr(client, "pipeline", pipeline)
+
+    assert store.drop_turns_until("s", cutoff) == 2
+    assert len(calls) == 2  # 第一次事务因 WatchError 放弃，第二次成功
+    assert [t.text for t in store.get_turns("s")] == ["m2", "late"]
+    assert store.stats()["errors"] == 0
+
+
+def test_writes_periodically_sweep_idle_sessions_in_other_shards(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    store = InMemorySessionStore(ttl=10, shards=4, sweep_interval=30)
+    idle = [sid for sid in (f"idle-{i}" for i in range(20)) if store._shard(sid) is not store._shard("active")]
+    for sid in idle:
+        store.append_turn(sid, "user", "hi")
+
+    now[0] += 25
+    store.append_turn("active", "user", "hi")  # 未到清理间隔：其它分片的过期会话仍在
+    assert store.stats()["sessions"] == len(idle) + 1
+
+    now[0] += 6
+    store.append_turn("active", "user", "hi")
+    stats = store.stats()
+    assert stats["sessions"] == 1 and stats["evicted_idle"] == len(idle)
@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+
+from agent import tool_cache
+from agent.tool_cache import ReadThroughCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(tool_cache.time, "time", lambda: now[0])
+    return now
+
+
+def _loader(calls, value, cacheable=True):
+    async def load():
+        calls.append(value)
+        return value, cacheable
+    return load
+
+
+def test_fresh_hit_and_ttl_expiry(clock):
+    cache = ReadThroughCache("t", ttl=10)
+    calls = []
+
+    async def main():
+        assert await cache.get("k", _loader(calls, "v1")) == "v1"
+        clock[0] += 5
+        assert await cache.get("k", _loader(calls, "v2")) == "v1"
+        clock[0] += 6
+        assert await cache.get("k", _loader(calls, "v3")) == "v3"
+
+    asyncio.run(main())
+    assert calls == ["v1", "v3"]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_failed_load_is_not_cached(clock):
+    cache = ReadThroughCache("t", ttl=10)
+    calls = []
+
+    async def main():
+        assert await cache.get("k", _loader(calls, "error", cacheable=False)) == "error"
+        assert await cache.get("k", _loader(calls, "v")) == "v"
+
+    asyncio.run(main())
+    assert calls == ["error", "v"]
+
+
+def test_stale_while_revalidate(clock):
+    cache = ReadThroughCache("t", ttl=10, stale_ttl=20)
+    calls = []
+
+    async def main():
+        await cache.get("k", _loader(calls, "old"))
+        clock[0] += 15
+        # 过期但在 stale 窗口内：立即返回旧值，后台刷新
+        assert await cache.get("k", _loader(calls, "new")) == "old"
+        assert await cache.get("k", _loader(calls, "again")) == "old"  # 刷新中不重复发起
+        while cache._tasks:
+            await asyncio.sleep(0)
+        assert await cache.get("k", _loader(calls, "unused")) == "new"
+
+    asyncio.run(main())
+    assert calls == ["old", "new"]
+    stats = cache.stats()
+    assert stats["stale_hits"] == 2 and stats["refreshes"] == 1 and stats["hits"] == 1
+
+
+def test_lru_eviction(clock):
+    cache = ReadThroughCache("t", ttl=10, max_entries=2)
+    calls = []
+
+    async def main():
+        await cache.get("a", _loader(calls, "a"))
+        await cache.get("b", _loader(calls, "b"))
+        await cache.get("a", _loader(calls, "a2"))  # a 变为最近使用
+        await cache.get("c", _loader(calls, "c"))  # 淘汰 b
+        assert await cache.get("a", _loader(calls, "a3")) == "a"
+        assert await cache.get("b", _loader(calls, "b2")) == "b2"
+
+    asyncio.run(main())
+    assert calls == ["a", "b", "c", "b2"]
+    assert cache.stats()["evictions"] == 2
+
+
+def test_invalidate_key_and_all(clock):
+    cache = ReadThroughCache("t", ttl=10)
+    calls = []
+
+    async def main():
+        await cache.get("a", _loader(calls, "a"))
+        await cache.get("b", _loader(calls, "b"))
+        assert cache.invalidate("a") == 1
+        assert await cache.get("a", _loader(calls, "a2")) == "a2"
+        assert cache.invalidate() == 2
+        assert cache.stats()["size"] == 0
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("key", ["k", None])
+def test_invalidate_fences_in_flight_load(clock, key):
+    cache = ReadThroughCache("t", ttl=10)
+
+    async def main():
+        loading, proceed = asyncio.Event(), asyncio.Event()
+
+        async def slow_load():
+            loading.set()
+            await proceed.wait()
+            return "stale", True
+
+        task = asyncio.create_task(cache.get("k", slow_load))
+        await loading.wait()
+        cache.invalidate(key)  # 加载开始后失效：返回的旧值不能写回
+        proceed.set()
+        assert await task == "stale"
+        assert cache.stats()["size"] == 0
+        assert await cache.get("k", _loader([], "fresh")) == "fresh"
+
+    asyncio.run(main())
+
+
+def test_invalidate_fences_background_refresh(clock):
+    cache = ReadThroughCache("t", ttl=10, stale_ttl=20)
+
+    async def main():
+        await cache.get("k", _loader([], "old"))
+        clock[0] += 15
+        proceed = asyncio.Event()
+
+        async def slow_refresh():
+            await proceed.wait()
+            return "stale", True
+
+        assert await cache.get("k", slow_refresh) == "old"
+        cache.invalidate("k")
+        proceed.set()
+        while cache._tasks:
+            await asyncio.sleep(0)
+        assert cache.stats()["size"] == 0 and cache.stats()["refreshes"] == 0
+
+    asyncio.run(main())
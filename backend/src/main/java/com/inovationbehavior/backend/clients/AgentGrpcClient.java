@@ -2,6 +2,7 @@ package com.inovationbehavior.backend.clients;
 import com.inovationbehavior.backend.Protos.AgentRequest;
 import com.inovationbehavior.backend.Protos.AgentResponse;
 import com.inovationbehavior.backend.Protos.AgentServiceGrpc;
+import com.inovationbehavior.backend.Protos.CacheInvalidateRequest;
 import lombok.extern.slf4j.Slf4j;
 import net.devh.boot.grpc.client.inject.GrpcClient;
 import org.springframework.stereotype.Component;
@@ -41,4 +42,26 @@ public class AgentGrpcClient {
 
         return response.getAnswer();
     }
+
+    /**
+     * 专利或问卷数据变更后，失效 Agent 侧的工具缓存
+     * @param patentNo 专利号，为空则失效全部专利
+     * @param tool 工具名（get_patent_analysis / get_enterprise_interest），为空则全部工具
+     * @return 删除的缓存条目数
+     */
+    public int invalidateToolCache(String patentNo, String tool) {
+        CacheInvalidateRequest.Builder builder = CacheInvalidateRequest.newBuilder();
+        if (patentNo != null) {
+            builder.setPatentNo(patentNo);
+        }
+        if (tool != null) {
+            builder.setTool(tool);
+        }
+        try {
+            return agentStub.invalidateToolCache(builder.build()).getInvalidated();
+        } catch (Exception e) {
+            log.warn("Agent 工具缓存失效调用失败: patentNo={}, tool={}", patentNo, tool, e);
+            return 0;
+        }
+    }
 }
\ No newline at end of file